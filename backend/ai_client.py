@@ -344,19 +344,20 @@ def _enrich_item(item):
             item['vote_average'] = best.get('vote_average')
             item['overview'] = best.get('overview')
 
-            # Fetch watch providers for filtering
+            # Fetch watch providers for filtering (details ride along in the same request)
+            bundle = {}
             try:
-                providers_data = tmdb_client.get_watch_providers(item['media_type'], item['tmdb_id'], region=country)
-                flatrate = providers_data.get('flatrate', [])
+                bundle = tmdb_client.get_title_bundle(item['media_type'], item['tmdb_id'], region=country, parts=("providers", "details"))
+                flatrate = bundle.get('providers', {}).get('flatrate', [])
                 item['providers'] = [p['provider_name'].lower().strip() for p in flatrate]
             except Exception as e:
                 logger.warning(f"Failed to fetch watch providers for {clean_title}: {e}")
                 item['providers'] = []
 
-            # Quality Check: If rating or overview is missing/incomplete, try fetching full details
+            # Quality Check: If rating or overview is missing/incomplete, fill from full details
             if not item['vote_average'] or not item['overview']:
                 try:
-                    full_details = tmdb_client.get_details(item['media_type'], item['tmdb_id'])
+                    full_details = bundle.get('details')
                     if full_details:
                          if full_details.get('vote_average'):
                              item['vote_average'] = full_details.get('vote_average')
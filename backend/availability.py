@@ -0,0 +1,207 @@
+"""
+Shared title availability.
+
+Which providers stream / rent / sell a title in each region lives in the
+`title_availability` table, one row per (title, region, provider, monetization
+type), shared by every user. `title_availability_status` records when a title
+was last fetched (all regions come back in one TMDB call), so a title with no
+providers at all is still "known" and isn't looked up again until it goes stale.
+
+Request paths read availability with a single indexed query for a whole
+watchlist (region_providers) and only go to TMDB for titles nobody has fetched
+recently; 10,000 users with the same show cost one provider lookup. The daily
+provider sync (provider_sync.py) keeps tracked titles fresh.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import models
+import tmdb_cache
+import tmdb_client
+
+MONETIZATION_TYPES = ("flatrate", "free", "ads", "rent", "buy")
+
+# Availability is considered current for as long as the cached TMDB payload would be
+FRESH_FOR = timedelta(hours=tmdb_cache.ENDPOINT_TTL_HOURS["providers"])
+
+CHUNK = 500
+
+
+def _titles(titles) -> list:
+    return list(dict.fromkeys((m, int(i)) for m, i in titles if m and i))
+
+
+def _now():
+    return datetime.utcnow()
+
+
+def _naive(dt):
+    return dt.replace(tzinfo=None) if dt and dt.tzinfo else dt
+
+
+# --- Store ---
+
+def stale_titles(db: Session, titles) -> list:
+    """Titles with no availability fetch within FRESH_FOR."""
+    titles = _titles(titles)
+    cutoff = _now() - FRESH_FOR
+    fresh = set()
+    for i in range(0, len(titles), CHUNK):
+        chunk = titles[i:i + CHUNK]
+        rows = db.query(
+            models.TitleAvailabilityStatus.media_type,
+            models.TitleAvailabilityStatus.tmdb_id,
+            models.TitleAvailabilityStatus.fetched_at,
+        ).filter(
+            models.TitleAvailabilityStatus.tmdb_id.in_([t[1] for t in chunk])
+        ).all()
+        fresh.update((m, i) for m, i, fetched_at in rows if fetched_at and _naive(fetched_at) > cutoff)
+    return [t for t in titles if t not in fresh]
+
+
+def fetched_at(db: Session, titles) -> dict:
+    """{title: when its availability was last fetched} for titles that were ever fetched."""
+    titles = _titles(titles)
+    wanted = set(titles)
+    result = {}
+    for i in range(0, len(titles), CHUNK):
+        rows = db.query(
+            models.TitleAvailabilityStatus.media_type,
+            models.TitleAvailabilityStatus.tmdb_id,
+            models.TitleAvailabilityStatus.fetched_at,
+        ).filter(
+            models.TitleAvailabilityStatus.tmdb_id.in_([t[1] for t in titles[i:i + CHUNK]])
+        ).all()
+        result.update(((m, t), at) for m, t, at in rows if (m, t) in wanted and at)
+    return result
+
+
+def _write(db: Session, media_type: str, tmdb_id: int, results: dict, now):
+    """Replace a title's rows with an all-region TMDB providers payload (no commit)."""
+    db.query(models.TitleAvailability).filter(
+        models.TitleAvailability.tmdb_id == tmdb_id,
+        models.TitleAvailability.media_type == media_type,
+    ).delete(synchronize_session=False)
+
+    for region, payload in (results or {}).items():
+        for monetization in MONETIZATION_TYPES:
+            seen = set()
+            for p in payload.get(monetization) or []:
+                if p.get("provider_id") is None or p["provider_id"] in seen:
+                    continue
+                seen.add(p["provider_id"])
+                db.add(models.TitleAvailability(
+                    tmdb_id=tmdb_id,
+                    media_type=media_type,
+                    region=region,
+                    provider_id=p["provider_id"],
+                    provider_name=p.get("provider_name"),
+                    logo_path=p.get("logo_path"),
+                    display_priority=p.get("display_priority") or 0,
+                    monetization_type=monetization,
+                    fetched_at=now,
+                ))
+
+    status = db.query(models.TitleAvailabilityStatus).filter(
+        models.TitleAvailabilityStatus.media_type == media_type,
+        models.TitleAvailabilityStatus.tmdb_id == tmdb_id,
+    ).first()
+    if not status:
+        status = models.TitleAvailabilityStatus(media_type=media_type, tmdb_id=tmdb_id)
+        db.add(status)
+    status.fetched_at = now
+
+
+def store(db: Session, payloads: dict) -> int:
+    """Persist {(media_type, tmdb_id): all-region providers} payloads. None payloads are skipped."""
+    payloads = {k: v for k, v in payloads.items() if v is not None}
+    if not payloads:
+        return 0
+    now = _now()
+    try:
+        for (media_type, tmdb_id), results in payloads.items():
+            _write(db, media_type, tmdb_id, results, now)
+        db.commit()
+    except IntegrityError:
+        # Another worker wrote some of these titles concurrently - retry one by one, theirs wins on conflict
+        db.rollback()
+        for (media_type, tmdb_id), results in payloads.items():
+            try:
+                _write(db, media_type, tmdb_id, results, now)
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+    return len(payloads)
+
+
+def refresh(db: Session, titles) -> int:
+    """Fetch providers for titles (tmdb_cache first, then TMDB) and rewrite their rows."""
+    titles = _titles(titles)
+    if not titles:
+        return 0
+    return store(db, tmdb_client.get_watch_providers_all_many(titles))
+
+
+def ensure(db: Session, titles) -> int:
+    """Fetch availability only for titles that are missing or stale. Returns how many were fetched."""
+    return refresh(db, stale_titles(db, titles))
+
+
+def touch(db: Session, titles) -> int:
+    """Mark titles as freshly checked without refetching (upstream reported no change)."""
+    titles = _titles(titles)
+    now = _now()
+    touched = 0
+    for i in range(0, len(titles), CHUNK):
+        chunk = titles[i:i + CHUNK]
+        for media_type in {t[0] for t in chunk}:
+            touched += db.query(models.TitleAvailabilityStatus).filter(
+                models.TitleAvailabilityStatus.media_type == media_type,
+                models.TitleAvailabilityStatus.tmdb_id.in_([t[1] for t in chunk if t[0] == media_type]),
+            ).update({"fetched_at": now}, synchronize_session=False)
+    db.commit()
+    return touched
+
+
+def expire(db: Session, titles) -> int:
+    """Mark titles stale so their next lookup refetches (rows are kept until then)."""
+    titles = _titles(titles)
+    expired = 0
+    for i in range(0, len(titles), CHUNK):
+        chunk = titles[i:i + CHUNK]
+        for media_type in {t[0] for t in chunk}:
+            expired += db.query(models.TitleAvailabilityStatus).filter(
+                models.TitleAvailabilityStatus.media_type == media_type,
+                models.TitleAvailabilityStatus.tmdb_id.in_([t[1] for t in chunk if t[0] == media_type]),
+            ).update({"fetched_at": None}, synchronize_session=False)
+    db.commit()
+    return expired
+
+
+def region_providers(db: Session, titles, region: str = "US", fetch_missing: bool = True) -> dict:
+    """
+    Providers per title in one region, in TMDB's shape:
+        {(media_type, tmdb_id): {"flatrate": [{"provider_id", "provider_name", "logo_path"}, ...], "rent": [...], ...}}
+    Titles without availability map to {}. With fetch_missing, stale/unknown titles are fetched first.
+    """
+    titles = _titles(titles)
+    if fetch_missing:
+        ensure(db, titles)
+
+    wanted = set(titles)
+    result = {t: {} for t in titles}
+    for i in range(0, len(titles), CHUNK):
+        rows = db.query(models.TitleAvailability).filter(
+            models.TitleAvailability.tmdb_id.in_([t[1] for t in titles[i:i + CHUNK]]),
+            models.TitleAvailability.region == region,
+        ).order_by(models.TitleAvailability.display_priority).all()
+        for row in rows:
+            key = (row.media_type, row.tmdb_id)
+            if key not in wanted:
+                continue
+            result[key].setdefault(row.monetization_type, []).append({
+                "provider_id": row.provider_id,
+                "provider_name": row.provider_name,
+                "logo_path": row.logo_path,
+            })
+    return result
@@ -0,0 +1,34 @@
+"""
+Storage format of RecommendationCache payloads.
+
+Payloads are JSON compressed with zlib, stored in `payload` together with the
+SCHEMA_VERSION they were written with. Bump SCHEMA_VERSION when the shape of
+cached recommendations changes: rows written with another version read as
+missing (and are recomputed), and the sweeper deletes them.
+
+Rows written before this format keep their plain JSON in `data` and are still
+read until they are rewritten or expire.
+"""
+import json
+import zlib
+
+SCHEMA_VERSION = 1
+LEVEL = 6 # zlib level: recommendation JSON shrinks ~5-8x, decompression is level-independent
+
+
+def encode(data) -> bytes:
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"), LEVEL)
+
+
+def decode(payload, schema_version, data=None):
+    """The cached value, or None if the row is empty, unreadable or from another schema version."""
+    try:
+        if payload is not None:
+            if schema_version != SCHEMA_VERSION:
+                return None
+            return json.loads(zlib.decompress(payload))
+        if data:
+            return json.loads(data) # Legacy plain JSON row
+    except (ValueError, zlib.error):
+        pass
+    return None
@@ -0,0 +1,84 @@
+"""
+Dependency-tracked invalidation for RecommendationCache.
+
+Every user has a version counter per input (table `cache_input_versions`),
+bumped by the crud writes that change it:
+
+    membership     watchlist add / delete
+    status         watchlist status
+    progress       watchlist season / episode
+    ratings        watchlist rating
+    subscriptions  subscription add / update / delete
+    preferences    profile preferences
+    notes          watchlist notes       (no cached artifact reads these two; they
+    availability   watchlist badges       complete the user's version for ETags, etags.py)
+
+Each cached artifact stores the versions of the inputs its category depends on
+(DEPENDS_ON) as of when its computation started, and is stale as soon as one of
+them moves. So a progress update drops the dashboard but keeps AI insights and
+similar content, and a note edit drops nothing.
+
+Region is not a versioned input: every category is keyed by country
+("dashboard_IN"), so a region change reads different entries rather than
+invalidating the old region's ones.
+"""
+from sqlalchemy.exc import IntegrityError
+import models
+
+INPUTS = ("membership", "status", "progress", "ratings", "subscriptions", "preferences", "notes", "availability")
+
+# Category prefix (cache key without the "_{country}" suffix) -> inputs it is computed from
+DEPENDS_ON = {
+    # Watch Now ranking uses status, episode progress and ratings; Unused Subs uses membership
+    "dashboard": ("membership", "status", "progress", "ratings", "subscriptions"),
+    # Seeds are weighted by rating/status; interests move with membership and ratings
+    "similar": ("membership", "status", "ratings", "subscriptions", "preferences"),
+    # History (titles + status), ratings, subs and preferences go into the prompt. Membership is
+    # left out on purpose: the skip tracking compares the old picks against the new watchlist.
+    "unified_insights": ("status", "ratings", "subscriptions", "preferences"),
+}
+
+
+def prefix(category: str) -> str:
+    """Cache key without its region suffix ("dashboard_IN" -> "dashboard")."""
+    return category.rsplit("_", 1)[0] if "_" in category else category
+
+
+def _inputs_for(category: str) -> tuple:
+    return DEPENDS_ON.get(prefix(category), INPUTS) # Unknown categories depend on everything
+
+
+def versions(db, user_id: int) -> dict:
+    """Current {input: version} for a user (inputs never bumped are 0)."""
+    rows = db.query(models.CacheInputVersion.input, models.CacheInputVersion.version).filter(
+        models.CacheInputVersion.user_id == user_id
+    ).all()
+    return {name: version for name, version in rows}
+
+
+def bump(db, user_id: int, *inputs):
+    """Mark inputs as changed, invalidating every cached artifact that depends on them."""
+    for name in inputs:
+        for _ in range(2):
+            updated = db.query(models.CacheInputVersion).filter(
+                models.CacheInputVersion.user_id == user_id,
+                models.CacheInputVersion.input == name,
+            ).update({"version": models.CacheInputVersion.version + 1}, synchronize_session=False)
+            if not updated:
+                db.add(models.CacheInputVersion(user_id=user_id, input=name, version=1))
+            try:
+                db.commit()
+                break
+            except IntegrityError:
+                # Another request created the row first - increment theirs
+                db.rollback()
+
+
+def stamp(category: str, current: dict) -> dict:
+    """The part of a version snapshot a category's artifact is stored with."""
+    return {name: current.get(name, 0) for name in _inputs_for(category)}
+
+
+def changed(category: str, stored: dict, current: dict) -> list:
+    """Inputs of a category that moved since its artifact was stored."""
+    return [name for name in _inputs_for(category) if stored.get(name, 0) != current.get(name, 0)]
@@ -0,0 +1,183 @@
+"""
+Shared candidate pools.
+
+Trending and discover lists depend only on region, the set of providers they
+are filtered to, genre and time window - never on the user. Each distinct list
+is materialized once in the `candidate_pools` table, keyed by
+(kind, media_type, region, provider_set, genre), with the region's watch
+providers already attached to every entry.
+
+Recommendation code reads pools and filters/ranks them in memory; only the
+first user asking for a new key builds it inline. The daily
+`POST /jobs/refresh-pools` rebuilds every pool used in the last KEEP_FOR and
+drops the rest, so nightly cost grows with regions x provider sets in use, not
+with users.
+"""
+import json
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal
+import models
+import tmdb_client
+
+# Rebuilt by the daily job; a pool older than MAX_AGE (job missed) is rebuilt on read
+REFRESH_AFTER = timedelta(hours=20)
+MAX_AGE = timedelta(hours=36)
+
+# Pools nobody read for this long are dropped instead of refreshed
+KEEP_FOR = timedelta(days=7)
+
+# Only bump last_used_at when it is older than this, so reads don't write every time
+USE_TOUCH_INTERVAL = timedelta(hours=1)
+
+# kind -> TMDB list query (media_type, region, provider_set or None, genre or None)
+KINDS = {
+    # This week's trending titles (dashboard trending, /public/trending)
+    "trending_week": lambda media_type, region, provider_set, genre: tmdb_client.get_trending(media_type, "week"),
+    # Popular titles, optionally on a provider set / in a genre (dashboard fallback,
+    # similar-content trending fill, /public/trending genre fallback)
+    "popular": lambda media_type, region, provider_set, genre: tmdb_client.discover_media(
+        media_type, sort_by="popularity.desc", min_vote_count=300, with_genres=genre,
+        with_watch_providers=provider_set, watch_region=region
+    ),
+    # Well rated titles on a provider set in a genre (similar content "Included in your subscription")
+    "top_rated": lambda media_type, region, provider_set, genre: tmdb_client.discover_media(
+        media_type, sort_by="vote_average.desc", min_vote_count=200, min_vote_average=6.0,
+        with_genres=genre, with_watch_providers=provider_set, watch_region=region
+    ),
+    # Highly rated titles in a genre on any provider (similar content explore)
+    "acclaimed": lambda media_type, region, provider_set, genre: tmdb_client.discover_media(
+        media_type, sort_by="vote_average.desc", min_vote_count=500, min_vote_average=7.0,
+        with_genres=genre, watch_region=region
+    ),
+}
+
+
+def _now():
+    return datetime.utcnow()
+
+
+def _naive(dt):
+    return dt.replace(tzinfo=None) if dt and dt.tzinfo else dt
+
+
+def _key(kind, media_type, region, provider_set, genre) -> tuple:
+    return (kind, media_type, (region or "US").upper(), provider_set or "", str(genre) if genre else "")
+
+
+def _query(db, key):
+    kind, media_type, region, provider_set, genre = key
+    return db.query(models.CandidatePool).filter(
+        models.CandidatePool.kind == kind,
+        models.CandidatePool.media_type == media_type,
+        models.CandidatePool.region == region,
+        models.CandidatePool.provider_set == provider_set,
+        models.CandidatePool.genre == genre,
+    )
+
+
+def build(kind, media_type, region, provider_set="", genre="") -> list:
+    """Fetch a pool's list from TMDB and attach the region's providers to every entry (one batch)."""
+    data = KINDS[kind](media_type, region, provider_set or None, genre or None)
+    items = [{**x, "media_type": media_type} for x in data.get("results", []) if x.get("id")]
+    providers = tmdb_client.get_watch_providers_many([(media_type, x["id"]) for x in items], region=region)
+    for x in items:
+        x["providers"] = providers.get((media_type, int(x["id"])), {})
+    return items
+
+
+def _store(key, items):
+    now = _now()
+    kind, media_type, region, provider_set, genre = key
+    db = SessionLocal()
+    try:
+        row = _query(db, key).first()
+        if not row:
+            row = models.CandidatePool(kind=kind, media_type=media_type, region=region, provider_set=provider_set, genre=genre)
+            db.add(row)
+        row.items = json.dumps(items)
+        row.refreshed_at = now
+        row.last_used_at = row.last_used_at or now
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker built the same pool first - overwrite theirs
+            db.rollback()
+            _query(db, key).update({"items": json.dumps(items), "refreshed_at": now})
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"[POOLS] Write failed for {key}: {e}")
+    finally:
+        db.close()
+
+
+def get(kind, media_type, region="US", provider_set=None, genre=None) -> list:
+    """
+    Entries of a pool: TMDB result dicts with "media_type" and the region's "providers"
+    ({"flatrate": [...], ...}) attached. Built inline if missing or older than MAX_AGE.
+    """
+    key = _key(kind, media_type, region, provider_set, genre)
+    now = _now()
+    stale_items = None
+    db = SessionLocal()
+    try:
+        row = _query(db, key).first()
+        if row and row.items is not None:
+            if row.refreshed_at and _naive(row.refreshed_at) > now - MAX_AGE:
+                if not row.last_used_at or _naive(row.last_used_at) < now - USE_TOUCH_INTERVAL:
+                    row.last_used_at = now
+                    db.commit()
+                return json.loads(row.items)
+            stale_items = json.loads(row.items)
+    finally:
+        db.close()
+
+    items = build(*key)
+    if items:
+        _store(key, items)
+        return items
+    # TMDB came back empty (or failed): a stale pool beats nothing
+    return stale_items or []
+
+
+def get_many(kind, media_types, region="US", provider_set=None, genre=None) -> dict:
+    """{media_type: entries} for several media types, fetched concurrently when any need building."""
+    results = tmdb_client.run_parallel(*[
+        (lambda m=m: get(kind, m, region, provider_set, genre)) for m in media_types
+    ])
+    return dict(zip(media_types, results))
+
+
+def refresh_all() -> dict:
+    """Daily job: rebuild pools used within KEEP_FOR that are due, drop the unused ones."""
+    now = _now()
+    db = SessionLocal()
+    try:
+        dropped = db.query(models.CandidatePool).filter(
+            (models.CandidatePool.last_used_at == None) | (models.CandidatePool.last_used_at < now - KEEP_FOR)
+        ).delete(synchronize_session=False)
+        db.commit()
+        due = [
+            _key(r.kind, r.media_type, r.region, r.provider_set, r.genre)
+            for r in db.query(models.CandidatePool).filter(
+                (models.CandidatePool.refreshed_at == None) | (models.CandidatePool.refreshed_at < now - REFRESH_AFTER)
+            ).all()
+            if r.kind in KINDS
+        ]
+    finally:
+        db.close()
+
+    refreshed = 0
+    for key in due:
+        try:
+            items = build(*key)
+        except Exception as e:
+            print(f"[POOLS] Refresh failed for {key}: {e}")
+            continue
+        if items:
+            _store(key, items)
+            refreshed += 1
+    summary = {"refreshed": refreshed, "due": len(due), "dropped": dropped}
+    print(f"[POOLS] Refresh complete: {summary}")
+    return summary
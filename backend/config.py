@@ -40,6 +40,47 @@ class Settings(BaseSettings):
     # Security Key for automated tasks/cron jobs
     CRON_SECURITY_KEY: str = "super_secret_cron_key_default"
 
+    # TMDB response cache (shared table, see tmdb_cache.py)
+    TMDB_CACHE_ENABLED: bool = True
+    TMDB_CACHE_MAX_ENTRIES: int = 50000
+
+    # TMDB HTTP client (see tmdb_async.py)
+    TMDB_MAX_CONCURRENCY: int = 8
+    TMDB_VERIFY_SSL: bool = False # Some deployment environments break cert verification
+    TMDB_RATE_PER_SECOND: float = 40.0 # Client-side pacing (see tmdb_governor.py)
+    TMDB_RATE_BURST: int = 40
+
+    # Provider sync from the TMDB changes feed (see provider_sync.py)
+    PROVIDER_SYNC_SNAPSHOT_PATH: str = "data/tmdb_changes.json" # Replayed when TMDB is unreachable
+
+    # /recommendations/similar: return what's ready after this long, finish the rest in the background
+    SIMILAR_DEADLINE_SECONDS: float = 4.0
+
+    # Requests waiting on another request's computation of the same recommendations give up after this
+    SINGLE_FLIGHT_WAIT_SECONDS: float = 30.0
+
+    # Recommendation refreshes triggered by mutations (see refresh_scheduler.py)
+    REFRESH_DEBOUNCE_SECONDS: float = 5.0 # Collapse repeated requests per user within this window
+    REFRESH_MAX_DELAY_SECONDS: float = 30.0 # ...but never postpone a refresh longer than this
+
+    # Recommendation cache (RecommendationCache): hours an entry is fresh, per category prefix
+    # (dashboard, similar, unified_insights). Past that, dashboard/similar are served stale while a
+    # background refresh runs, until they are CACHE_MAX_STALE_HOURS old (then the request recomputes).
+    CACHE_TTL_HOURS: dict = {"dashboard": 24, "similar": 24, "unified_insights": 24}
+    CACHE_DEFAULT_TTL_HOURS: float = 24
+    CACHE_MAX_STALE_HOURS: float = 72
+
+    # Responses at least this many bytes are gzip-compressed (when the client accepts it)
+    GZIP_MINIMUM_SIZE: int = 1024
+
+    # Durable job queue (see job_queue.py / worker.py)
+    JOB_WORKER_IN_PROCESS: bool = True # API runs worker threads itself; turn off when running worker.py (the Procfile does)
+    # TMDB_RATE_PER_SECOND is per process. With dedicated workers, they share this much of it (split
+    # evenly across WORKER_PROCESSES) and the API paces at the rest, so the combined rate stays put.
+    WORKER_TMDB_RATE_PER_SECOND: float = 10.0
+    WORKER_CONCURRENCY: int = 2 # In-process worker threads (jobs running at once inside the API)
+    WORKER_PROCESSES: int = 1 # Default process count for `python worker.py`
+
 
 
     @field_validator("FRONTEND_URL")
@@ -0,0 +1,445 @@
+"""
+Materialized subscription coverage (GET /subscriptions/coverage).
+
+Two stored layers, so a read no longer rescans the watchlist:
+
+  - coverage_items: per watchlist item, what is costly to derive per title -
+    content type, estimated hours, its flatrate providers in the user's region
+    (shared availability table, else the legacy available_on badge) and the
+    display fields of orphaned titles.
+  - coverage_models: the full response per (user, region), stored with a
+    digest of itself (the coverage ETag).
+
+Both carry a `dirty` counter that the writes coverage depends on bump as they
+flush (the Session listener at the bottom): watchlist membership, status,
+badge and legacy metadata; subscriptions; catalog fields and availability
+refreshes of the user's titles. Notes, ratings and progress don't touch it.
+A read is one indexed row while the model is clean and was built against the
+current service catalog. Otherwise only the dirty item rows are recomputed,
+and the response is rebuilt from the item rows, the user's subscriptions and
+the catalog. A rebuild subtracts the count it saw, so a write landing during
+it leaves the row dirty.
+
+Processes that write these inputs must import this module (main.py,
+worker.py and the provider / metadata scripts do) so the listener is
+registered.
+"""
+import hashlib
+import json
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import event, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import models
+import availability
+import cache_codec
+import provider_index
+import service_catalog
+import title_catalog
+
+CONTENT_TYPES = ("movie", "tv", "anime", "other")
+
+# --- Hour Estimation ---
+AVG_EPISODE_DURATION = {"movie": 120, "tv": 42, "anime": 22, "other": 42}
+DEFAULT_SERIES_EPISODES = {"tv": 40, "anime": 26, "other": 20}
+
+INR_PER_USD = 83.0 # Cost penalty is computed in USD
+
+
+def classify(item) -> str:
+    genre_ids = item.genre_ids or ""
+    is_animation = "16" in genre_ids
+    is_japanese = item.original_language == "ja"
+    if item.media_type == "movie":
+        return "movie"
+    elif is_japanese and is_animation:
+        return "anime"
+    elif item.media_type == "tv":
+        return "tv"
+    else:
+        return "other"
+
+
+def estimate_hours(item, content_type: str) -> float:
+    if content_type == "movie":
+        return round(AVG_EPISODE_DURATION["movie"] / 60, 1)
+    eps = item.total_episodes or 0
+    seasons = item.total_seasons or 0
+    if eps > 0:
+        episode_count = eps
+    elif seasons > 0:
+        episode_count = seasons * 12
+    else:
+        episode_count = DEFAULT_SERIES_EPISODES.get(content_type, 20)
+    return round((episode_count * AVG_EPISODE_DURATION[content_type]) / 60, 1)
+
+
+def monthly_cost(sub) -> float:
+    cost = sub.cost or 0.0
+    if sub.billing_cycle and sub.billing_cycle.lower() == "yearly":
+        return round(cost / 12, 2)
+    return cost
+
+
+def _empty_breakdown() -> dict:
+    return {ct: {"count": 0, "est_hours": 0.0} for ct in CONTENT_TYPES}
+
+
+# --- Item layer ---
+
+def _details(item) -> dict:
+    """What an orphaned title shows, besides its coverage entry."""
+    return {
+        "tmdb_id": item.tmdb_id,
+        "title": item.title,
+        "media_type": item.media_type,
+        "poster_path": item.poster_path,
+        "vote_average": item.vote_average,
+        "overview": item.overview,
+        "status": item.status,
+        "original_language": item.original_language,
+        "genre_ids": item.genre_ids,
+    }
+
+
+def sync_items(db, user_id: int, region: str, reconcile: bool) -> dict:
+    """
+    {item_id: {"type", "hours", "providers", "details"}} for the user's watchlist, in item order,
+    recomputing only dirty rows. reconcile: also compare the rows against the watchlist (first
+    build in a region), for items that never had a row.
+    """
+    rows = {r.item_id: r for r in db.query(models.CoverageItem).filter(models.CoverageItem.user_id == user_id)}
+    due_ids = {item_id for item_id, row in rows.items() if row.dirty or row.region != region or row.details is None}
+    gone = []
+    if reconcile:
+        item_ids = {i for (i,) in db.query(models.WatchlistItem.id).filter(models.WatchlistItem.user_id == user_id)}
+        gone = [row for item_id, row in rows.items() if item_id not in item_ids]
+        missing = item_ids - set(rows)
+        if missing:
+            # Rows still left under an item id that was freed and reused
+            gone += db.query(models.CoverageItem).filter(models.CoverageItem.item_id.in_(list(missing))).all()
+        due_ids = (due_ids - {row.item_id for row in gone}) | missing
+
+    due = db.query(models.WatchlistItem).filter(
+        models.WatchlistItem.user_id == user_id,
+        models.WatchlistItem.id.in_(list(due_ids)),
+    ).all() if due_ids else []
+    found = {item.id for item in due}
+    gone += [rows[item_id] for item_id in due_ids - found if item_id in rows]
+    for row in gone:
+        rows.pop(row.item_id, None)
+        db.delete(row)
+
+    entries = {
+        item_id: {
+            "type": row.content_type, "hours": row.est_hours,
+            "providers": json.loads(row.providers or "[]"), "details": json.loads(row.details),
+        }
+        for item_id, row in rows.items() if item_id not in found
+    }
+    if due:
+        now = datetime.utcnow()
+        # One indexed query for the due titles. Items nobody has fetched yet fall back to their
+        # legacy available_on badge.
+        providers_by_title = availability.region_providers(
+            db, [(item.media_type, item.tmdb_id) for item in due], region=region, fetch_missing=False
+        )
+        for item in due:
+            flatrate = [
+                {"provider_id": p["provider_id"], "provider_name": p["provider_name"]}
+                for p in providers_by_title.get((item.media_type, item.tmdb_id), {}).get("flatrate", [])
+            ]
+            if not flatrate and item.available_on:
+                flatrate = [{"provider_name": s.strip()} for s in item.available_on.split(",") if s.strip()]
+            ct = classify(item)
+            entries[item.id] = {"type": ct, "hours": estimate_hours(item, ct), "providers": flatrate, "details": _details(item)}
+
+            row = rows.get(item.id)
+            if row is None:
+                row = models.CoverageItem(user_id=user_id, item_id=item.id, dirty=0)
+                db.add(row)
+            else:
+                row.dirty = models.CoverageItem.dirty - row.dirty # Writes since we read it stay counted
+            row.media_type = item.media_type
+            row.tmdb_id = item.tmdb_id
+            row.region = region
+            row.content_type = ct
+            row.est_hours = entries[item.id]["hours"]
+            row.providers = json.dumps(flatrate)
+            row.details = json.dumps(entries[item.id]["details"])
+            row.updated_at = now
+        print(f"[COVERAGE] User {user_id}: {len(due)} item rows recomputed, {len(gone)} dropped")
+    return dict(sorted(entries.items()))
+
+
+# --- Model layer ---
+
+def build(db, entries: dict, subs: list, country: str, catalog) -> dict:
+    """The coverage response from materialized item entries, subscriptions and the service catalog."""
+    total_watchlist = len(entries)
+
+    # Which subscriptions cover each item, resolved once per item
+    matcher = provider_index.matcher_for(db, subs, country)
+    covering_subs = {item_id: {s.id for s in matcher.covering(entry["providers"])} for item_id, entry in entries.items()}
+
+    def cost_penalty(cost: float) -> float:
+        cost_usd = cost / INR_PER_USD if country == "IN" else cost
+        return min(cost_usd * 1.5, 20.0)
+
+    # --- Per-Service Coverage Breakdown ---
+    services_data = []
+    for sub in subs:
+        sub_monthly = monthly_cost(sub)
+        breakdown = _empty_breakdown()
+        for item_id, entry in entries.items():
+            if sub.id in covering_subs[item_id]:
+                breakdown[entry["type"]]["count"] += 1
+                breakdown[entry["type"]]["est_hours"] = round(breakdown[entry["type"]]["est_hours"] + entry["hours"], 1)
+
+        total_covered = sum(v["count"] for v in breakdown.values())
+        total_hours = round(sum(v["est_hours"] for v in breakdown.values()), 1)
+        coverage_pct = round((total_covered / total_watchlist * 100) if total_watchlist > 0 else 0)
+        type_count = sum(1 for v in breakdown.values() if v["count"] > 0)
+
+        # Value Score: hours-primary, coverage secondary, capped at 100
+        # Hours are the real measure of entertainment value — cap at 300h
+        hour_score = min((total_hours / 300) * 55, 55)
+        # Coverage % is secondary — max 25 pts (100% coverage = 25 pts)
+        title_score = min(coverage_pct * 0.25, 25)
+        # Variety bonus for services spanning multiple content types
+        variety_bonus = 20 if type_count >= 2 else 0
+        raw_utility = hour_score + title_score + variety_bonus  # max = 100
+
+        services_data.append({
+            "name": sub.service_name,
+            "cost": sub.cost or 0.0,
+            "billing_cycle": sub.billing_cycle,
+            "logo_url": catalog.logo(sub.service_name, country),
+            "coverage_pct": coverage_pct,
+            "value_score": round(max(10, raw_utility - cost_penalty(sub_monthly))),
+            "type_count": type_count,
+            "breakdown": breakdown,
+            "total_covered": total_covered,
+            "total_hours": total_hours,
+            "cost_per_title": round(sub_monthly / total_covered, 2) if total_covered > 0 else None,
+            "cost_per_hour": round(sub_monthly / total_hours, 2) if total_hours > 0 else None,
+        })
+
+    # Sort by value_score descending
+    services_data.sort(key=lambda s: s["value_score"], reverse=True)
+
+    # --- Orphaned Titles (no known provider or no matching subscription) ---
+    orphaned = []
+    for item_id, entry in entries.items():
+        if not covering_subs[item_id]:
+            details = entry["details"]
+            # If the title streams on a service the user doesn't have, surface it as a suggestion
+            suggested_service = entry["providers"][0]["provider_name"] if entry["providers"] else None
+            orphaned.append({
+                "tmdb_id": details["tmdb_id"],
+                "dbId": item_id,
+                "title": details["title"],
+                "media_type": details["media_type"],
+                "poster_path": details["poster_path"],
+                "vote_average": details["vote_average"],
+                "overview": details["overview"],
+                "status": details["status"],
+                "est_hours": entry["hours"],
+                "content_type": entry["type"],
+                "suggested_service": suggested_service,
+                "original_language": details["original_language"],
+                "genre_ids": details["genre_ids"],
+            })
+
+    # --- Suggested Services (unsubscribed services covering watchlist items) ---
+    # service_name -> { count, hours, titles, types, breakdown }
+    suggested_map = defaultdict(lambda: {
+        "count": 0, "hours": 0.0, "titles": [], "types": set(), "breakdown": _empty_breakdown(),
+    })
+    for entry in entries.values():
+        for provider in entry["providers"]:
+            if matcher.subs_for(provider):
+                continue
+            info = suggested_map[provider["provider_name"]]
+            info["count"] += 1
+            info["hours"] = round(info["hours"] + entry["hours"], 1)
+            info["types"].add(entry["type"])
+            info["breakdown"][entry["type"]]["count"] += 1
+            info["breakdown"][entry["type"]]["est_hours"] = round(info["breakdown"][entry["type"]]["est_hours"] + entry["hours"], 1)
+            if entry["details"]["title"] not in info["titles"]:
+                info["titles"].append(entry["details"]["title"])
+
+    # Logos and cheapest plan for suggested services (catalog snapshot)
+    suggested_services = []
+    for svc_name, info in sorted(suggested_map.items(), key=lambda x: -x[1]["count"]):
+        if info["count"] < 1:
+            continue
+        logo_url = None
+        cheapest_plan = None
+        service_record = catalog.service(svc_name, country, any_region=True) # Prefer exact country match
+        if service_record:
+            logo_url = service_record.logo_url
+            # Cheapest monthly-equivalent plan in user's country (falls back to any country)
+            best = catalog.cheapest_plan(service_record, country)
+            if best:
+                cheapest_plan = {
+                    "cost": best.cost,
+                    "currency": best.currency,
+                    "billing_cycle": best.billing_cycle,
+                }
+
+        # Projected value score using same formula as active subscriptions
+        s_coverage_pct = round((info["count"] / total_watchlist * 100) if total_watchlist > 0 else 0)
+        s_total_hours = info["hours"]
+        s_raw_utility = (
+            min((s_total_hours / 300) * 55, 55)
+            + min(s_coverage_pct * 0.25, 25)
+            + (20 if len(info["types"]) >= 2 else 0)
+        )
+        s_monthly_cost = 0.0
+        if cheapest_plan:
+            s_monthly_cost = (cheapest_plan["cost"] / 12
+                              if cheapest_plan["billing_cycle"] and cheapest_plan["billing_cycle"].lower() == "yearly"
+                              else cheapest_plan["cost"])
+
+        suggested_services.append({
+            "name": svc_name,
+            "logo_url": logo_url,
+            "count": info["count"],
+            "est_hours": info["hours"],
+            "coverage_pct": s_coverage_pct,
+            "breakdown": info["breakdown"],
+            "titles": info["titles"][:5],
+            "cheapest_plan": cheapest_plan,
+            "value_score": round(max(10, s_raw_utility - cost_penalty(s_monthly_cost))),
+            "cost_per_title": round(s_monthly_cost / info["count"], 2) if info["count"] > 0 and s_monthly_cost > 0 else None,
+            "cost_per_hour": round(s_monthly_cost / s_total_hours, 2) if s_total_hours > 0 and s_monthly_cost > 0 else None,
+        })
+
+    # --- Summary ---
+    covered = [item_id for item_id in entries if covering_subs[item_id]]
+    total_covered = len(covered)
+    overall_pct = round((total_covered / total_watchlist * 100) if total_watchlist > 0 else 0)
+
+    return {
+        "services": services_data,
+        "orphaned_items": orphaned,
+        "suggested_services": suggested_services,
+        "summary": {
+            "total_monthly_cost": round(sum(monthly_cost(s) for s in subs), 2),
+            "total_covered": total_covered,
+            "total_watchlist": total_watchlist,
+            "overall_coverage_pct": overall_pct,
+            "total_covered_hours": round(sum(entries[item_id]["hours"] for item_id in covered), 1),
+            "most_valuable_service": services_data[0]["name"] if services_data else None,
+            "least_used_service": min(services_data, key=lambda s: s["total_covered"])["name"] if services_data else None,
+        }
+    }
+
+
+def get(db, user: models.User) -> tuple:
+    """
+    (stamp, response) for the user's coverage: the stored model while nothing it depends on was
+    written, else rebuilt from the item rows and stored.
+    """
+    region = user.country or "US"
+    catalog = service_catalog.get(db)
+    model = db.query(models.CoverageModel).filter(
+        models.CoverageModel.user_id == user.id,
+        models.CoverageModel.region == region,
+    ).first()
+    if model and not model.dirty and model.catalog_version == catalog.version:
+        data = cache_codec.decode(model.payload, model.schema_version)
+        if data is not None:
+            return model.stamp, data
+
+    entries = sync_items(db, user.id, region, reconcile=model is None)
+    subs = db.query(models.Subscription).filter(
+        models.Subscription.user_id == user.id,
+        models.Subscription.is_active == True,
+        models.Subscription.category == "OTT",
+        models.Subscription.country == region,
+    ).order_by(models.Subscription.id).all()
+    data = build(db, entries, subs, region, catalog)
+
+    payload = cache_codec.encode(data)
+    stamp = hashlib.sha1(payload).hexdigest()[:20]
+    if model is None:
+        model = models.CoverageModel(user_id=user.id, region=region, dirty=0)
+        db.add(model)
+    else:
+        model.dirty = models.CoverageModel.dirty - model.dirty # Writes since we read it stay counted
+    model.stamp = stamp
+    model.payload = payload
+    model.schema_version = cache_codec.SCHEMA_VERSION
+    model.catalog_version = catalog.version
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback() # A concurrent request stored its model / rows first; ours are rebuilt next time
+    return stamp, data
+
+
+# --- Invalidation ---
+
+# WatchlistItem columns coverage reads (title key, orphan status, badge fallback, legacy metadata)
+ITEM_FIELDS = ("tmdb_id", "media_type", "status", "available_on") + tuple(f"legacy_{f}" for f in title_catalog.CATALOG_FIELDS)
+
+
+def _changed(obj, fields) -> bool:
+    attrs = inspect(obj).attrs
+    return any(attrs[f].history.has_changes() for f in fields)
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_coverage_inputs(session, flush_context):
+    items, coverage = models.CoverageItem.__table__, models.CoverageModel.__table__
+    users, added, removed, changed, titles = set(), [], set(), set(), set()
+    for obj in session.new:
+        if isinstance(obj, models.WatchlistItem):
+            added.append(obj)
+        elif isinstance(obj, models.Subscription):
+            users.add(obj.user_id)
+        elif isinstance(obj, (models.Title, models.TitleAvailabilityStatus)):
+            titles.add((obj.media_type, obj.tmdb_id))
+    for obj in session.dirty:
+        if isinstance(obj, models.WatchlistItem) and _changed(obj, ITEM_FIELDS):
+            changed.add(obj.id)
+            users.add(obj.user_id)
+        elif isinstance(obj, models.Subscription) and session.is_modified(obj):
+            users.add(obj.user_id)
+        elif isinstance(obj, models.Title) and _changed(obj, title_catalog.CATALOG_FIELDS):
+            titles.add((obj.media_type, obj.tmdb_id))
+        elif isinstance(obj, models.TitleAvailabilityStatus) and _changed(obj, ("fetched_at",)):
+            titles.add((obj.media_type, obj.tmdb_id))
+    for obj in session.deleted:
+        if isinstance(obj, models.WatchlistItem):
+            removed.add(obj.id)
+            users.add(obj.user_id)
+        elif isinstance(obj, models.Subscription):
+            users.add(obj.user_id)
+    if not (users or added or removed or changed or titles):
+        return
+
+    conn = session.connection()
+    # New items get a dirty placeholder (replacing any row left under a reused id)
+    removed |= {item.id for item in added}
+    if removed:
+        conn.execute(items.delete().where(items.c.item_id.in_(removed)))
+    if added:
+        conn.execute(items.insert(), [
+            {"user_id": item.user_id, "item_id": item.id, "media_type": item.media_type, "tmdb_id": item.tmdb_id, "dirty": 1}
+            for item in added
+        ])
+        users |= {item.user_id for item in added}
+    if changed:
+        conn.execute(items.update().where(items.c.item_id.in_(changed)).values(dirty=items.c.dirty + 1))
+    for media_type in {m for m, _ in titles}:
+        same_title = (items.c.media_type == media_type) & items.c.tmdb_id.in_([t for m, t in titles if m == media_type])
+        conn.execute(items.update().where(same_title).values(dirty=items.c.dirty + 1))
+        conn.execute(coverage.update().where(
+            coverage.c.user_id.in_(select(items.c.user_id).where(same_title))
+        ).values(dirty=coverage.c.dirty + 1))
+    if users:
+        conn.execute(coverage.update().where(coverage.c.user_id.in_(users)).values(dirty=coverage.c.dirty + 1))
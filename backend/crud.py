@@ -1,6 +1,6 @@
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
-import models, schemas, security, tmdb_client
+import models, schemas, security, tmdb_client, availability, title_catalog, provider_index, cache_deps, service_catalog
 import json
 
 def get_user(db: Session, user_id: int):
@@ -43,6 +43,7 @@ def create_user_subscription(db: Session, subscription: schemas.SubscriptionCrea
     db.add(db_subscription)
     db.commit()
     db.refresh(db_subscription)
+    cache_deps.bump(db, user_id, "subscriptions")
     return db_subscription
 
 def delete_subscription(db: Session, subscription_id: int, user_id: int):
@@ -50,6 +51,7 @@ def delete_subscription(db: Session, subscription_id: int, user_id: int):
     if db_sub:
         db.delete(db_sub)
         db.commit()
+        cache_deps.bump(db, user_id, "subscriptions")
     return db_sub
 
 def update_subscription(db: Session, subscription_id: int, subscription: schemas.SubscriptionUpdate, user_id: int):
@@ -59,11 +61,41 @@ def update_subscription(db: Session, subscription_id: int, subscription: schemas
             setattr(db_sub, var, value)
         db.commit()
         db.refresh(db_sub)
+        cache_deps.bump(db, user_id, "subscriptions")
     return db_sub
 
 def get_watchlist(db: Session, user_id: int, skip: int = 0, limit: int = 100):
     return db.query(models.WatchlistItem).filter(models.WatchlistItem.user_id == user_id).offset(skip).limit(limit).all()
 
+_WATCHLIST_COLUMNS = ("id", "user_id", "tmdb_id", "media_type", "status", "user_rating", "available_on",
+                      "notes", "current_season", "current_episode", "added_at")
+_CATALOG_COLUMNS = ("title", "poster_path", "vote_average", "overview", "genre_ids", "original_language",
+                    "total_seasons", "total_episodes")
+
+def get_watchlist_rows(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> list:
+    """
+    The watchlist as plain dicts shaped like schemas.WatchlistItem, from one column-selected
+    query (no ORM objects, no per-row validation). Same catalog/legacy fallback as the
+    WatchlistItem properties.
+    """
+    item, title = models.WatchlistItem, models.Title
+    columns = [getattr(item, name) for name in _WATCHLIST_COLUMNS]
+    columns += [getattr(title, name) for name in _CATALOG_COLUMNS]
+    columns += [getattr(item, "legacy_" + name) for name in _CATALOG_COLUMNS]
+    rows = db.query(*columns).outerjoin(
+        title, (title.media_type == item.media_type) & (title.tmdb_id == item.tmdb_id)
+    ).filter(item.user_id == user_id).order_by(item.id).offset(skip).limit(limit).all()
+
+    n_own, n_catalog = len(_WATCHLIST_COLUMNS), len(_CATALOG_COLUMNS)
+    result = []
+    for row in rows:
+        entry = dict(zip(_WATCHLIST_COLUMNS, row[:n_own]))
+        for i, name in enumerate(_CATALOG_COLUMNS):
+            value, legacy = row[n_own + i], row[n_own + n_catalog + i]
+            entry[name] = value if value else (legacy or value)
+        result.append(entry)
+    return result
+
 import json
 
 def update_interests(db: Session, user_id: int, genre_ids: list, delta: int):
@@ -97,68 +129,54 @@ def create_watchlist_item(db: Session, item: schemas.WatchlistItemCreate, user_i
 
     # Prepare data
     item_data = item.dict()
-    genre_ids_list = item_data.pop('genre_ids', [])
     
-    # ROBUSTNESS CHECK: If any key fields are missing, fetch from TMDB
-    needs_fetch = False
-    if not genre_ids_list: needs_fetch = True
-    if not item_data.get('overview'): needs_fetch = True
-    if not item_data.get('poster_path'): needs_fetch = True
+    # Metadata lives once per title in the shared catalog; the client's payload only fills gaps
+    entry = title_catalog.get_or_create(db, item.media_type, item.tmdb_id, seed=item_data)
+    needs_fetch = title_catalog.needs_refresh(entry)
     
-    # We prioritize fetching if data is thin (e.g. from minimal search results)
-    if needs_fetch:
-        print(f"[create_watchlist_item] Missing metadata for {item.tmdb_id}, enriching from TMDB...")
+    # Resolve country up front so details + providers come back in one TMDB round-trip
+    user = get_user(db, user_id)
+    country = user.country if user and user.country else "US" # Default to US if missing
+    title = (item.media_type, item.tmdb_id)
+    bundle_parts = []
+    if needs_fetch: bundle_parts.append("details")
+    if not item_data.get('available_on') and availability.stale_titles(db, [title]):
+        # Rides along with details; lands in tmdb_cache, so the availability fetch below is a cache hit
+        bundle_parts.append("providers")
+    bundle = {}
+    if bundle_parts:
         try:
-            details = tmdb_client.get_details(item.media_type, item.tmdb_id)
-            if details:
-                # Enrich fields if missing in payload
-                if not item_data.get('title'): item_data['title'] = details.get('title') or details.get('name')
-                if not item_data.get('overview'): item_data['overview'] = details.get('overview') or ""
-                if not item_data.get('poster_path'): item_data['poster_path'] = details.get('poster_path')
-                if not item_data.get('vote_average'): item_data['vote_average'] = details.get('vote_average')
-                if not item_data.get('vote_average'): item_data['vote_average'] = details.get('vote_average')
-                
-                # Fetch Genres if missing
-                if not genre_ids_list and details.get('genres'):
-                    genre_ids_list = [g['id'] for g in details['genres']]
-                
-                # Grab original_language for anime detection
-                if not item_data.get('original_language') and details.get('original_language'):
-                    item_data['original_language'] = details['original_language']
+            bundle = tmdb_client.get_title_bundle(item.media_type, item.tmdb_id, region=country, parts=bundle_parts)
+        except Exception as e:
+            print(f"[create_watchlist_item] TMDB bundle fetch failed: {e}")
 
-                # Populate total seasons/episodes for TV
-                if item_data["media_type"] == "tv":
-                    item_data["total_seasons"] = details.get("number_of_seasons", 0)
-                    item_data["total_episodes"] = details.get("number_of_episodes", 0)
+    # Enrich the catalog entry once per title (not once per user that saves it)
+    if needs_fetch and bundle.get("details"):
+        print(f"[create_watchlist_item] Enriching catalog entry for {item.media_type}/{item.tmdb_id} from TMDB...")
+        try:
+            title_catalog.apply_details(entry, bundle["details"])
+            db.commit()
         except Exception as e:
+            db.rollback()
             print(f"[create_watchlist_item] Enrichment failed: {e}")
     # Auto-Detect Streaming Availability (Strict Mode: Only matches User Subscriptions)
     # MOVED OUTSIDE: Runs even if frontend provided basic metadata
     if not item_data.get('available_on'):
         try:
-            # 1. Get User's Country & Subscriptions
-            user = get_user(db, user_id)
-            country = user.country if user and user.country else "US" # Default to US if missing
+            # 1. Get User's Subscriptions
             user_subs = get_user_subscriptions(db, user_id)
-            active_services = {sub.service_name.lower() for sub in user_subs}
+            matcher = provider_index.matcher_for(db, user_subs, country)
             
-            # 2. Fetch Providers from TMDB
-            providers = tmdb_client.get_watch_providers(item.media_type, item.tmdb_id, region=country)
+            # 2. Providers from the shared availability table (fetched once per title, not per user)
+            providers = availability.region_providers(db, [title], region=country)[(item.media_type, int(item.tmdb_id))]
             flatrate = providers.get("flatrate", [])
             
             # 3. Find Intersection (Provider must be in User's Active Subs)
             matched_provider = None
             for p in flatrate:
-                p_name = p.get("provider_name", "")
-                # Normalize for flexible matching (e.g., "Disney+ Hotstar" vs "Hotstar")
-                p_lower = p_name.lower()
-                
-                # Check strict match or containment
-                for sub_name in active_services:
-                    if sub_name in p_lower or p_lower in sub_name:
-                        matched_provider = p_name
-                        break
-                if matched_provider:
+                # Provider ids resolved per region (covers "Disney+ Hotstar" vs "Hotstar" style names)
+                if matcher.subs_for(p):
+                    matched_provider = p.get("provider_name", "")
                     break
             
             if matched_provider:
@@ -167,13 +185,15 @@ def create_watchlist_item(db: Session, item: schemas.WatchlistItemCreate, user_i
         except Exception as e:
             print(f"[create_watchlist_item] Provider fetch failed: {e}")
 
-    # Store genres as JSON string
-    genre_ids_str = json.dumps(genre_ids_list) if genre_ids_list else None
-    
-    db_item = models.WatchlistItem(**item_data, genre_ids=genre_ids_str, user_id=user_id)
+    # The watchlist row keeps only per-user state
+    user_data = {k: v for k, v in item_data.items() if k not in title_catalog.CATALOG_FIELDS and k != 'genre_ids'}
+    db_item = models.WatchlistItem(**user_data, user_id=user_id)
     db.add(db_item)
     db.commit()
     db.refresh(db_item)
+    cache_deps.bump(db, user_id, "membership")
+    
+    genre_ids_list = json.loads(entry.genre_ids) if entry and entry.genre_ids else []
     
     # Update User Interests (+1 for adding)
     if genre_ids_list:
@@ -194,6 +214,7 @@ def delete_watchlist_item(db: Session, item_id: int, user_id: int):
                 
         db.delete(db_item)
         db.commit()
+        cache_deps.bump(db, user_id, "membership")
     return db_item
 
 def update_watchlist_item_rating(db: Session, item_id: int, user_id: int, rating: int):
@@ -231,19 +252,16 @@ def update_watchlist_item_rating(db: Session, item_id: int, user_id: int, rating
         db_item.user_rating = rating
         db.commit()
         db.refresh(db_item)
+        cache_deps.bump(db, user_id, "ratings")
         
     return db_item
 
 def get_services(db: Session, country: str = "US"):
-    return db.query(models.Service).filter(
-        models.Service.country == country
-    ).all()
+    # Served from the catalog snapshot (plans attached), see service_catalog.py
+    return service_catalog.get(db).services(country)
 
 def get_plans(db: Session, service_id: int, country: str = "US"):
-    return db.query(models.Plan).filter(
-        models.Plan.service_id == service_id,
-        models.Plan.country == country
-    ).all()
+    return service_catalog.get(db).plans(service_id, country)
 
 def update_watchlist_item_progress(db: Session, item_id: int, user_id: int, current_season: int, current_episode: int):
     db_item = db.query(models.WatchlistItem).filter(
@@ -255,6 +273,7 @@ def update_watchlist_item_progress(db: Session, item_id: int, user_id: int, curr
         db_item.current_episode = current_episode
         db.commit()
         db.refresh(db_item)
+        cache_deps.bump(db, user_id, "progress")
     return db_item
 
 def update_user_profile(db: Session, user_id: int, country: str):
@@ -275,6 +294,7 @@ def update_user_preferences(db: Session, user_id: int, preferences: schemas.User
             user.preferences = preferences.json()
         db.commit()
         db.refresh(user)
+        cache_deps.bump(db, user_id, "preferences")
     return user
 
 def update_watchlist_item_status(db: Session, item_id: int, user_id: int, status: str):
@@ -286,6 +306,7 @@ def update_watchlist_item_status(db: Session, item_id: int, user_id: int, status
         db_item.status = status
         db.commit()
         db.refresh(db_item)
+        cache_deps.bump(db, user_id, "status")
     return db_item
 
 def update_watchlist_item_notes(db: Session, item_id: int, user_id: int, notes: str | None):
@@ -297,6 +318,7 @@ def update_watchlist_item_notes(db: Session, item_id: int, user_id: int, notes:
         db_item.notes = notes
         db.commit()
         db.refresh(db_item)
+        cache_deps.bump(db, user_id, "notes")
     return db_item
 
 def update_user_ai_usage(db: Session, user_id: int):
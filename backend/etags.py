@@ -0,0 +1,64 @@
+"""
+Conditional GETs (ETag / If-None-Match) for endpoints the frontend polls.
+
+Tags are derived from what the response is built from rather than the
+serialized body:
+
+  - recommendations: the cache entry served or, for a freshly computed result,
+    the entry it was just stored as (its write time and input stamp); only
+    results that weren't cached are tagged by their content
+  - watchlist: the user's input versions (cache_deps.py) plus the shared
+    rows it reads (catalog titles, provider availability)
+  - coverage: the digest of the stored model (coverage_model.py), which is
+    rebuilt after the writes it depends on
+
+A request whose If-None-Match matches gets an empty 304. Responses carry
+`Cache-Control: private, no-cache`, so browsers store them and revalidate on
+every request.
+"""
+import hashlib
+from fastapi import Request, Response
+from sqlalchemy import func, and_
+import models
+import cache_deps
+
+CACHE_CONTROL = "private, no-cache"
+
+
+def tag(*parts) -> str:
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def not_modified(request: Request, response: Response, etag: str):
+    """Set the ETag on response; return a 304 response if the client already has this version."""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    header = request.headers.get("if-none-match")
+    if header and (header.strip() == "*" or etag in [t.strip() for t in header.split(",")]):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+    return None
+
+
+def _titles_version(db, user_id: int) -> tuple:
+    """Watchlist size plus the newest catalog / availability refresh among the user's titles."""
+    same_title = lambda model: and_(
+        model.media_type == models.WatchlistItem.media_type, model.tmdb_id == models.WatchlistItem.tmdb_id
+    )
+    return tuple(db.query(
+        func.count(models.WatchlistItem.id),
+        func.max(models.WatchlistItem.id),
+        func.max(models.Title.refreshed_at),
+        func.max(models.Title.seasons_refreshed_at),
+        func.max(models.TitleAvailabilityStatus.fetched_at),
+    ).select_from(models.WatchlistItem).outerjoin(
+        models.Title, same_title(models.Title)
+    ).outerjoin(
+        models.TitleAvailabilityStatus, same_title(models.TitleAvailabilityStatus)
+    ).filter(models.WatchlistItem.user_id == user_id).one())
+
+
+def watchlist_tag(db, user_id: int, *extra) -> str:
+    versions = sorted(cache_deps.versions(db, user_id).items())
+    return tag("watchlist", user_id, versions, _titles_version(db, user_id), *extra)
+
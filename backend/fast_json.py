@@ -0,0 +1,51 @@
+"""
+Fast JSON responses for large payloads (watchlist, coverage, recommendations).
+
+FastAPI's default path runs every return value through `jsonable_encoder` (and,
+with a response_model, Pydantic validation per row) before `json.dumps`. For a
+1,000-item watchlist that is most of the request's CPU. Endpoints that opt in
+return `render(content, response)` instead: the content (plain dicts/lists
+built from column-selected rows) goes straight to orjson, or to the stdlib
+encoder when orjson isn't installed.
+
+Compression of large bodies is separate (GZipMiddleware in main.py).
+"""
+import json
+from datetime import date, datetime
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse that skips jsonable_encoder; content must be dicts/lists/scalars/datetimes."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def render(content, response: Response = None, status_code: int = 200) -> FastJSONResponse:
+    """
+    Return content as a FastJSONResponse. Headers already set on the endpoint's injected
+    `response` (ETag, X-Cache-Stale) are carried over, since FastAPI drops them when an
+    endpoint returns a Response itself.
+    """
+    headers = dict(response.headers) if response is not None else None
+    return FastJSONResponse(content, status_code=status_code, headers=headers)
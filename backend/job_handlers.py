@@ -0,0 +1,63 @@
+"""
+Handlers for durable jobs (job_queue.py), one per job kind.
+
+Each handler takes the job's payload dict, opens its own session and raises on
+failure so the job is retried. TMDB calls run in the BACKGROUND lane.
+"""
+from datetime import date
+from database import SessionLocal
+import job_queue
+import tmdb_client
+
+
+@job_queue.handler("refresh_recommendations")
+def refresh_recommendations(payload: dict):
+    import recommendations
+    db = SessionLocal()
+    try:
+        recommendations.refresh_recommendations(
+            db, payload["user_id"], force=payload.get("force", True), category=payload.get("category")
+        )
+    finally:
+        db.close()
+
+
+@job_queue.handler("sync_providers")
+def sync_providers(payload: dict):
+    import provider_sync
+    db = SessionLocal()
+    try:
+        provider_sync.sync_provider_changes(db, offline=payload.get("offline", False))
+    finally:
+        db.close()
+
+
+@job_queue.handler("refresh_titles")
+def refresh_titles(payload: dict):
+    import title_catalog
+    import tv_seasons
+    db = SessionLocal()
+    try:
+        with tmdb_client.priority(tmdb_client.BACKGROUND):
+            updated = title_catalog.enrich(db, title_catalog.stale_entries(db))
+            seasons = tv_seasons.refresh(db, tv_seasons.due_entries(db))
+        print(f"[JOBS] Title catalog refresh updated {updated} titles, {seasons} season structures")
+    finally:
+        db.close()
+
+
+@job_queue.handler("refresh_pools")
+def refresh_pools(payload: dict):
+    import candidate_pools
+    with tmdb_client.priority(tmdb_client.BACKGROUND):
+        candidate_pools.refresh_all()
+
+
+@job_queue.handler("renewal_digest")
+def renewal_digest(payload: dict):
+    from routers import notifications
+    db = SessionLocal()
+    try:
+        notifications.send_renewal_digest(db, payload["user_id"], date.fromisoformat(payload["date"]))
+    finally:
+        db.close()
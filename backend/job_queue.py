@@ -0,0 +1,232 @@
+"""
+Durable background jobs.
+
+Jobs live in the `jobs` table (SQLite or Postgres), so they survive restarts and
+deploys and can be run by any number of worker processes (worker.py) separately
+from the API. A job is:
+
+  - claimed with a lease: a conditional UPDATE moves it from queued (or from
+    running with an expired lease, i.e. its worker died) to running, so two
+    workers never run it at once. Long jobs extend their lease while running.
+  - retried with exponential backoff until max_attempts, then marked failed.
+  - ordered by priority (lower first), then run_after.
+  - optionally deduplicated by dedupe_key: enqueueing a key that already has a
+    queued job updates that job instead (debounced via delay/max_delay).
+
+Handlers are registered per kind with @handler("kind") in job_handlers.py.
+"""
+import json
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal
+import models
+
+# Priorities (lower runs first)
+HIGH = 0      # User-triggered work (recommendation refreshes)
+NORMAL = 5    # Per-user notifications
+LOW = 9       # Scheduled maintenance (provider sync, catalog and pool refreshes)
+
+LEASE = timedelta(minutes=5)
+RETRY_BASE = timedelta(seconds=30) # Backoff: 30s, 60s, 120s, ...
+KEEP_FINISHED = timedelta(days=7)
+
+HANDLERS = {}
+
+# Set on enqueue so an in-process worker picks the job up without waiting for its next poll
+wakeup = threading.Event()
+
+
+def handler(kind: str):
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def _now():
+    return datetime.utcnow()
+
+
+def _naive(dt):
+    return dt.replace(tzinfo=None) if dt and dt.tzinfo else dt
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+
+
+# --- Producer side ---
+
+def enqueue(kind: str, payload: dict = None, priority: int = NORMAL, dedupe_key: str = None,
+            delay: float = 0, max_delay: float = None, max_attempts: int = 3, merge=None, once: bool = False):
+    """
+    Queue a job. With dedupe_key, an already queued job for the key is updated instead:
+    its run_after moves to now + delay (but no later than max_delay after it was first
+    queued), priority keeps the more urgent value and payload becomes merge(old, new)
+    (default: the new payload). With once, nothing is queued if any job for the key
+    exists that hasn't failed (e.g. one digest per user per day). Returns the job id.
+    """
+    now = _now()
+    payload = payload or {}
+    db = SessionLocal()
+    try:
+        if once and dedupe_key:
+            done = db.query(models.Job.id).filter(
+                models.Job.dedupe_key == dedupe_key, models.Job.status != "failed"
+            ).first()
+            if done:
+                return done[0]
+        for _ in range(2):
+            existing = None
+            if dedupe_key:
+                existing = db.query(models.Job).filter(
+                    models.Job.dedupe_key == dedupe_key,
+                    models.Job.status == "queued",
+                ).first()
+            if existing:
+                run_after = now + timedelta(seconds=delay)
+                if max_delay is not None and existing.created_at:
+                    run_after = min(run_after, _naive(existing.created_at) + timedelta(seconds=max_delay))
+                existing.run_after = max(run_after, now)
+                existing.priority = min(existing.priority, priority)
+                old = json.loads(existing.payload or "{}")
+                existing.payload = json.dumps(merge(old, payload) if merge else payload)
+                db.commit()
+                return existing.id
+            job = models.Job(
+                kind=kind,
+                payload=json.dumps(payload),
+                dedupe_key=dedupe_key,
+                priority=priority,
+                status="queued",
+                max_attempts=max_attempts,
+                run_after=now + timedelta(seconds=delay),
+                created_at=now,
+            )
+            db.add(job)
+            try:
+                db.commit()
+                return job.id
+            except IntegrityError:
+                # Another process queued the same key first - update theirs
+                db.rollback()
+        return None
+    finally:
+        db.close()
+        wakeup.set()
+
+
+def active(dedupe_key: str) -> set:
+    """Statuses ('queued' / 'running') of unfinished jobs for a dedupe key."""
+    db = SessionLocal()
+    try:
+        rows = db.query(models.Job.status).filter(
+            models.Job.dedupe_key == dedupe_key,
+            models.Job.status.in_(["queued", "running"]),
+        ).all()
+        return {r[0] for r in rows}
+    finally:
+        db.close()
+
+
+def stats() -> dict:
+    """Job counts per status, plus how many queued jobs are already due."""
+    from sqlalchemy import func
+    db = SessionLocal()
+    try:
+        counts = dict(db.query(models.Job.status, func.count(models.Job.id)).group_by(models.Job.status).all())
+        counts["due"] = db.query(models.Job).filter(
+            models.Job.status == "queued", models.Job.run_after <= _now()
+        ).count()
+        return counts
+    finally:
+        db.close()
+
+
+# --- Worker side ---
+
+def _claimable(now):
+    return ((models.Job.status == "queued") & (models.Job.run_after <= now)) | \
+           ((models.Job.status == "running") & (models.Job.leased_until < now))
+
+
+def claim(owner: str):
+    """Lease the next due job for owner. Returns (id, kind, payload, attempts, max_attempts) or None."""
+    now = _now()
+    db = SessionLocal()
+    try:
+        candidates = db.query(models.Job.id).filter(_claimable(now)).order_by(
+            models.Job.priority, models.Job.run_after, models.Job.id
+        ).limit(10).all()
+        for (job_id,) in candidates:
+            claimed = db.query(models.Job).filter(models.Job.id == job_id, _claimable(now)).update({
+                "status": "running",
+                "leased_by": owner,
+                "leased_until": now + LEASE,
+                "attempts": models.Job.attempts + 1,
+            }, synchronize_session=False)
+            db.commit()
+            if claimed:
+                job = db.query(models.Job).filter(models.Job.id == job_id).first()
+                return job.id, job.kind, json.loads(job.payload or "{}"), job.attempts, job.max_attempts
+        return None
+    finally:
+        db.close()
+
+
+def extend(job_id: int, owner: str):
+    """Push a running job's lease out (heartbeat)."""
+    db = SessionLocal()
+    try:
+        db.query(models.Job).filter(models.Job.id == job_id, models.Job.leased_by == owner).update(
+            {"leased_until": _now() + LEASE}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def finish(job_id: int, owner: str, error: str = None, attempts: int = 1, max_attempts: int = 3):
+    """Mark a job done, or on error requeue it with backoff (failed after max_attempts)."""
+    now = _now()
+    if error is None:
+        values = {"status": "done", "finished_at": now, "leased_until": None, "last_error": None}
+    elif attempts < max_attempts:
+        values = {"status": "queued", "run_after": now + RETRY_BASE * (2 ** (attempts - 1)),
+                  "leased_until": None, "last_error": error[:2000]}
+    else:
+        values = {"status": "failed", "finished_at": now, "leased_until": None, "last_error": error[:2000]}
+    db = SessionLocal()
+    try:
+        try:
+            db.query(models.Job).filter(models.Job.id == job_id, models.Job.leased_by == owner).update(
+                values, synchronize_session=False
+            )
+            db.commit()
+        except IntegrityError:
+            # Requeueing collides with a newer queued job for the same key - that one covers it
+            db.rollback()
+            db.query(models.Job).filter(models.Job.id == job_id).update(
+                {"status": "done", "finished_at": now, "leased_until": None, "last_error": error[:2000]},
+                synchronize_session=False
+            )
+            db.commit()
+    finally:
+        db.close()
+
+
+def purge() -> int:
+    """Delete finished jobs older than KEEP_FINISHED."""
+    db = SessionLocal()
+    try:
+        deleted = db.query(models.Job).filter(
+            models.Job.status.in_(["done", "failed"]),
+            models.Job.finished_at < _now() - KEEP_FINISHED,
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    finally:
+        db.close()
@@ -1,9 +1,9 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Response
 from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
 from datetime import datetime, timedelta
 import models, schemas, crud, security, dependencies
 from database import SessionLocal, engine
@@ -24,9 +24,10 @@ app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 # Include Routers
-from routers import auth, notifications
+from routers import auth, notifications, jobs
 app.include_router(auth.router)
 app.include_router(notifications.router)
+app.include_router(jobs.router)
 
 # [NEW] Logging Middleware
 @app.middleware("http")
@@ -95,7 +96,7 @@ class SubscriptionAdmin(ModelView, model=Subscription):
     icon = "fa-solid fa-credit-card"
 
 class WatchlistAdmin(ModelView, model=WatchlistItem):
-    column_list = [WatchlistItem.title, WatchlistItem.media_type, WatchlistItem.user_id]
+    column_list = [WatchlistItem.tmdb_id, WatchlistItem.media_type, WatchlistItem.user_id, WatchlistItem.status]
     icon = "fa-solid fa-tv"
 
 admin = Admin(app, engine, authentication_backend=authentication_backend)
@@ -143,8 +144,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Cache-Stale"],
 )
 
+# Outermost: compresses watchlist / coverage / recommendation bodies, leaves small ones alone
+app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MINIMUM_SIZE)
+
 # Dependency
 def get_db():
     db = SessionLocal()
@@ -162,9 +167,12 @@ def health_check(db: Session = Depends(get_db)):
         logger.error(f"Health check DB error: {e}")
         db_status = "unhealthy"
         
+    import tmdb_client
     return {
         "status": "ok" if db_status == "healthy" else "degraded",
         "database": db_status,
+        "tmdb": tmdb_client.get_client_stats(), # governor queue depth per lane, throttling
+        "jobs": job_queue.stats(), # durable background jobs per status
         "environment": getattr(settings, "ENVIRONMENT", "development"),
         "timestamp": datetime.utcnow().isoformat()
     }
@@ -175,6 +183,14 @@ def health_check(db: Session = Depends(get_db)):
 # ─────────────────────────────────────────────
 
 import tmdb_client as tmdb_client_module
+import candidate_pools
+import refresh_scheduler
+import job_queue
+import etags
+import fast_json
+import user_context
+import service_catalog
+import coverage_model
 
 GENRE_MAP = {
     "action": "28",
@@ -195,7 +211,7 @@ def _format_providers(providers_raw: dict) -> list:
     ]
 
 @app.get("/public/trending")
-def public_trending(region: str = "US", genre: str = None):
+def public_trending(region: str = "US", genre: str = None, db: Session = Depends(get_db)):
     """
     Returns top trending movies and TV shows for the landing page.
     - "All" tab: uses TMDB /trending/week (genuinely trending this week)
@@ -206,12 +222,14 @@ def public_trending(region: str = "US", genre: str = None):
     from datetime import datetime
 
     region = region.upper() if region else "US"
+    # Unauthenticated: only regions we carry services for, so callers can't mint new candidate pools
+    if not service_catalog.get(db).services(region):
+        region = "US"
     genre_lower = genre.lower() if genre else ""
     genre_id = GENRE_MAP.get(genre_lower) if genre_lower else None
 
-    def _build_item(item, media_type):
+    def _build_item(item, media_type, providers_raw):
         tmdb_id = item.get("id")
-        providers_raw = tmdb_client_module.get_watch_providers(media_type, tmdb_id, region=region)
         return {
             "id": tmdb_id,
             "media_type": media_type,
@@ -226,14 +244,16 @@ def public_trending(region: str = "US", genre: str = None):
             "providers": _format_providers(providers_raw),
         }
 
-    results = []
+    # Collect (item, media_type) candidates first. Pool entries (candidate_pools.py) carry their
+    # region's providers; the rest are fetched in one concurrent batch at the end.
+    candidates = []
 
     if not genre_lower:
-        # "All" tab: genuinely trending this week via TMDB /trending endpoint
+        # "All" tab: genuinely trending this week (shared regional pool)
+        trending = candidate_pools.get_many("trending_week", ["movie", "tv"], region=region)
         for media_type in ["movie", "tv"]:
-            data = tmdb_client_module.get_trending(media_type, "week")
-            for item in data.get("results", [])[:8]:
-                results.append(_build_item(item, media_type))
+            for item in trending[media_type][:8]:
+                candidates.append((item, media_type))
 
     elif genre_lower == "anime":
         # Anime: only Japanese animation from the current airing season
@@ -253,7 +273,7 @@ def public_trending(region: str = "US", genre: str = None):
             extra_params={"first_air_date.gte": season_start_str},
         )
         for item in tv_data.get("results", [])[:10]:
-            results.append(_build_item(item, "tv"))
+            candidates.append((item, "tv"))
 
         # Recent anime movies (last 12 months)
         year_ago = datetime(now.year - 1, now.month, 1).strftime("%Y-%m-%d")
@@ -267,34 +287,34 @@ def public_trending(region: str = "US", genre: str = None):
             extra_params={"primary_release_date.gte": year_ago},
         )
         for item in movie_data.get("results", [])[:6]:
-            results.append(_build_item(item, "movie"))
+            candidates.append((item, "movie"))
 
     else:
         # Other genre tabs: fetch this week's trending, then filter by genre
         # This gives genuinely trending results rather than all-time popular
+        trending = candidate_pools.get_many("trending_week", ["movie", "tv"], region=region)
         for media_type in ["movie", "tv"]:
-            trending_data = tmdb_client_module.get_trending(media_type, "week")
-            for item in trending_data.get("results", []):
+            for item in trending[media_type]:
                 if genre_id and genre_id not in [str(g) for g in item.get("genre_ids", [])]:
                     continue
-                results.append(_build_item(item, media_type))
-                if len(results) >= 16:
+                candidates.append((item, media_type))
+                if len(candidates) >= 16:
                     break
 
         # Fallback: if trending yielded too few for this genre, supplement with discover
-        if len(results) < 6:
+        if len(candidates) < 6:
+            popular = candidate_pools.get_many("popular", ["movie", "tv"], region=region, genre=genre_id)
             for media_type in ["movie", "tv"]:
-                data = tmdb_client_module.discover_media(
-                    media_type,
-                    sort_by="popularity.desc",
-                    min_vote_count=300,
-                    with_genres=genre_id,
-                    watch_region=region,
-                )
-                for item in data.get("results", [])[:8]:
-                    if not any(r["id"] == item.get("id") for r in results):
-                        results.append(_build_item(item, media_type))
-
+                for item in popular[media_type][:8]:
+                    if not any(c[0].get("id") == item.get("id") for c in candidates):
+                        candidates.append((item, media_type))
+
+    missing = [(media_type, item.get("id")) for item, media_type in candidates if "providers" not in item]
+    providers_map = tmdb_client_module.get_watch_providers_many(missing, region=region) if missing else {}
+    results = [
+        _build_item(item, media_type, item.get("providers", providers_map.get((media_type, item.get("id")), {})))
+        for item, media_type in candidates
+    ]
 
     results.sort(key=lambda x: x.get("vote_average") or 0, reverse=True)
     return results[:16]
@@ -316,12 +336,17 @@ def public_search(q: str, region: str = "US"):
 
     # Scan all 20 raw results so that people entries (who have no media_type 'movie'/'tv')
     # don't push popular shows like Daredevil off the visible list
-    for item in raw.get("results", [])[:20]:
+    items = [
+        item for item in raw.get("results", [])[:20]
+        if item.get("media_type") in ["movie", "tv"]
+    ]
+    providers_map = tmdb_client_module.get_watch_providers_many(
+        [(item["media_type"], item.get("id")) for item in items], region=region
+    )
+    for item in items:
         media_type = item.get("media_type")
-        if media_type not in ["movie", "tv"]:
-            continue
         tmdb_id = item.get("id")
-        providers_raw = tmdb_client_module.get_watch_providers(media_type, tmdb_id, region=region)
+        providers_raw = providers_map.get((media_type, tmdb_id), {})
         results.append({
             "id": tmdb_id,
             "media_type": media_type,
@@ -401,6 +426,16 @@ async def startup_event():
     except Exception as e:
         logger.error(f"❌ Schema Migration Failed: {e}")
 
+    # Durable background jobs: run worker threads here unless dedicated workers (worker.py) do it
+    if settings.JOB_WORKER_IN_PROCESS:
+        import worker
+        worker.start_in_process(settings.WORKER_CONCURRENCY)
+        logger.info(f"🧵 In-process job worker started ({settings.WORKER_CONCURRENCY} threads)")
+    else:
+        # Dedicated workers pace at their own share of the TMDB budget; the API keeps the rest
+        import tmdb_async
+        tmdb_async.set_rate_share(settings.TMDB_RATE_PER_SECOND - settings.WORKER_TMDB_RATE_PER_SECOND)
+
 @app.post("/users/", response_model=schemas.User)
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     logger.info(f"👉 Signup Request for: {user.email}") # [MODIFIED]
@@ -412,7 +447,7 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     return crud.create_user(db=db, user=user)
 
 @app.post("/token")
-async def login_for_access_token(background_tasks: BackgroundTasks, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = crud.get_user_by_email(db, email=form_data.username)
     if not user or not security.verify_password(form_data.password, user.hashed_password):
         raise HTTPException(
@@ -425,9 +460,8 @@ async def login_for_access_token(background_tasks: BackgroundTasks, form_data: O
         data={"sub": user.email}, expires_delta=access_token_expires
     )
     
-    # Trigger background recommendation refresh (smart refresh)
-    import recommendations
-    background_tasks.add_task(recommendations.refresh_recommendations, SessionLocal(), user.id, force=False)
+    # Trigger background recommendation refresh (smart refresh, debounced per user)
+    refresh_scheduler.schedule(user.id, force=False)
     
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -438,7 +472,6 @@ async def read_users_me(current_user: models.User = Depends(dependencies.get_cur
 @app.put("/users/profile", response_model=schemas.User)
 def update_profile(
     update: schemas.UserProfileUpdate, 
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db), 
     current_user: models.User = Depends(dependencies.get_current_user)
 ):
@@ -495,8 +528,7 @@ def update_profile(
                  pass
 
         # 2. Trigger background refresh to populate new cache (Region-keyed now, so no need to clear old)
-        import recommendations
-        background_tasks.add_task(recommendations.refresh_recommendations, SessionLocal(), current_user.id, force=True)
+        refresh_scheduler.schedule(current_user.id, force=True)
     
     if update.preferences:
         crud.update_user_preferences(db, user_id=current_user.id, preferences=update.preferences)
@@ -609,7 +641,7 @@ def search_content(query: str, current_user: models.User = Depends(dependencies.
     return tmdb_client.search_multi(query)
 
 @app.post("/subscriptions/", response_model=schemas.Subscription)
-def create_subscription(subscription: schemas.SubscriptionCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+def create_subscription(subscription: schemas.SubscriptionCreate, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
     # Auto-assign country if not provided
     if not subscription.country:
         subscription.country = current_user.country or "US"
@@ -617,16 +649,10 @@ def create_subscription(subscription: schemas.SubscriptionCreate, background_tas
     sub = crud.create_user_subscription(db=db, subscription=subscription, user_id=current_user.id)
     
     # Attach logo
-    service = db.query(models.Service).filter(
-        models.Service.name == sub.service_name,
-        (models.Service.country == sub.country) | (models.Service.country == "US")
-    ).order_by(models.Service.country == sub.country).first()
-    if service:
-        sub.logo_url = service.logo_url
+    sub.logo_url = service_catalog.get(db).logo(sub.service_name, sub.country)
 
     # Trigger background refresh
-    import recommendations
-    background_tasks.add_task(recommendations.refresh_recommendations, SessionLocal(), current_user.id, force=True)
+    refresh_scheduler.schedule(current_user.id, force=True)
     
     return sub
 
@@ -637,65 +663,62 @@ def read_subscriptions(country: str = None, skip: int = 0, limit: int = 100, db:
     
     subs = crud.get_user_subscriptions(db, user_id=current_user.id, country=target_country)
     
-    # Attach logos
+    # Attach logos (catalog snapshot: region match first, then US)
+    catalog = service_catalog.get(db)
     for sub in subs:
-        # Use desc() to prioritize True (Match) over False
-        service = db.query(models.Service).filter(
-            models.Service.name == sub.service_name,
-            (models.Service.country == sub.country) | (models.Service.country == "US")
-        ).order_by(desc(models.Service.country == sub.country)).first()
-        if service:
-            sub.logo_url = service.logo_url
+        sub.logo_url = catalog.logo(sub.service_name, sub.country)
     return subs
 
 @app.delete("/subscriptions/{subscription_id}", response_model=schemas.Subscription)
-def delete_subscription(subscription_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+def delete_subscription(subscription_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
     db_sub = crud.delete_subscription(db, subscription_id=subscription_id, user_id=current_user.id)
     if db_sub is None:
         raise HTTPException(status_code=404, detail="Subscription not found")
         
     # Trigger background refresh
-    import recommendations
-    background_tasks.add_task(recommendations.refresh_recommendations, db, current_user.id, force=True)
+    refresh_scheduler.schedule(current_user.id, force=True)
     
     return db_sub
 
 @app.put("/subscriptions/{subscription_id}", response_model=schemas.Subscription)
-def update_subscription(subscription_id: int, subscription: schemas.SubscriptionUpdate, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+def update_subscription(subscription_id: int, subscription: schemas.SubscriptionUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
     db_sub = crud.update_subscription(db, subscription_id=subscription_id, subscription=subscription, user_id=current_user.id)
     if db_sub is None:
         raise HTTPException(status_code=404, detail="Subscription not found")
         
     # Trigger background refresh
-    import recommendations
-    background_tasks.add_task(recommendations.refresh_recommendations, db, current_user.id, force=True)
+    refresh_scheduler.schedule(current_user.id, force=True)
     
     return db_sub
 
 @app.post("/watchlist/", response_model=schemas.WatchlistItem)
 def add_to_watchlist(
     item: schemas.WatchlistItemCreate, 
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db), 
     current_user: models.User = Depends(dependencies.get_current_user)
 ):
     new_item = crud.create_watchlist_item(db=db, item=item, user_id=current_user.id)
     
     # Trigger recommendation refresh to update "Unused Subs" and "Watch Now"
-    import recommendations
-    background_tasks.add_task(recommendations.refresh_recommendations, SessionLocal(), current_user.id, force=True)
+    refresh_scheduler.schedule(current_user.id, force=True)
     
     return new_item
 
-@app.get("/watchlist/", response_model=list[schemas.WatchlistItem])
-def read_watchlist(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+@app.get("/watchlist/", response_model=list[schemas.WatchlistItem], response_class=fast_json.FastJSONResponse)
+def read_watchlist(request: Request, response: Response, skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    unchanged = etags.not_modified(request, response, etags.watchlist_tag(db, current_user.id, skip, limit))
+    if unchanged:
+        return unchanged
 
     # Optimized: Return raw list immediately. Enrichment happens via separate endpoint.
-    return crud.get_watchlist(db, user_id=current_user.id, skip=skip, limit=limit)
+    # Column-selected rows serialized directly; response_model only documents the shape.
+    return fast_json.render(crud.get_watchlist_rows(db, user_id=current_user.id, skip=skip, limit=limit), response)
 
 @app.post("/watchlist/availability")
-def check_watch_availability(item_ids: list[int], background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    import tmdb_client
+def check_watch_availability(item_ids: list[int], db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    import availability
+    import provider_index
+    import cache_deps
     
     subs = db.query(models.Subscription).filter(
         models.Subscription.user_id == current_user.id,
@@ -703,24 +726,7 @@ def check_watch_availability(item_ids: list[int], background_tasks: BackgroundTa
         models.Subscription.category == 'OTT',
         models.Subscription.country == (current_user.country or "US")
     ).all()
-    
-    # Robust Provider Map
-    PROVIDER_IDS_MAP = {
-        "netflix": "8",
-        "hulu": "15", 
-        "amazon prime video": "9",
-        "disney plus": "337",
-        "max": "384|312",
-        "peacock": "386",
-        "apple tv plus": "350",
-        "apple tv+": "350",  # Added exact match for DB Name
-        "paramount plus": "83|531",
-        "crunchyroll": "283",
-        "hotstar": "122",
-        "disney+ hotstar": "122",
-        "jiocinema": "220",
-        "jiohotstar": "122|220"
-    }
+    matcher = provider_index.matcher_for(db, subs, current_user.country or "US")
     
     availability_map = {}
     
@@ -730,82 +736,43 @@ def check_watch_availability(item_ids: list[int], background_tasks: BackgroundTa
         models.WatchlistItem.user_id == current_user.id
     ).all()
     
-    import concurrent.futures
     import time
     
     start_time = time.time()
     
-    def check_item(item):
-        try:
-            providers = tmdb_client.get_watch_providers(item.media_type, item.tmdb_id, region=current_user.country or "US")
-            matched_sub = None
-            
-            if "flatrate" in providers:
-                for p in providers["flatrate"]:
-                    p_name = p["provider_name"]
-                    p_id = str(p["provider_id"])
-                    
-                    for sub in subs:
-                        # 1. ID Match
-                        s_key = sub.service_name.lower()
-                        mapped_ids = []
-                        if s_key in PROVIDER_IDS_MAP:
-                            mapped_ids = PROVIDER_IDS_MAP[s_key].split("|")
-                        else:
-                            for k, v in PROVIDER_IDS_MAP.items():
-                                if k in s_key or s_key in k:
-                                    mapped_ids = v.split("|")
-                                    break
-                        
-                        if p_id in mapped_ids:
-                            matched_sub = sub.service_name
-                            break
-                        
-                        # 2. Name Match
-                        if sub.service_name.lower() in p_name.lower() or p_name.lower() in sub.service_name.lower():
-                            matched_sub = sub.service_name
-                            break
-                    if matched_sub: break
-            
-            if matched_sub:
-                return item.tmdb_id, matched_sub
-        except Exception as e:
-            print(f"Availability check failed for {item.tmdb_id}: {e}")
-        return None, None
-
-    # Parallel Execution (Optimization)
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        results = list(executor.map(check_item, items))
+    # One indexed lookup against the shared availability table; only titles nobody
+    # has checked recently go out to TMDB (batched)
+    providers_by_title = availability.region_providers(
+        db, [(item.media_type, item.tmdb_id) for item in items], region=current_user.country or "US"
+    )
     
     # Batch Update DB
     updates = 0
-    for tmdb_id, matched_sub in results:
-        if tmdb_id and matched_sub:
-            availability_map[tmdb_id] = matched_sub
-            # Find item and update
-            for item in items:
-                if item.tmdb_id == tmdb_id:
-                    if item.available_on != matched_sub:
-                         item.available_on = matched_sub
-                         updates += 1
-                    break
+    for item in items:
+        providers = providers_by_title.get((item.media_type, item.tmdb_id), {})
+        matched = matcher.first(providers.get("flatrate", []))
+        matched_sub = matched.service_name if matched else None
+        if matched_sub:
+            availability_map[item.tmdb_id] = matched_sub
+            if item.available_on != matched_sub:
+                item.available_on = matched_sub
+                updates += 1
     
     if updates > 0:
         print(f"DEBUG: Persisting {updates} badge updates to DB")
         db.commit()
+        cache_deps.bump(db, current_user.id, "availability")
             
     print(f"DEBUG: Availability check took {time.time() - start_time:.2f}s for {len(items)} items")
             
     # Trigger refresh since availability changed (affecting "Unused Subs")
-    import recommendations
-    background_tasks.add_task(recommendations.refresh_recommendations, SessionLocal(), current_user.id, force=True)
+    refresh_scheduler.schedule(current_user.id, force=True)
     
     return availability_map
 
 @app.delete("/watchlist/{item_id}", response_model=schemas.WatchlistItem)
 def delete_watchlist_item(
     item_id: int, 
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db), 
     current_user: models.User = Depends(dependencies.get_current_user)
 ):
@@ -814,23 +781,23 @@ def delete_watchlist_item(
         raise HTTPException(status_code=404, detail="Item not found")
         
     # Trigger refresh
-    import recommendations
-    background_tasks.add_task(recommendations.refresh_recommendations, SessionLocal(), current_user.id, force=True)
+    refresh_scheduler.schedule(current_user.id, force=True)
     
     return db_item
 
-@app.put("/watchlist/{item_id}/status", response_model=schemas.WatchlistItem)
+@app.put("/watchlist/{item_id}/status", response_model=schemas.WatchlistItemPatched)
 def update_watchlist_status(
     item_id: int, 
     status: str, 
     db: Session = Depends(get_db), 
     current_user: models.User = Depends(dependencies.get_current_user)
 ):
+    import recommendations
+    was_active = recommendations.is_watch_now_candidate(db, item_id, current_user.id)
     db_item = crud.update_watchlist_item_status(db, item_id=item_id, user_id=current_user.id, status=status)
     if db_item is None:
         raise HTTPException(status_code=404, detail="Item not found")
-    import recommendations
-    recommendations.clear_user_cache(db, current_user.id)
+    db_item.dashboard = recommendations.patch_dashboard(db, current_user.id, db_item, "status", was_active)
     return db_item
 
 @app.put("/watchlist/{item_id}/rating", response_model=schemas.WatchlistItem)
@@ -843,8 +810,6 @@ def update_watchlist_rating(
     db_item = crud.update_watchlist_item_rating(db, item_id=item_id, user_id=current_user.id, rating=update.rating)
     if db_item is None:
         raise HTTPException(status_code=404, detail="Item not found")
-    import recommendations
-    recommendations.clear_user_cache(db, current_user.id)
     return db_item
 
 @app.put("/watchlist/{item_id}/notes", response_model=schemas.WatchlistItem)
@@ -857,17 +822,17 @@ def update_watchlist_notes(
     db_item = crud.update_watchlist_item_notes(db, item_id=item_id, user_id=current_user.id, notes=update.notes)
     if db_item is None:
         raise HTTPException(status_code=404, detail="Item not found")
-    import recommendations
-    recommendations.clear_user_cache(db, current_user.id)
     return db_item
 
-@app.put("/watchlist/{item_id}/progress", response_model=schemas.WatchlistItem)
+@app.put("/watchlist/{item_id}/progress", response_model=schemas.WatchlistItemPatched)
 def update_watchlist_progress(
     item_id: int, 
     update: schemas.WatchlistProgressUpdate, 
     db: Session = Depends(get_db), 
     current_user: models.User = Depends(dependencies.get_current_user)
 ):
+    import recommendations
+    was_active = recommendations.is_watch_now_candidate(db, item_id, current_user.id)
     db_item = crud.update_watchlist_item_progress(
         db, 
         item_id=item_id, 
@@ -877,8 +842,7 @@ def update_watchlist_progress(
     )
     if db_item is None:
         raise HTTPException(status_code=404, detail="Item not found")
-    import recommendations
-    recommendations.clear_user_cache(db, current_user.id)
+    db_item.dashboard = recommendations.patch_dashboard(db, current_user.id, db_item, "progress", was_active)
     return db_item
 
 @app.get("/recommendations")
@@ -887,15 +851,30 @@ def get_recommendations(db: Session = Depends(get_db), current_user: models.User
     import recommendations
     return recommendations.get_dashboard_recommendations(db, user_id=current_user.id)
 
-@app.get("/recommendations/dashboard")
-def get_dashboard_recommendations(db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+@app.get("/recommendations/dashboard", response_class=fast_json.FastJSONResponse)
+def get_dashboard_recommendations(request: Request, response: Response, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
     import recommendations
-    return recommendations.get_dashboard_recommendations(db, user_id=current_user.id)
-
-@app.get("/recommendations/similar")
-def get_similar_recommendations(force_refresh: bool = False, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    cache_status = {}
+    recs = recommendations.get_dashboard_recommendations(db, user_id=current_user.id, cache_status=cache_status)
+    if cache_status.get("stale"):
+        response.headers["X-Cache-Stale"] = "true" # Served past its TTL; a background refresh is queued
+    return etags.not_modified(request, response, _recs_tag(recs, cache_status)) or fast_json.render(recs, response)
+
+@app.get("/recommendations/similar", response_class=fast_json.FastJSONResponse)
+def get_similar_recommendations(request: Request, response: Response, force_refresh: bool = False, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
     import recommendations
-    return recommendations.get_similar_content(db, user_id=current_user.id, force_refresh=force_refresh)
+    cache_status = {}
+    recs = recommendations.get_similar_content(db, user_id=current_user.id, force_refresh=force_refresh, cache_status=cache_status)
+    if cache_status.get("stale"):
+        response.headers["X-Cache-Stale"] = "true"
+    return etags.not_modified(request, response, _recs_tag(recs, cache_status)) or fast_json.render(recs, response)
+
+def _recs_tag(recs, cache_status: dict) -> str:
+    # Tagged by the cache entry served or just stored, so a fresh result and the next hit on it
+    # share a tag; only results that weren't cached (empty) are hashed
+    if cache_status.get("version"):
+        return etags.tag(cache_status["version"])
+    return etags.tag(fast_json.dumps(recs))
 
 @app.post("/recommendations/refresh")
 def refresh_recommendations_endpoint(type: str = None, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
@@ -921,9 +900,15 @@ def get_unified_insights(
     import crud
     import json
     
+    # User data for every path below, loaded once (input versions first, so edits made while
+    # the AI runs invalidate the result)
+    import cache_deps
+    input_versions = cache_deps.versions(db, current_user.id)
+    ctx = user_context.load(db, current_user.id)
+
     # Check cache first? (Optional - lets do fresh for now or cache with 24h expiry)
     import recommendations
-    if current_user.subscriptions and not force_refresh: 
+    if ctx.subscriptions and not force_refresh: 
          # Using a distinct category for this unified blob, now keyed by country
          country = current_user.country or "US"
          cache_key = f"unified_insights_{country}"
@@ -952,7 +937,7 @@ def get_unified_insights(
                  
                  # Enrich Strategy Items in Cache Hit
                  if "strategy" in cached:
-                     billing_map = {s.service_name.lower().strip(): s.billing_cycle.lower().strip() for s in current_user.subscriptions}
+                     billing_map = {s.service_name.lower().strip(): s.billing_cycle.lower().strip() for s in ctx.subscriptions}
                      for strat in cached["strategy"]:
                          service_name = strat.get("service", "").lower().strip()
                          billing_cycle = billing_map.get(service_name, "monthly")
@@ -967,7 +952,7 @@ def get_unified_insights(
              # LIMIT REACHED: Try to fallback to ANY cache (even if we thought it was 'bad' or 'old')
              # Re-fetch raw cache just in case we filtered it out above
              country = current_user.country or "US"
-             fallback = recommendations.get_cached_data(db, user_id=current_user.id, category=f"unified_insights_{country}")
+             fallback = recommendations.get_cached_data(db, user_id=current_user.id, category=f"unified_insights_{country}", check_inputs=False)
              
              # If we have cache, use it
              if fallback and (fallback.get('picks') or fallback.get('strategy')):
@@ -987,20 +972,9 @@ def get_unified_insights(
         raise e
 
     # Gather Context
-    watchlist = crud.get_watchlist(db, user_id=current_user.id, limit=100)
-    subs = db.query(models.Subscription).filter(
-        models.Subscription.user_id == current_user.id,
-        models.Subscription.is_active == True,
-        models.Subscription.category == 'OTT'
-    ).all()
-    
-    # Parse Preferences
-    preferences = {}
-    if current_user.preferences:
-        try:
-            preferences = json.loads(current_user.preferences)
-        except:
-            pass
+    watchlist = ctx.watchlist[:100]
+    subs = ctx.ott_subscriptions(any_region=True)
+    preferences = ctx.preferences
             
     # Format Data
     history = [{"title": w.title, "status": w.status} for w in watchlist]
@@ -1028,7 +1002,7 @@ def get_unified_insights(
     # We load old cache -> see if user ignored them -> increment count
     import recommendations
     country = current_user.country or "US"
-    old_cache = recommendations.get_cached_data(db, user_id=current_user.id, category=f"unified_insights_{country}")
+    old_cache = recommendations.get_cached_data(db, user_id=current_user.id, category=f"unified_insights_{country}", check_inputs=False)
     
     ignored_counts = preferences.get("ai_skip_counts", {})
     dirty_pref = False
@@ -1100,7 +1074,7 @@ def get_unified_insights(
              
              # 1. Try Cache
              country = current_user.country or "US"
-             fallback = recommendations.get_cached_data(db, user_id=current_user.id, category=f"unified_insights_{country}")
+             fallback = recommendations.get_cached_data(db, user_id=current_user.id, category=f"unified_insights_{country}", check_inputs=False)
              if fallback and (fallback.get('picks') or fallback.get('strategy')):
                  fallback['warning'] = "AI is currently experiencing high demand. Viewing cached results from previous session."
                  return fallback
@@ -1131,7 +1105,7 @@ def get_unified_insights(
         
     # Cache
     country = current_user.country or "US"
-    recommendations.set_cached_data(db, user_id=current_user.id, category=f"unified_insights_{country}", data=insights)
+    recommendations.set_cached_data(db, user_id=current_user.id, category=f"unified_insights_{country}", data=insights, versions=input_versions)
     
     # SUCCESS: Now we save the skip counts (if any)
     if dirty_pref:
@@ -1144,312 +1118,24 @@ def get_unified_insights(
     
     return insights
 
-@app.get("/subscriptions/coverage")
+@app.get("/subscriptions/coverage", response_class=fast_json.FastJSONResponse)
 def get_subscription_coverage(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(dependencies.get_current_user)
 ):
     """
     Returns a deterministic coverage breakdown of how well the user's active OTT
     subscriptions cover their watchlist. No AI, no external API calls.
-    Uses cached available_on field + type-aware hour heuristics.
+    Uses the shared title_availability table + type-aware hour heuristics.
     """
-    country = current_user.country or "US"
-
-    # --- Fetch Data ---
-    subs = db.query(models.Subscription).filter(
-        models.Subscription.user_id == current_user.id,
-        models.Subscription.is_active == True,
-        models.Subscription.category == "OTT",
-        models.Subscription.country == country
-    ).all()
-
-    watchlist = db.query(models.WatchlistItem).filter(
-        models.WatchlistItem.user_id == current_user.id
-    ).all()
-
-    # Attach logos to subs
-    for sub in subs:
-        service = db.query(models.Service).filter(
-            models.Service.name == sub.service_name,
-            (models.Service.country == sub.country) | (models.Service.country == "US")
-        ).order_by(desc(models.Service.country == sub.country)).first()
-        if service:
-            sub.logo_url = service.logo_url
-
-    total_watchlist = len(watchlist)
-
-    # --- Content Classification ---
-    def classify_item(item) -> str:
-        genre_ids = item.genre_ids or ""
-        is_animation = "16" in genre_ids
-        is_japanese = item.original_language == "ja"
-        if item.media_type == "movie":
-            return "movie"
-        elif is_japanese and is_animation:
-            return "anime"
-        elif item.media_type == "tv":
-            return "tv"
-        else:
-            return "other"
-
-    # --- Hour Estimation ---
-    AVG_EPISODE_DURATION = {"movie": 120, "tv": 42, "anime": 22, "other": 42}
-    DEFAULT_SERIES_EPISODES = {"tv": 40, "anime": 26, "other": 20}
-
-    def estimate_hours(item, content_type: str) -> float:
-        if content_type == "movie":
-            return round(AVG_EPISODE_DURATION["movie"] / 60, 1)
-        eps = item.total_episodes or 0
-        seasons = item.total_seasons or 0
-        if eps > 0:
-            episode_count = eps
-        elif seasons > 0:
-            episode_count = seasons * 12
-        else:
-            episode_count = DEFAULT_SERIES_EPISODES.get(content_type, 20)
-        return round((episode_count * AVG_EPISODE_DURATION[content_type]) / 60, 1)
-
-    # Pre-classify all watchlist items
-    classified = {}
-    for item in watchlist:
-        ct = classify_item(item)
-        hrs = estimate_hours(item, ct)
-        classified[item.id] = {"type": ct, "hours": hrs}
-
-    # --- Per-Service Coverage Breakdown ---
-    def get_monthly_cost(sub) -> float:
-        cost = sub.cost or 0.0
-        if sub.billing_cycle and sub.billing_cycle.lower() == "yearly":
-            return round(cost / 12, 2)
-        return cost
-
-    services_data = []
-
-    for sub in subs:
-        monthly_cost = get_monthly_cost(sub)
-        breakdown = {
-            "movie":  {"count": 0, "est_hours": 0.0},
-            "tv":     {"count": 0, "est_hours": 0.0},
-            "anime":  {"count": 0, "est_hours": 0.0},
-            "other":  {"count": 0, "est_hours": 0.0},
-        }
-
-        for item in watchlist:
-            if not item.available_on:
-                continue
-            # Fuzzy match: service name contained in available_on or vice versa
-            if (sub.service_name.lower() in item.available_on.lower() or
-                    item.available_on.lower() in sub.service_name.lower()):
-                ct = classified[item.id]["type"]
-                hrs = classified[item.id]["hours"]
-                breakdown[ct]["count"] += 1
-                breakdown[ct]["est_hours"] = round(breakdown[ct]["est_hours"] + hrs, 1)
-
-        total_covered = sum(v["count"] for v in breakdown.values())
-        total_hours = round(sum(v["est_hours"] for v in breakdown.values()), 1)
-        coverage_pct = round((total_covered / total_watchlist * 100) if total_watchlist > 0 else 0)
-        type_count = sum(1 for v in breakdown.values() if v["count"] > 0)
-
-        # Value Score: hours-primary, coverage secondary, capped at 100
-        # Hours are the real measure of entertainment value — cap at 300h
-        hour_score = min((total_hours / 300) * 55, 55)
-        # Coverage % is secondary — max 25 pts (100% coverage = 25 pts)
-        title_score = min(coverage_pct * 0.25, 25)
-        # Variety bonus for services spanning multiple content types
-        variety_bonus = 20 if type_count >= 2 else 0
-        raw_utility = hour_score + title_score + variety_bonus  # max = 100
-
-        cost_usd = monthly_cost / 83.0 if country == "IN" else monthly_cost
-        cost_penalty = min(cost_usd * 1.5, 20.0)
-
-        value_score = round(max(10, raw_utility - cost_penalty))
-
-        cost_per_title = round(monthly_cost / total_covered, 2) if total_covered > 0 else None
-        cost_per_hour = round(monthly_cost / total_hours, 2) if total_hours > 0 else None
-
-        services_data.append({
-            "name": sub.service_name,
-            "cost": sub.cost or 0.0,
-            "billing_cycle": sub.billing_cycle,
-            "logo_url": getattr(sub, "logo_url", None),
-            "coverage_pct": coverage_pct,
-            "value_score": value_score,
-            "type_count": type_count,
-            "breakdown": breakdown,
-            "total_covered": total_covered,
-            "total_hours": total_hours,
-            "cost_per_title": cost_per_title,
-            "cost_per_hour": cost_per_hour,
-        })
-
-    # Sort by value_score descending
-    services_data.sort(key=lambda s: s["value_score"], reverse=True)
-
-    # --- Orphaned Titles (no available_on or no matching subscription) ---
-    sub_names_lower = {s.service_name.lower() for s in subs}
-
-    def is_covered_by_any_sub(item) -> bool:
-        if not item.available_on:
-            return False
-        a = item.available_on.lower()
-        return any(sn in a or a in sn for sn in sub_names_lower)
-
-    orphaned = []
-    for item in watchlist:
-        if not is_covered_by_any_sub(item):
-            ct = classified[item.id]["type"]
-            # If available_on points to a service the user doesn't have, surface it as a suggestion
-            suggested_service = None
-            if item.available_on:
-                suggested_service = item.available_on  # e.g. "Apple TV+" - user doesn't have it
-            orphaned.append({
-                "tmdb_id": item.tmdb_id,
-                "dbId": item.id,
-                "title": item.title,
-                "media_type": item.media_type,
-                "poster_path": item.poster_path,
-                "vote_average": item.vote_average,
-                "overview": item.overview,
-                "status": item.status,
-                "est_hours": classified[item.id]["hours"],
-                "content_type": ct,
-                "suggested_service": suggested_service,
-                "original_language": item.original_language,
-                "genre_ids": item.genre_ids,
-            })
-
-    # --- Suggested Services (unsubscribed services covering watchlist items) ---
-    # Build a map: service_name -> { count, hours, titles, types, breakdown }
-    from collections import defaultdict
-    suggested_map = defaultdict(lambda: {
-        "count": 0, "hours": 0.0, "titles": [], "types": set(),
-        "breakdown": {
-            "movie": {"count": 0, "est_hours": 0.0},
-            "tv":    {"count": 0, "est_hours": 0.0},
-            "anime": {"count": 0, "est_hours": 0.0},
-            "other": {"count": 0, "est_hours": 0.0},
-        }
-    })
-
-    subscribed_names_lower = {s.service_name.lower() for s in subs}
-
-    for item in watchlist:
-        if not item.available_on:
-            continue
-        raw_services = [s.strip() for s in item.available_on.split(",") if s.strip()]
-        for svc_name in raw_services:
-            svc_lower = svc_name.lower()
-            if any(sub_n in svc_lower or svc_lower in sub_n for sub_n in subscribed_names_lower):
-                continue
-            ct = classified[item.id]["type"]
-            hrs = classified[item.id]["hours"]
-            suggested_map[svc_name]["count"] += 1
-            suggested_map[svc_name]["hours"] = round(suggested_map[svc_name]["hours"] + hrs, 1)
-            suggested_map[svc_name]["types"].add(ct)
-            suggested_map[svc_name]["breakdown"][ct]["count"] += 1
-            suggested_map[svc_name]["breakdown"][ct]["est_hours"] = round(
-                suggested_map[svc_name]["breakdown"][ct]["est_hours"] + hrs, 1
-            )
-            if item.title not in suggested_map[svc_name]["titles"]:
-                suggested_map[svc_name]["titles"].append(item.title)
-
-    # Fetch logos and cheapest plan for suggested services
-    suggested_services = []
-    for svc_name, info in sorted(suggested_map.items(), key=lambda x: -x[1]["count"]):
-        if info["count"] < 1:
-            continue
-        logo_url = None
-        cheapest_plan = None
-        service_record = db.query(models.Service).filter(
-            models.Service.name == svc_name,
-        ).order_by(
-            # Prefer exact country match
-            desc(models.Service.country == country)
-        ).first()
-        if service_record:
-            logo_url = service_record.logo_url
-            # Find the cheapest monthly-equivalent plan for this service in user's country
-            plans = db.query(models.Plan).filter(
-                models.Plan.service_id == service_record.id,
-                models.Plan.country == country,
-            ).all()
-            if not plans:
-                # Fallback to any country
-                plans = db.query(models.Plan).filter(
-                    models.Plan.service_id == service_record.id,
-                ).all()
-            if plans:
-                def monthly_equiv(p):
-                    return p.cost / 12 if p.billing_cycle and p.billing_cycle.lower() == "yearly" else p.cost
-                best = min(plans, key=monthly_equiv)
-                cheapest_plan = {
-                    "cost": best.cost,
-                    "currency": best.currency,
-                    "billing_cycle": best.billing_cycle,
-                }
-
-        # Compute projected value score using same formula as active subscriptions
-        s_coverage_pct = round((info["count"] / total_watchlist * 100) if total_watchlist > 0 else 0)
-        s_total_hours = info["hours"]
-        s_type_count = len(info["types"])
-        s_hour_score = min((s_total_hours / 300) * 55, 55)
-        s_title_score = min(s_coverage_pct * 0.25, 25)
-        s_variety_bonus = 20 if s_type_count >= 2 else 0
-        s_raw_utility = s_hour_score + s_title_score + s_variety_bonus
-        s_monthly_cost = 0.0
-        if cheapest_plan:
-            s_monthly_cost = (cheapest_plan["cost"] / 12
-                              if cheapest_plan["billing_cycle"] and cheapest_plan["billing_cycle"].lower() == "yearly"
-                              else cheapest_plan["cost"])
-        s_cost_usd = s_monthly_cost / 83.0 if country == "IN" else s_monthly_cost
-        s_cost_penalty = min(s_cost_usd * 1.5, 20.0)
-        s_value_score = round(max(10, s_raw_utility - s_cost_penalty))
-        s_cost_per_title = round(s_monthly_cost / info["count"], 2) if info["count"] > 0 and s_monthly_cost > 0 else None
-        s_cost_per_hour = round(s_monthly_cost / s_total_hours, 2) if s_total_hours > 0 and s_monthly_cost > 0 else None
-
-        suggested_services.append({
-            "name": svc_name,
-            "logo_url": logo_url,
-            "count": info["count"],
-            "est_hours": info["hours"],
-            "coverage_pct": s_coverage_pct,
-            "breakdown": info["breakdown"],
-            "titles": info["titles"][:5],
-            "cheapest_plan": cheapest_plan,
-            "value_score": s_value_score,
-            "cost_per_title": s_cost_per_title,
-            "cost_per_hour": s_cost_per_hour,
-        })
-
-    # --- Summary ---
-    total_monthly_cost = round(sum(get_monthly_cost(s) for s in subs), 2)
-    total_covered = sum(
-        1 for item in watchlist if is_covered_by_any_sub(item)
-    )
-    total_covered_hours = round(sum(
-        classified[item.id]["hours"]
-        for item in watchlist if is_covered_by_any_sub(item)
-    ), 1)
-    overall_pct = round((total_covered / total_watchlist * 100) if total_watchlist > 0 else 0)
-
-    most_valuable = services_data[0]["name"] if services_data else None
-    least_used = min(services_data, key=lambda s: s["total_covered"])["name"] if services_data else None
-
-    return {
-        "services": services_data,
-        "orphaned_items": orphaned,
-        "suggested_services": suggested_services,
-        "summary": {
-            "total_monthly_cost": total_monthly_cost,
-            "total_covered": total_covered,
-            "total_watchlist": total_watchlist,
-            "overall_coverage_pct": overall_pct,
-            "total_covered_hours": total_covered_hours,
-            "most_valuable_service": most_valuable,
-            "least_used_service": least_used,
-        }
-    }
+    # Stored per-user model, rebuilt incrementally after writes it depends on (coverage_model.py)
+    stamp, data = coverage_model.get(db, current_user)
+    unchanged = etags.not_modified(request, response, etags.tag("coverage", current_user.id, stamp))
+    if unchanged:
+        return unchanged
+    return fast_json.render(data, response)
 
 
 @app.get("/services/", response_model=list[schemas.Service])
@@ -34,6 +34,19 @@ def run_migration():
             ("subscriptions", "country", "TEXT DEFAULT 'US'"),
             ("watchlist_items", "original_language", "TEXT"),
             ("watchlist_items", "notes", "TEXT"),
+            ("titles", "in_production", "BOOLEAN"),
+            ("titles", "last_air_date", "TEXT"),
+            ("titles", "next_episode_air_date", "TEXT"),
+            ("titles", "seasons_refreshed_at", "TIMESTAMP"),
+            ("recommendation_cache", "input_versions", "TEXT"),
+            ("recommendation_cache", "payload", "BYTEA" if "postgresql" in str(conn.engine.url) else "BLOB"),
+            ("recommendation_cache", "schema_version", "INTEGER"),
+            ("coverage_items", "media_type", "TEXT"),
+            ("coverage_items", "tmdb_id", "INTEGER"),
+            ("coverage_items", "details", "TEXT"),
+            ("coverage_items", "dirty", "INTEGER DEFAULT 0"),
+            ("coverage_models", "catalog_version", "TEXT"),
+            ("coverage_models", "dirty", "INTEGER DEFAULT 0"),
         ]
         
         for table, col, dtype in columns_to_add:
@@ -95,6 +108,54 @@ def run_migration():
             print(f"❌ Data Backfill Failed: {e}")
             conn.rollback()
 
+        # Shared titles catalog: move per-user metadata copies into `titles` (one row per title)
+        print("🔄 Moving watchlist metadata into the titles catalog...")
+        try:
+            inserted = conn.execute(text("""
+                INSERT INTO titles (media_type, tmdb_id, title, poster_path, overview, vote_average,
+                                    genre_ids, original_language, total_seasons, total_episodes)
+                SELECT w.media_type, w.tmdb_id, w.title, w.poster_path, w.overview, w.vote_average,
+                       w.genre_ids, w.original_language, w.total_seasons, w.total_episodes
+                FROM watchlist_items w
+                WHERE w.id IN (
+                    SELECT MAX(id) FROM watchlist_items WHERE title IS NOT NULL GROUP BY media_type, tmdb_id
+                )
+                AND NOT EXISTS (
+                    SELECT 1 FROM titles t WHERE t.media_type = w.media_type AND t.tmdb_id = w.tmdb_id
+                )
+            """)).rowcount
+            # Watchlist rows keep only per-user state once the catalog has their title
+            cleared = conn.execute(text("""
+                UPDATE watchlist_items
+                SET title = NULL, poster_path = NULL, overview = NULL, vote_average = NULL,
+                    genre_ids = NULL, original_language = NULL, total_seasons = NULL, total_episodes = NULL
+                WHERE title IS NOT NULL AND EXISTS (
+                    SELECT 1 FROM titles t
+                    WHERE t.media_type = watchlist_items.media_type AND t.tmdb_id = watchlist_items.tmdb_id
+                )
+            """)).rowcount
+            conn.commit()
+            print(f"✅ Titles catalog: {inserted} titles added, {cleared} watchlist rows slimmed")
+        except Exception as e:
+            print(f"❌ Titles catalog backfill Failed: {e}")
+            conn.rollback()
+
+        # Recommendation cache: one row per (user, category) so writes can upsert
+        print("🔄 Enforcing one recommendation cache row per user and category...")
+        try:
+            removed = conn.execute(text("""
+                DELETE FROM recommendation_cache
+                WHERE id NOT IN (SELECT MAX(id) FROM recommendation_cache GROUP BY user_id, category)
+            """)).rowcount
+            conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uix_recommendation_cache ON recommendation_cache (user_id, category)"
+            ))
+            conn.commit()
+            print(f"✅ Recommendation cache: {removed} duplicate rows removed")
+        except Exception as e:
+            print(f"❌ Recommendation cache dedupe Failed: {e}")
+            conn.rollback()
+
 if __name__ == "__main__":
     try:
         run_migration()
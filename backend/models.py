@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, Date, UniqueConstraint
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, Date, UniqueConstraint, Index, LargeBinary, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -45,32 +45,57 @@ class Subscription(Base):
 
     owner = relationship("User", back_populates="subscriptions")
 
+def _catalog_field(name):
+    """Read title metadata from the shared catalog, falling back to the row's legacy copy."""
+    def getter(self):
+        value = getattr(self.catalog, name, None) if self.catalog is not None else None
+        return value if value else (getattr(self, "legacy_" + name) or value)
+    return property(getter)
+
 class WatchlistItem(Base):
     __tablename__ = "watchlist_items"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     tmdb_id = Column(Integer)
-    title = Column(String)
     media_type = Column(String) # movie, tv
-    poster_path = Column(String, nullable=True)
-    vote_average = Column(Float, nullable=True)
-    overview = Column(String, nullable=True)
     user_rating = Column(Integer, nullable=True) # 1-5 scale (or 1-10)
     available_on = Column(String, nullable=True) # Badge cache
-    genre_ids = Column(String, nullable=True) # JSON string or comma-separated list of genre IDs
-    original_language = Column(String, nullable=True) # e.g. "ja" for Japanese (anime detection)
     status = Column(String, default="plan_to_watch") # plan_to_watch, watching, watched
     notes = Column(String, nullable=True) # Personal notes
     
     # Progress Tracking
     current_season = Column(Integer, default=0)
     current_episode = Column(Integer, default=0)
-    total_seasons = Column(Integer, default=0)
-    total_episodes = Column(Integer, default=0)
 
     added_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Title metadata lives in the shared `titles` catalog (see title_catalog.py).
+    # Legacy per-user copies: empty for new rows, cleared by migration once the catalog has the title.
+    legacy_title = Column("title", String, nullable=True)
+    legacy_poster_path = Column("poster_path", String, nullable=True)
+    legacy_vote_average = Column("vote_average", Float, nullable=True)
+    legacy_overview = Column("overview", String, nullable=True)
+    legacy_genre_ids = Column("genre_ids", String, nullable=True)
+    legacy_original_language = Column("original_language", String, nullable=True)
+    legacy_total_seasons = Column("total_seasons", Integer, default=0)
+    legacy_total_episodes = Column("total_episodes", Integer, default=0)
+
+    catalog = relationship(
+        "Title",
+        primaryjoin="and_(foreign(WatchlistItem.media_type) == Title.media_type, foreign(WatchlistItem.tmdb_id) == Title.tmdb_id)",
+        viewonly=True, uselist=False, lazy="joined",
+    )
+
+    title = _catalog_field("title")
+    poster_path = _catalog_field("poster_path")
+    vote_average = _catalog_field("vote_average")
+    overview = _catalog_field("overview")
+    genre_ids = _catalog_field("genre_ids") # JSON string list of genre IDs
+    original_language = _catalog_field("original_language") # e.g. "ja" for Japanese (anime detection)
+    total_seasons = _catalog_field("total_seasons")
+    total_episodes = _catalog_field("total_episodes")
+
     owner = relationship("User", back_populates="watchlist")
 
 
@@ -104,15 +129,71 @@ class Service(Base):
 
 class RecommendationCache(Base):
     __tablename__ = "recommendation_cache"
+    __table_args__ = (
+        # One row per user and category (upserted with ON CONFLICT, see recommendations.set_cached_data)
+        Index('uix_recommendation_cache', 'user_id', 'category', unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), index=True)
-    category = Column(String, index=True) # "dashboard", "similar"
-    data = Column(String) # JSON string
+    category = Column(String, index=True) # "dashboard_US", "similar_US", "unified_insights_US"
+    payload = Column(LargeBinary) # zlib-compressed JSON (see cache_codec.py)
+    schema_version = Column(Integer) # cache_codec.SCHEMA_VERSION the payload was written with
+    data = Column(String) # Legacy JSON string (rows written before payload)
+    input_versions = Column(String) # JSON {input: version} the data was computed from (see cache_deps.py)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     owner = relationship("User")
 
+class CacheInputVersion(Base):
+    __tablename__ = "cache_input_versions"
+    __table_args__ = (
+        UniqueConstraint('user_id', 'input', name='uix_cache_input_version'),
+    )
+
+    # Per-user version of one recommendation input (see cache_deps.py)
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    input = Column(String) # membership, status, progress, ratings, subscriptions, preferences
+    version = Column(Integer, default=0)
+
+class CoverageItem(Base):
+    __tablename__ = "coverage_items"
+    __table_args__ = (
+        Index('ix_coverage_items_title', 'media_type', 'tmdb_id'),
+    )
+
+    # Materialized per-title coverage inputs of one watchlist item (see coverage_model.py)
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    item_id = Column(Integer, unique=True) # watchlist_items.id
+    media_type = Column(String) # Title key, so catalog / availability writes can find the row
+    tmdb_id = Column(Integer)
+    region = Column(String)
+    content_type = Column(String) # movie, tv, anime, other
+    est_hours = Column(Float)
+    providers = Column(String) # JSON flatrate providers [{"provider_id", "provider_name"}] in region
+    details = Column(String, nullable=True) # JSON display fields for orphaned titles; NULL until computed
+    dirty = Column(Integer, default=0) # Input changes since the row was computed
+    updated_at = Column(DateTime) # UTC
+
+class CoverageModel(Base):
+    __tablename__ = "coverage_models"
+    __table_args__ = (
+        UniqueConstraint('user_id', 'region', name='uix_coverage_model'),
+    )
+
+    # Stored /subscriptions/coverage response per user and region (see coverage_model.py)
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    region = Column(String)
+    stamp = Column(String) # Digest of the payload, the coverage ETag
+    payload = Column(LargeBinary) # zlib-compressed JSON (see cache_codec.py)
+    schema_version = Column(Integer)
+    catalog_version = Column(String) # service_catalog version the payload was built against
+    dirty = Column(Integer, default=0) # Input changes since the payload was built
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 class Plan(Base):
     __tablename__ = "plans"
 
@@ -125,3 +206,129 @@ class Plan(Base):
     country = Column(String, default="US")
     
     service = relationship("Service", back_populates="plans")
+
+class TmdbCacheEntry(Base):
+    __tablename__ = "tmdb_cache"
+
+    key = Column(String, primary_key=True) # e.g. "providers:movie:550"
+    endpoint = Column(String, index=True) # providers, details, similar, trending, discover
+    data = Column(String) # JSON string of the raw TMDB payload
+    fetched_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), index=True)
+    last_accessed_at = Column(DateTime(timezone=True), index=True) # LRU eviction order
+
+class CandidatePool(Base):
+    __tablename__ = "candidate_pools"
+    __table_args__ = (
+        UniqueConstraint('kind', 'media_type', 'region', 'provider_set', 'genre', name='uix_candidate_pool'),
+    )
+
+    # Shared, user-independent candidate list (see candidate_pools.py)
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String) # trending_week, popular, top_rated, acclaimed
+    media_type = Column(String)
+    region = Column(String)
+    provider_set = Column(String, default="") # Sorted pipe-joined TMDB provider ids, "" = any provider
+    genre = Column(String, default="") # TMDB genre id, "" = all genres
+    items = Column(String) # JSON list of TMDB results, each with the region's "providers"
+    refreshed_at = Column(DateTime(timezone=True), index=True)
+    last_used_at = Column(DateTime(timezone=True), index=True)
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index('ix_jobs_claim', 'status', 'priority', 'run_after'),
+        # At most one queued job per dedupe key (a running one may coexist as its follow-up)
+        Index('uix_jobs_queued_dedupe', 'dedupe_key', unique=True,
+              sqlite_where=text("status = 'queued'"), postgresql_where=text("status = 'queued'")),
+    )
+
+    # Durable background job (see job_queue.py / worker.py)
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, index=True) # refresh_recommendations, refresh_titles, renewal_digest, ...
+    payload = Column(String) # JSON arguments for the handler
+    dedupe_key = Column(String, index=True) # e.g. "refresh:12:dashboard"
+    priority = Column(Integer, default=5) # Lower runs first
+    status = Column(String, default="queued") # queued, running, done, failed
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    run_after = Column(DateTime(timezone=True))
+    leased_by = Column(String)
+    leased_until = Column(DateTime(timezone=True))
+    last_error = Column(String)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), index=True)
+
+class SyncState(Base):
+    __tablename__ = "sync_state"
+
+    name = Column(String, primary_key=True) # e.g. "provider_changes"
+    value = Column(String) # JSON string (cursor, last run summary)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class TitleAvailability(Base):
+    __tablename__ = "title_availability"
+    __table_args__ = (
+        UniqueConstraint('media_type', 'tmdb_id', 'region', 'provider_id', 'monetization_type', name='uix_title_availability'),
+        Index('ix_title_availability_lookup', 'tmdb_id', 'media_type', 'region'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    tmdb_id = Column(Integer)
+    media_type = Column(String) # movie, tv
+    region = Column(String) # ISO country, e.g. "US", "IN"
+    provider_id = Column(Integer, index=True) # TMDB provider id
+    provider_name = Column(String)
+    logo_path = Column(String, nullable=True)
+    display_priority = Column(Integer, default=0)
+    monetization_type = Column(String) # flatrate, free, ads, rent, buy
+    fetched_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class TitleAvailabilityStatus(Base):
+    __tablename__ = "title_availability_status"
+
+    # One row per title: when its providers (all regions) were last fetched, even if it has none
+    media_type = Column(String, primary_key=True)
+    tmdb_id = Column(Integer, primary_key=True)
+    fetched_at = Column(DateTime(timezone=True), index=True)
+
+class Title(Base):
+    __tablename__ = "titles"
+    __table_args__ = (
+        UniqueConstraint('media_type', 'tmdb_id', name='uix_titles_media_tmdb'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    media_type = Column(String) # movie, tv
+    tmdb_id = Column(Integer, index=True)
+    title = Column(String)
+    poster_path = Column(String, nullable=True)
+    overview = Column(String, nullable=True)
+    vote_average = Column(Float, nullable=True)
+    genre_ids = Column(String, nullable=True) # JSON string list of genre IDs
+    original_language = Column(String, nullable=True)
+    total_seasons = Column(Integer, default=0)
+    total_episodes = Column(Integer, default=0)
+    refreshed_at = Column(DateTime(timezone=True), nullable=True) # Last full TMDB details fetch
+
+    # TV season structure (see tv_seasons.py)
+    in_production = Column(Boolean, nullable=True)
+    last_air_date = Column(String, nullable=True) # YYYY-MM-DD
+    next_episode_air_date = Column(String, nullable=True) # YYYY-MM-DD, refresh once it has passed
+    seasons_refreshed_at = Column(DateTime(timezone=True), nullable=True)
+
+    seasons = relationship("TvSeason", back_populates="show", order_by="TvSeason.season_number", cascade="all, delete-orphan")
+
+class TvSeason(Base):
+    __tablename__ = "tv_seasons"
+    __table_args__ = (
+        UniqueConstraint('title_id', 'season_number', name='uix_tv_seasons_title_season'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    title_id = Column(Integer, ForeignKey("titles.id"), index=True)
+    season_number = Column(Integer) # 0 = specials
+    episode_count = Column(Integer, default=0)
+    air_date = Column(String, nullable=True)
+
+    show = relationship("Title", back_populates="seasons")
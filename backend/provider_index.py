@@ -0,0 +1,176 @@
+"""
+Provider resolution: which TMDB watch providers a subscription service stands for.
+
+One place maps subscription service names to TMDB provider ID sets. Per region
+an index is built once (and rebuilt every INDEX_TTL, or after PARTIAL_INDEX_TTL
+if TMDB's provider list couldn't be fetched) from:
+  - the curated PROVIDER_IDS_MAP below (ID matches that names alone can't find),
+  - TMDB's provider list for the region (every provider whose normalized name
+    contains the service name),
+  - the region's `Service` rows, which are resolved up front.
+
+A SubscriptionMatcher compiles one user's subscriptions against that index into
+a provider_id -> subscriptions dict, so "which sub covers these providers" is
+one dict lookup per provider instead of subs x providers x map-entry substring
+loops for every candidate title.
+"""
+import re
+import threading
+import time
+import models
+import tmdb_client
+
+# Subscription service name -> TMDB provider id(s)
+PROVIDER_IDS_MAP = {
+    "netflix": "8",
+    "hulu": "15",
+    "amazon prime video": "9",
+    "disney plus": "337",
+    "max": "384|312",
+    "peacock": "386",
+    "apple tv plus": "350",
+    "apple tv+": "350",  # Exact match for DB Name
+    "paramount plus": "83|531",
+    "crunchyroll": "283",
+    "hotstar": "122",
+    "disney+ hotstar": "122",
+    "jiocinema": "220",
+    "jiohotstar": "122|220"
+}
+
+# Rebuild a region's index after this long (picks up new Service rows / TMDB providers)
+INDEX_TTL = 6 * 3600
+# An index built without TMDB's provider list (fetch failed / no API key) is retried sooner
+PARTIAL_INDEX_TTL = 60
+
+_indexes = {}  # region -> (RegionIndex, expires_at)
+_lock = threading.Lock()
+
+
+def normalize(name: str) -> str:
+    """'Disney+ Hotstar' -> 'disney plus hotstar', 'Apple TV+' -> 'apple tv plus'."""
+    name = (name or "").lower().replace("+", " plus ")
+    return " ".join(re.sub(r"[^a-z0-9 ]", " ", name).split())
+
+
+_CURATED = [(normalize(k), frozenset(int(i) for i in v.split("|"))) for k, v in PROVIDER_IDS_MAP.items()]
+_CURATED_EXACT = {}
+for _key, _ids in _CURATED:
+    _CURATED_EXACT.setdefault(_key, _ids)
+
+
+def _names_overlap(a: str, b: str) -> bool:
+    return bool(a) and bool(b) and (a in b or b in a)
+
+
+class RegionIndex:
+    def __init__(self, region: str, tmdb_providers: list = None, service_names=()):
+        self.region = region
+        # normalized TMDB provider name -> provider ids carrying it
+        self._tmdb_names = {}
+        for p in tmdb_providers or []:
+            if p.get("provider_id") is None:
+                continue
+            self._tmdb_names.setdefault(normalize(p.get("provider_name")), set()).add(int(p["provider_id"]))
+        self.known_provider_ids = frozenset(pid for ids in self._tmdb_names.values() for pid in ids)
+        self._resolved = {}
+        for name in service_names:
+            self.provider_ids(name)
+
+    def provider_ids(self, service_name: str) -> frozenset:
+        """TMDB provider ids a subscription service corresponds to (memoized per name)."""
+        key = normalize(service_name)
+        ids = self._resolved.get(key)
+        if ids is None:
+            found = set(_CURATED_EXACT.get(key, ()))
+            if not found:
+                for k, v in _CURATED:
+                    if _names_overlap(k, key):
+                        found |= v
+                        break
+            # Provider names that contain the service name ("Netflix basic with Ads" for "Netflix").
+            # Not the reverse: "Apple TV" (the store) must not resolve for "Apple TV+".
+            for name, pids in self._tmdb_names.items():
+                if key and key in name:
+                    found |= pids
+            ids = frozenset(found)
+            self._resolved[key] = ids
+        return ids
+
+
+def get_index(db, region: str = "US") -> RegionIndex:
+    """The (cached) index for a region, seeded from its Service rows and TMDB's provider list."""
+    region = region or "US"
+    entry = _indexes.get(region)
+    if entry and time.time() < entry[1]:
+        return entry[0]
+    with _lock:
+        entry = _indexes.get(region)
+        if entry and time.time() < entry[1]:
+            return entry[0]
+        service_names = [row[0] for row in db.query(models.Service.name).filter(models.Service.country == region).all()]
+        tmdb_providers = tmdb_client.get_provider_list(region)
+        index = RegionIndex(region, tmdb_providers, service_names)
+        _indexes[region] = (index, time.time() + (INDEX_TTL if tmdb_providers else PARTIAL_INDEX_TTL))
+        return index
+
+
+def invalidate(region: str = None):
+    """Drop cached indexes (all regions by default), e.g. after editing services."""
+    with _lock:
+        if region:
+            _indexes.pop(region, None)
+        else:
+            _indexes.clear()
+
+
+class SubscriptionMatcher:
+    """One user's subscriptions, precompiled against a RegionIndex."""
+
+    def __init__(self, subscriptions, index: RegionIndex):
+        self.subscriptions = list(subscriptions)
+        self.index = index
+        self._by_provider = {}
+        for sub in self.subscriptions:
+            for pid in index.provider_ids(sub.service_name):
+                subs = self._by_provider.setdefault(pid, [])
+                if sub not in subs:
+                    subs.append(sub)
+        self._names = [(normalize(sub.service_name), sub) for sub in self.subscriptions]
+        self.provider_ids = frozenset(self._by_provider)
+
+    def subs_for(self, provider: dict) -> list:
+        """Subscriptions covering one TMDB provider entry ({"provider_id", "provider_name"})."""
+        pid = provider.get("provider_id")
+        if pid is not None and int(pid) in self._by_provider:
+            return self._by_provider[int(pid)]
+        if pid is not None and int(pid) in self.index.known_provider_ids:
+            return []  # name matches for known providers are already folded into the id sets
+        # Provider missing from TMDB's regional list (or a bare name): fall back to name matching
+        name = normalize(provider.get("provider_name"))
+        return [sub for key, sub in self._names if _names_overlap(key, name)]
+
+    def covering(self, providers: list) -> list:
+        """Distinct subscriptions covering any of the providers, in provider display order."""
+        found = []
+        for provider in providers or []:
+            for sub in self.subs_for(provider):
+                if sub not in found:
+                    found.append(sub)
+        return found
+
+    def first(self, providers: list):
+        """First subscription (in provider display order) that covers the title, or None."""
+        for provider in providers or []:
+            subs = self.subs_for(provider)
+            if subs:
+                return subs[0]
+        return None
+
+    def provider_string(self):
+        """Pipe-joined provider ids for TMDB's with_watch_providers, or None without subscriptions."""
+        return "|".join(str(pid) for pid in sorted(self.provider_ids)) or None
+
+
+def matcher_for(db, subscriptions, region: str = "US") -> SubscriptionMatcher:
+    return SubscriptionMatcher(subscriptions, get_index(db, region))
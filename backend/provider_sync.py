@@ -0,0 +1,200 @@
+"""
+Incremental watch-provider sync driven by TMDB's changes feed.
+
+Instead of re-querying every title, the daily job reads /movie/changes and
+/tv/changes since the last run and only refetches providers for titles that
+changed AND that someone cares about (a watchlist item or a cached
+recommendation) and rewrites their rows in the shared availability store
+(availability.py). Tracked titles that did not change are marked fresh (and
+their tmdb_cache entry re-armed), so the request path keeps answering from the
+table without a live lookup. Tracked titles with no availability yet are seeded.
+
+Each successful feed read is written to PROVIDER_SYNC_SNAPSHOT_PATH; runs with
+offline=True (or without a TMDB key) replay that snapshot instead. Offline runs
+can't refetch, so changed titles are just marked stale and reload on their next
+lookup, and nothing else is extended.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+import models
+import availability
+import cache_codec
+import tmdb_cache
+import tmdb_client
+from config import settings
+
+STATE_NAME = "provider_changes"
+MEDIA_TYPES = ("movie", "tv")
+
+# TMDB only serves the changes feed for windows of up to 14 days
+MAX_WINDOW_DAYS = 14
+
+
+def _snapshot_path() -> str:
+    path = settings.PROVIDER_SYNC_SNAPSHOT_PATH
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+    return path
+
+
+def _load_state(db: Session) -> dict:
+    row = db.query(models.SyncState).filter(models.SyncState.name == STATE_NAME).first()
+    if not row or not row.value:
+        return {}
+    try:
+        return json.loads(row.value)
+    except ValueError:
+        return {}
+
+
+def _save_state(db: Session, state: dict):
+    row = db.query(models.SyncState).filter(models.SyncState.name == STATE_NAME).first()
+    if not row:
+        row = models.SyncState(name=STATE_NAME)
+        db.add(row)
+    row.value = json.dumps(state)
+    db.commit()
+
+
+def _sync_window(state: dict, today):
+    """[start, end] dates to read: from the last successful run up to today, capped at 14 days."""
+    start = today - timedelta(days=1)
+    last = state.get("last_end_date")
+    if last:
+        try:
+            start = datetime.strptime(last, "%Y-%m-%d").date()
+        except ValueError:
+            pass
+    start = max(start, today - timedelta(days=MAX_WINDOW_DAYS))
+    return start, today
+
+
+def tracked_titles(db: Session) -> set:
+    """(media_type, tmdb_id) for every title in any watchlist or any cached recommendation."""
+    titles = set()
+    rows = db.query(models.WatchlistItem.media_type, models.WatchlistItem.tmdb_id).distinct().all()
+    for media_type, tmdb_id in rows:
+        if media_type in MEDIA_TYPES and tmdb_id:
+            titles.add((media_type, int(tmdb_id)))
+
+    rows = db.query(
+        models.RecommendationCache.payload, models.RecommendationCache.schema_version, models.RecommendationCache.data
+    ).yield_per(200)
+    for row in rows:
+        recs = cache_codec.decode(*row)
+        for rec in recs if isinstance(recs, list) else []:
+            if not isinstance(rec, dict):
+                continue
+            if rec.get("tmdb_id") and rec.get("media_type") in MEDIA_TYPES:
+                titles.add((rec["media_type"], int(rec["tmdb_id"])))
+            # Watch Now groups nest watchlist-shaped items ({"id": tmdb_id, ...})
+            for item in rec.get("items") or []:
+                if isinstance(item, dict) and item.get("id") and item.get("media_type") in MEDIA_TYPES:
+                    titles.add((item["media_type"], int(item["id"])))
+    return titles
+
+
+def _read_feed(start, end) -> dict:
+    """{media_type: set(ids)} from TMDB, or None if any feed could not be read."""
+    feed = {}
+    for media_type in MEDIA_TYPES:
+        ids = tmdb_client.get_changed_ids(media_type, start.isoformat(), end.isoformat())
+        if ids is None:
+            return None
+        feed[media_type] = ids
+    return feed
+
+
+def _write_snapshot(feed: dict, start, end):
+    path = _snapshot_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    snapshot = {
+        "generated_at": datetime.utcnow().isoformat(),
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "changes": {m: sorted(ids) for m, ids in feed.items()},
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, path)
+
+
+def _read_snapshot():
+    """(feed, start, end) from the last written snapshot, or None."""
+    try:
+        with open(_snapshot_path()) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    feed = {m: set(snapshot.get("changes", {}).get(m, [])) for m in MEDIA_TYPES}
+    return feed, snapshot.get("start_date"), snapshot.get("end_date")
+
+
+def sync_provider_changes(db: Session, offline: bool = False) -> dict:
+    """
+    Run one incremental sync. Returns a summary dict (counts per step).
+    Safe to re-run: the cursor only advances after a complete feed read.
+    """
+    state = _load_state(db)
+    today = datetime.utcnow().date()
+    live = not offline and settings.TMDB_API_KEY and settings.TMDB_API_KEY != "YOUR_TMDB_API_KEY_HERE"
+
+    feed = None
+    if live:
+        start, end = _sync_window(state, today)
+        with tmdb_client.priority(tmdb_client.BACKGROUND):
+            feed = _read_feed(start, end)
+        if feed is not None:
+            _write_snapshot(feed, start, end)
+            start, end = start.isoformat(), end.isoformat()
+        else:
+            print("[PROVIDER_SYNC] Changes feed unavailable, falling back to the last snapshot")
+            live = False
+    if feed is None:
+        replay = _read_snapshot()
+        if replay is None:
+            return {"status": "skipped", "reason": "changes feed unavailable and no snapshot on disk"}
+        feed, start, end = replay
+
+    tracked = tracked_titles(db)
+    stale = set(availability.stale_titles(db, tracked))
+
+    changed = {t for t in tracked if t[1] in feed.get(t[0], ())}
+    unseeded = stale - changed
+    unchanged = [t for t in tracked if t not in changed and t not in stale]
+
+    # Changed titles: drop the cached payload so the fetch below (or the next lookup) goes upstream
+    tmdb_cache.invalidate_many(tmdb_cache.make_key("providers", *t) for t in changed)
+    refetched = 0
+    if live and (changed or unseeded):
+        with tmdb_client.priority(tmdb_client.BACKGROUND):
+            refetched = availability.refresh(db, changed | unseeded)
+    elif changed:
+        availability.expire(db, changed)
+
+    # Only a fresh feed read proves "unchanged"; a replayed snapshot may be old
+    extended = 0
+    if live:
+        extended = availability.touch(db, unchanged)
+        tmdb_cache.extend([tmdb_cache.make_key("providers", *t) for t in unchanged], "providers")
+
+    summary = {
+        "status": "success",
+        "mode": "live" if live else "snapshot",
+        "window": [start, end],
+        "feed_size": sum(len(ids) for ids in feed.values()),
+        "tracked": len(tracked),
+        "changed": len(changed),
+        "seeded": len(unseeded) if live else 0,
+        "refetched": refetched,
+        "extended": extended,
+    }
+    if live:
+        state["last_end_date"] = end
+    state["last_run"] = summary
+    _save_state(db, state)
+    print(f"[PROVIDER_SYNC] {summary}")
+    return summary
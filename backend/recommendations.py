@@ -3,7 +3,19 @@ from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 import models
 import tmdb_client
+import availability
+import provider_index
+import tv_seasons
+import similar_pipeline
+import candidate_pools
+import cache_deps
+import cache_codec
+import refresh_scheduler
+import user_context
+from config import settings
+from database import SessionLocal
 import random
+import threading
 import time
 
 # Estimated costs for common services (since TMDB doesn't provide this)
@@ -18,8 +30,16 @@ PROVIDER_COSTS = {
     "Paramount Plus": 5.99
 }
 
-def get_cached_data(db: Session, user_id: int, category: str, ttl_hours: int = 24):
-    """Retrieve valid cached data if it exists and is fresh (< ttl_hours old)."""
+def cache_ttl(category: str) -> timedelta:
+    """How long a category's entries are fresh (CACHE_TTL_HOURS, keyed by category prefix)."""
+    hours = settings.CACHE_TTL_HOURS.get(cache_deps.prefix(category), settings.CACHE_DEFAULT_TTL_HOURS)
+    return timedelta(hours=hours)
+
+def _read_cache(db: Session, user_id: int, category: str, ttl: timedelta, max_age: timedelta, check_inputs: bool):
+    """
+    (data, stale, version): data if younger than max_age (stale once past ttl) and its inputs are
+    unchanged. version identifies the entry's content (write time + input stamp, used as ETag).
+    """
     cache_entry = db.query(models.RecommendationCache).filter(
         models.RecommendationCache.user_id == user_id,
         models.RecommendationCache.category == category
@@ -28,51 +48,194 @@ def get_cached_data(db: Session, user_id: int, category: str, ttl_hours: int = 2
     if cache_entry and cache_entry.updated_at:
         updated_at = cache_entry.updated_at.replace(tzinfo=None) if cache_entry.updated_at.tzinfo else cache_entry.updated_at
         age = datetime.utcnow() - updated_at
-        if age < timedelta(hours=ttl_hours):
-            try:
-                return json.loads(cache_entry.data)
-            except:
-                return None
-        else:
+        if age >= max(ttl, max_age):
             print(f"[CACHE] Stale cache for user {user_id} category '{category}' (age: {age}). Will recalculate.")
-    return None
+            return None, False, None
+        if check_inputs:
+            changed = _changed_inputs(db, cache_entry)
+            if changed:
+                print(f"[CACHE] Inputs changed for user {user_id} category '{category}' ({', '.join(changed)}). Will recalculate.")
+                return None, False, None
+        data = cache_codec.decode(cache_entry.payload, cache_entry.schema_version, cache_entry.data)
+        if data is None:
+            return None, False, None
+        return data, age >= ttl, _entry_version(category, updated_at, cache_entry.input_versions)
+    return None, False, None
+
+def _entry_version(category: str, updated_at, input_versions: str) -> str:
+    return f"{category}:{updated_at.isoformat()}:{input_versions}"
+
+def get_cached_data(db: Session, user_id: int, category: str, ttl_hours: float = None, check_inputs: bool = True):
+    """
+    Retrieve valid cached data if it exists and is fresh (younger than ttl_hours, default the
+    category's cache_ttl, and none of the inputs it was computed from changed since).
+    check_inputs=False skips the input check, for fallbacks that prefer an outdated result over none.
+    """
+    ttl = timedelta(hours=ttl_hours) if ttl_hours is not None else cache_ttl(category)
+    data, _, _ = _read_cache(db, user_id, category, ttl, ttl, check_inputs)
+    return data
 
-def set_cached_data(db: Session, user_id: int, category: str, data: list):
-    """Save data to cache."""
-    json_data = json.dumps(data)
-    cache_entry = db.query(models.RecommendationCache).filter(
+def get_cached_or_stale(db: Session, user_id: int, category: str):
+    """
+    Stale-while-revalidate read: (data, stale, version). Entries past their TTL but younger than
+    CACHE_MAX_STALE_HOURS come back with stale=True and a background refresh of the category
+    queued; older ones (or ones whose inputs changed) come back as (None, False, None).
+    """
+    data, stale, version = _read_cache(
+        db, user_id, category, cache_ttl(category), timedelta(hours=settings.CACHE_MAX_STALE_HOURS), True
+    )
+    if data is not None and stale:
+        print(f"[CACHE] Serving stale '{category}' for user {user_id}, refreshing in the background.")
+        refresh_scheduler.schedule(user_id, force=False, category=cache_deps.prefix(category))
+    return data, stale, version
+
+def _changed_inputs(db: Session, cache_entry, current: dict = None) -> list:
+    try:
+        stored = json.loads(cache_entry.input_versions) if cache_entry.input_versions else {}
+    except ValueError:
+        stored = {}
+    if current is None:
+        current = cache_deps.versions(db, cache_entry.user_id)
+    return cache_deps.changed(cache_entry.category, stored, current)
+
+def _upsert(db: Session):
+    """INSERT ... ON CONFLICT for the session's database (SQLite or Postgres)."""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(models.RecommendationCache)
+
+def set_cached_data(db: Session, user_id: int, category: str, data: list, versions: dict = None) -> str:
+    """
+    Save data to cache (one atomic upsert on (user_id, category)). versions is the
+    cache_deps.versions() snapshot taken before the data was computed (default: now), so a
+    write that lands mid-computation still invalidates the result.
+    Returns the stored entry's version (what a later cache hit reports, see _read_cache).
+    """
+    if versions is None:
+        versions = cache_deps.versions(db, user_id)
+    values = {
+        "payload": cache_codec.encode(data),
+        "schema_version": cache_codec.SCHEMA_VERSION,
+        "data": None, # Legacy plain JSON column
+        "input_versions": json.dumps(cache_deps.stamp(category, versions)),
+        "updated_at": datetime.utcnow(),
+    }
+    stmt = _upsert(db).values(user_id=user_id, category=category, **values)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "category"],
+        set_={k: stmt.excluded[k] for k in values},
+    ))
+    db.commit()
+    return _entry_version(category, values["updated_at"], values["input_versions"])
+
+def _cached_payload(db: Session, user_id: int, category: str):
+    """Whatever is stored for a category, however old or outdated (None if nothing usable)."""
+    row = db.query(
+        models.RecommendationCache.payload, models.RecommendationCache.schema_version, models.RecommendationCache.data
+    ).filter(
         models.RecommendationCache.user_id == user_id,
         models.RecommendationCache.category == category
     ).first()
-    
-    if cache_entry:
-        cache_entry.data = json_data
-    else:
-        cache_entry = models.RecommendationCache(
-            user_id=user_id,
-            category=category,
-            data=json_data
-        )
-        db.add(cache_entry)
-        
-    cache_entry.updated_at = datetime.utcnow() # Ensure timestamp update
-    db.commit()
+    return cache_codec.decode(*row) if row else None
 
-def clear_user_cache(db: Session, user_id: int):
-    """Invalidate all recommendation cache for a user."""
-    db.query(models.RecommendationCache).filter(
-        models.RecommendationCache.user_id == user_id
-    ).delete()
+def sweep_cache(db: Session) -> int:
+    """
+    Delete cache rows that can never be served again: older than the category's TTL and
+    CACHE_MAX_STALE_HOURS, written with another schema version, or left by deleted users.
+    """
+    now = datetime.utcnow()
+    deleted = db.query(models.RecommendationCache).filter(
+        (models.RecommendationCache.payload != None) &
+        (models.RecommendationCache.schema_version != cache_codec.SCHEMA_VERSION)
+    ).delete(synchronize_session=False)
+    deleted += db.query(models.RecommendationCache).filter(
+        ~models.RecommendationCache.user_id.in_(db.query(models.User.id))
+    ).delete(synchronize_session=False)
+    # Nothing is served past max(CACHE_MAX_STALE_HOURS, its TTL) - see _read_cache
+    max_stale = timedelta(hours=settings.CACHE_MAX_STALE_HOURS)
+    expired = [
+        row_id for row_id, category, updated_at in db.query(
+            models.RecommendationCache.id, models.RecommendationCache.category, models.RecommendationCache.updated_at
+        ).filter(
+            (models.RecommendationCache.updated_at == None) | (models.RecommendationCache.updated_at < now - max_stale)
+        ).all()
+        if updated_at is None or updated_at.replace(tzinfo=None) < now - max(max_stale, cache_ttl(category))
+    ]
+    for i in range(0, len(expired), 500):
+        deleted += db.query(models.RecommendationCache).filter(
+            models.RecommendationCache.id.in_(expired[i:i + 500])
+        ).delete(synchronize_session=False)
     db.commit()
+    return deleted
+
+# --- Single-flight computation ---
+# One computation per (user, cache key) at a time in this process: the first caller (request
+# or refresh job) computes and saves, concurrent callers get the stored value if there is one
+# or wait for the leader's result (up to SINGLE_FLIGHT_WAIT_SECONDS, then compute themselves).
+# Keys carry the region ("dashboard_IN").
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.version = None # Cache entry the result was stored as (see set_cached_data)
+        self.error = None
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+def _single_flight(user_id: int, cache_key: str, compute, stale=None, cache_status: dict = None):
+    """
+    compute(status) (which caches its own result and puts the stored entry's "version" into
+    status) unless one is already running for the key. Followers return stale() if it gives a
+    value, else wait for the leader's result (and its version, into cache_status); a leader that
+    doesn't finish within SINGLE_FLIGHT_WAIT_SECONDS is no longer waited for.
+    """
+    status = cache_status if cache_status is not None else {}
+    key = (user_id, cache_key)
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        previous = stale() if stale else None
+        if previous is not None:
+            print(f"[CACHE] '{cache_key}' for user {user_id} is being computed. Serving stored value.")
+            return previous
+        print(f"[CACHE] '{cache_key}' for user {user_id} is being computed. Waiting for it...")
+        if not flight.done.wait(timeout=settings.SINGLE_FLIGHT_WAIT_SECONDS):
+            print(f"[CACHE] '{cache_key}' for user {user_id} still computing after {settings.SINGLE_FLIGHT_WAIT_SECONDS}s. Computing here.")
+            return compute(status)
+        if flight.error is not None:
+            raise flight.error
+        if flight.version:
+            status["version"] = flight.version
+        return flight.result
+
+    try:
+        flight.result = compute(status)
+        flight.version = status.get("version")
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
 
 def refresh_recommendations(db: Session, user_id: int, force: bool = False, category: str = None):
     """
     Background task to re-calculate and cache all recommendations.
-    If force is False, only refreshes if cache is missing or older than 24 hours.
+    If force is False, only refreshes if cache is missing, past its TTL or outdated by an input change.
     category: 'dashboard' or 'similar' (None = both)
     """
     # [FIX] Need user country to generate correct cache keys and content
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = db.get(models.User, user_id)
     if not user:
         print(f"[REFRESH] User {user_id} not found. Skipping.")
         return
@@ -80,48 +243,42 @@ def refresh_recommendations(db: Session, user_id: int, force: bool = False, cate
     country = user.country or "US"
     print(f"--- [REFRESH] Checking recommendations for user {user_id} ({country}) (force={force}, cat={category}) ---")
     
+    # Refreshes yield to interactive TMDB traffic (search, details, AI enrichment)
+    with tmdb_client.priority(tmdb_client.BACKGROUND):
+        _refresh_categories(db, user_id, country, force, category)
+
+def _needs_refresh(db: Session, user_id: int, cache_key: str, versions: dict) -> bool:
+    """Cache entry missing, past its TTL or computed from inputs that changed since."""
+    cache_entry = db.query(models.RecommendationCache).filter(
+        models.RecommendationCache.user_id == user_id,
+        models.RecommendationCache.category == cache_key
+    ).first()
+    if not cache_entry or not cache_entry.updated_at:
+        return True
+    updated_at = cache_entry.updated_at.replace(tzinfo=None) if cache_entry.updated_at.tzinfo else cache_entry.updated_at
+    if datetime.utcnow() - updated_at > cache_ttl(cache_key):
+        return True
+    return bool(_changed_inputs(db, cache_entry, versions))
+
+def _refresh_categories(db: Session, user_id: int, country: str, force: bool, category: str = None):
     try:
+        versions = cache_deps.versions(db, user_id)
+        due = [
+            cat for cat in ("dashboard", "similar")
+            if category in [None, cat] and (force or _needs_refresh(db, user_id, f"{cat}_{country}", versions))
+        ]
+        # One context for both categories, loaded after the version snapshot
+        ctx = user_context.load(db, user_id, seasons=True) if due else None
+
         # 1. Refresh Dashboard (Trending/Watch Now)
-        if category in [None, "dashboard"]:
-            cache_key = f"dashboard_{country}"
-            should_refresh = force
-            if not force:
-                cache_entry = db.query(models.RecommendationCache).filter(
-                    models.RecommendationCache.user_id == user_id,
-                    models.RecommendationCache.category == cache_key
-                ).first()
-                if cache_entry and cache_entry.updated_at:
-                    updated_at = cache_entry.updated_at.replace(tzinfo=None) if cache_entry.updated_at.tzinfo else cache_entry.updated_at
-                    if datetime.utcnow() - updated_at > timedelta(hours=24):
-                        should_refresh = True
-                else:
-                    should_refresh = True
-            
-            if should_refresh:
-                print(f"[REFRESH] Recalculating Dashboard ({country}) for user {user_id}...")
-                dashboard_recs = calculate_dashboard_recommendations(db, user_id, country)
-                set_cached_data(db, user_id, cache_key, dashboard_recs)
+        if "dashboard" in due:
+            print(f"[REFRESH] Recalculating Dashboard ({country}) for user {user_id}...")
+            _single_flight(user_id, f"dashboard_{country}", lambda status: _compute_dashboard(db, user_id, country, versions, ctx, cache_status=status))
 
         # 2. Refresh Similar Content
-        if category in [None, "similar"]:
-            cache_key = f"similar_{country}"
-            should_refresh = force
-            if not force:
-                cache_entry = db.query(models.RecommendationCache).filter(
-                    models.RecommendationCache.user_id == user_id,
-                    models.RecommendationCache.category == cache_key
-                ).first()
-                if cache_entry and cache_entry.updated_at:
-                    updated_at = cache_entry.updated_at.replace(tzinfo=None) if cache_entry.updated_at.tzinfo else cache_entry.updated_at
-                    if datetime.utcnow() - updated_at > timedelta(hours=24):
-                        should_refresh = True
-                else:
-                    should_refresh = True
-            
-            if should_refresh:
-                print(f"[REFRESH] Recalculating Similar Content ({country}) for user {user_id}...")
-                similar_recs = calculate_similar_content(db, user_id, country)
-                set_cached_data(db, user_id, cache_key, similar_recs)
+        if "similar" in due:
+            print(f"[REFRESH] Recalculating Similar Content ({country}) for user {user_id}...")
+            _single_flight(user_id, f"similar_{country}", lambda status: _compute_similar(db, user_id, country, versions=versions, ctx=ctx, cache_status=status))
         
         print(f"--- [REFRESH] Completed for user {user_id} ---")
     except Exception as e:
@@ -129,130 +286,294 @@ def refresh_recommendations(db: Session, user_id: int, force: bool = False, cate
         import traceback
         traceback.print_exc()
 
-def get_dashboard_recommendations(db: Session, user_id: int):
+def get_dashboard_recommendations(db: Session, user_id: int, cache_status: dict = None):
     """
     Fast recommendations: Watch Now (on your subs) and Cancel (unused subs).
-    Tries cache first, then calculates if missing.
+    Tries cache first (stale-while-revalidate, see get_cached_or_stale), then calculates if
+    missing. cache_status, if given, gets "stale" (a stale entry was served) and "version" (the
+    served entry's content version; for a fresh result, the entry it was stored as).
     """
-    # Context (fetch here to key cache)
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    # Context (fetch here to key cache; usually the request's already-loaded user)
+    user = db.get(models.User, user_id)
     country = user.country if user and user.country else "US"
     
-    cached = get_cached_data(db, user_id, f"dashboard_{country}")
+    cache_key = f"dashboard_{country}"
+    cached, stale, version = get_cached_or_stale(db, user_id, cache_key)
     if cached:
         # Self-healing: if cached items contain legacy string formats, invalidate and recalculate!
-        has_legacy_format = False
-        for rec in cached:
-            if rec.get("type") == "watch_now":
-                for item in rec.get("items", []):
-                    if isinstance(item, str):
-                        has_legacy_format = True
-                        break
-            if has_legacy_format:
-                break
-        
-        if not has_legacy_format:
+        if not _has_legacy_items(cached):
+            if cache_status is not None:
+                cache_status.update(stale=stale, version=version)
             return cached
-        else:
-            print(f"[CACHE] Detected legacy string-formatted items in production cache for user {user_id}. Self-healing...")
-            clear_user_cache(db, user_id)
-
-    recs = calculate_dashboard_recommendations(db, user_id, country)
-    
+        print(f"[CACHE] Detected legacy string-formatted items in production cache for user {user_id}. Self-healing...")
+
+    def stored_fallback():
+        previous = _cached_payload(db, user_id, cache_key)
+        return previous if previous and not _has_legacy_items(previous) else None
+
+    return _single_flight(
+        user_id, cache_key, lambda status: _compute_dashboard(db, user_id, country, cache_status=status),
+        stale=stored_fallback, cache_status=cache_status,
+    )
+
+def _has_legacy_items(recs: list) -> bool:
+    return any(
+        isinstance(item, str)
+        for rec in recs if rec.get("type") == "watch_now"
+        for item in rec.get("items", [])
+    )
+
+def _compute_dashboard(db: Session, user_id: int, country: str, versions: dict = None, ctx=None, cache_status: dict = None):
+    # Snapshot before reading inputs: inputs changed while we compute leave the result stale
+    if versions is None:
+        versions = cache_deps.versions(db, user_id)
+    recs = calculate_dashboard_recommendations(db, user_id, country, ctx=ctx)
     if recs:
-        set_cached_data(db, user_id, f"dashboard_{country}", recs)
-        
+        version = set_cached_data(db, user_id, f"dashboard_{country}", recs, versions)
+        if cache_status is not None:
+            cache_status["version"] = version
     return recs
 
-def calculate_dashboard_recommendations(db: Session, user_id: int, country: str):
-    # 0. Get User Context (country is now passed in)
-
-    # 1. Get User's Watchlist
-    watchlist_query = db.query(models.WatchlistItem).filter(models.WatchlistItem.user_id == user_id).all()
-    exclude_ids = {item.tmdb_id for item in watchlist_query}
+def _is_active(status: str, current_episode: int, total_episodes: int) -> bool:
+    """Whether a watchlist item belongs in Watch Now (plan_to_watch, watching, paused, and in-progress watched)."""
+    if status in ['plan_to_watch', 'watching', 'paused']:
+        return True
+    if status == 'watched':
+        # Include completed status ONLY if they have active progress they haven't finished (e.g. rewatching or partial progress)
+        is_finished = (total_episodes and total_episodes > 0 and
+                       current_episode and current_episode >= total_episodes)
+        return not is_finished
+    return False
+
+def _priority_score(status: str, current_episode: int, total_episodes: int, user_rating: int, vote_average: float, item_id: int) -> float:
+    """Watch Now order: active progress first, and closest to finish at the absolute top."""
+    score = 0
     
-    # TV metadata auto-repair for legacy entries (to enable progress bars and accurate math)
-    for item in watchlist_query:
-        if item.media_type == "tv" and (not item.total_episodes or item.total_episodes == 0):
-            try:
-                details = tmdb_client.get_details("tv", item.tmdb_id)
-                if details:
-                    item.total_seasons = details.get("number_of_seasons", 0)
-                    item.total_episodes = details.get("number_of_episodes", 0)
-                    db.commit()
-            except Exception as e:
-                print(f"[REPAIR] Failed to enrich TV details for {item.title}: {e}")
-
-    # Filter watchlist for active content (plan_to_watch, watching, paused, and in-progress watched)
-    raw_watchlist = []
-    for item in watchlist_query:
-        if item.status in ['plan_to_watch', 'watching', 'paused']:
-            raw_watchlist.append(item)
-        elif item.status == 'watched':
-            # Include completed status ONLY if they have active progress they haven't finished (e.g. rewatching or partial progress)
-            is_finished = (item.total_episodes and item.total_episodes > 0 and 
-                           item.current_episode and item.current_episode >= item.total_episodes)
-            if not is_finished:
-                raw_watchlist.append(item)
-                
-    # Upgraded Dynamic Priority Scoring: Put active progress first, and closest to finish at the absolute top!
-    def get_watchlist_priority_score(item):
-        score = 0
+    # A. Started Content Primary Boost (+100,000): Any started show goes above unstarted ones
+    if current_episode and current_episode > 0:
+        score += 100000
         
-        # A. Started Content Primary Boost (+100,000): Any started show goes above unstarted ones
-        if item.current_episode and item.current_episode > 0:
-            score += 100000
-            
-            # Completion gravity: bubble items nearing completion (+10,000 maximum boost)
-            if item.total_episodes and item.total_episodes > 0:
-                progress_ratio = item.current_episode / item.total_episodes
-                score += progress_ratio * 10000
-            else:
-                # Baseline for unknown total episodes
-                score += 2000
-                
-        # B. Status Secondary Boost: tie-breaker favoring watching over paused over plan_to_watch
-        if item.status == "watching":
-            score += 5000
-        elif item.status == "paused":
+        # Completion gravity: bubble items nearing completion (+10,000 maximum boost)
+        if total_episodes and total_episodes > 0:
+            progress_ratio = current_episode / total_episodes
+            score += progress_ratio * 10000
+        else:
+            # Baseline for unknown total episodes
             score += 2000
-        elif item.status == "plan_to_watch":
-            score += 1000
-            
-        # C. Quality Ratings: personal user ratings or TMDB scores (+1,000 maximum boost)
-        if item.user_rating:
-            score += item.user_rating * 100 # e.g. User rating 10 = +1000 pts
-        elif item.vote_average:
-            score += item.vote_average * 20 # e.g. TMDB community 8.5 = +170 pts
             
-        # D. Freshness tie-breaker: favor most recently added database entries (+10 maximum)
-        if item.id:
-            score += item.id * 0.01
-            
-        return score
+    # B. Status Secondary Boost: tie-breaker favoring watching over paused over plan_to_watch
+    if status == "watching":
+        score += 5000
+    elif status == "paused":
+        score += 2000
+    elif status == "plan_to_watch":
+        score += 1000
         
-    watchlist = sorted(raw_watchlist, key=get_watchlist_priority_score, reverse=True)
-    
-    # 2. Get User's Active OTT Subscriptions
+    # C. Quality Ratings: personal user ratings or TMDB scores (+1,000 maximum boost)
+    if user_rating:
+        score += user_rating * 100 # e.g. User rating 10 = +1000 pts
+    elif vote_average:
+        score += vote_average * 20 # e.g. TMDB community 8.5 = +170 pts
+        
+    # D. Freshness tie-breaker: favor most recently added database entries (+10 maximum)
+    if item_id:
+        score += item_id * 0.01
+        
+    return score
+
+def _entry_score(entry: dict) -> float:
+    return _priority_score(entry.get("status"), entry.get("current_episode"), entry.get("total_episodes"),
+                           entry.get("user_rating"), entry.get("vote_average"), entry.get("dbId"))
+
+def _watch_now_entry(item) -> dict:
+    """A watchlist item as shown in a Watch Now group."""
+    # Precise TV season-specific progress & absolute counts, from the stored season structure
+    tv_progress = {"current_season_episodes": 0, "absolute_episode_progress": 0, "progress_pct": 0, "seasons": []}
+    if item.media_type == "tv" and item.catalog is not None:
+        try:
+            tv_progress = tv_seasons.progress(item.catalog.seasons, item.current_season, item.current_episode, item.total_episodes)
+        except Exception as e:
+            print(f"[RECS_PROGRESS] TV metrics failed for {item.title}: {e}")
+
+    return {
+        "id": item.tmdb_id, # Frontend MediaItem expects id to be TMDB ID
+        "dbId": item.id,     # Database ID for actions
+        "title": item.title,
+        "media_type": item.media_type,
+        "poster_path": item.poster_path,
+        "vote_average": item.vote_average,
+        "status": item.status,
+        "user_rating": item.user_rating,
+        "current_season": item.current_season,
+        "current_episode": item.current_episode,
+        "total_seasons": item.total_seasons,
+        "total_episodes": item.total_episodes,
+        "notes": item.notes,
+        # Precise TV fields
+        "current_season_episodes": tv_progress["current_season_episodes"],
+        "absolute_episode_progress": tv_progress["absolute_episode_progress"],
+        "progress_pct": tv_progress["progress_pct"],
+        "seasons": tv_progress["seasons"]
+    }
+
+def is_watch_now_candidate(db: Session, item_id: int, user_id: int) -> bool:
+    """
+    Whether a watchlist item is currently active, i.e. a Watch Now candidate whether or not it is
+    shown (read before updating it, for patch_dashboard).
+    """
+    item = db.query(models.WatchlistItem).filter(
+        models.WatchlistItem.id == item_id, models.WatchlistItem.user_id == user_id
+    ).first()
+    return bool(item and _is_active(item.status, item.current_episode, item.total_episodes))
+
+def _covering_services(db: Session, user_id: int, country: str, item) -> set:
+    """
+    Names of the user's OTT subscriptions covering item, from stored availability (no TMDB).
+    None if the title's availability was never fetched (a recompute would fetch it).
+    """
+    title = (item.media_type, item.tmdb_id)
+    if not availability.fetched_at(db, [title]):
+        return None
     subscriptions = db.query(models.Subscription).filter(
         models.Subscription.user_id == user_id,
         models.Subscription.is_active == True,
-        models.Subscription.category == 'OTT',
-        models.Subscription.country == country
+        models.Subscription.category == "OTT",
+        models.Subscription.country == country,
     ).all()
+    providers = availability.region_providers(db, [title], region=country, fetch_missing=False)[title]
+    matcher = provider_index.matcher_for(db, subscriptions, country)
+    return {sub.service_name for sub in matcher.covering(providers.get("flatrate", []))}
+
+def patch_dashboard(db: Session, user_id: int, item: models.WatchlistItem, changed: str, was_active: bool):
+    """
+    Apply one item's progress or status change (changed = "progress" / "status", already
+    committed and bumped) to the cached dashboard in place: its Watch Now entry is rebuilt
+    from the stored season structure and re-sorted within its group, and the entry is
+    re-stamped so the bump doesn't invalidate it. No TMDB calls.
+
+    An item that isn't shown is placed from stored availability: uncovered by the user's
+    subscriptions it never appears; otherwise it is ranked against the 5th entry of its
+    service's group (entering the top 5 or staying cut), and the group's size is adjusted.
+
+    Returns the patched dashboard, or None when the change can't be applied exactly (no
+    fresh cache, a shown item leaves Watch Now, a title cut from the group could now outrank
+    it, the item's service group doesn't exist yet or several subscriptions cover it, or its
+    availability was never fetched). The entry is then left to dependency invalidation and
+    recomputed on the next read.
+    """
+    user = db.get(models.User, user_id)
+    country = user.country if user and user.country else "US"
+    cache_entry = db.query(models.RecommendationCache).filter(
+        models.RecommendationCache.user_id == user_id,
+        models.RecommendationCache.category == f"dashboard_{country}"
+    ).first()
+    if not cache_entry or not cache_entry.updated_at:
+        return None
+    updated_at = cache_entry.updated_at.replace(tzinfo=None) if cache_entry.updated_at.tzinfo else cache_entry.updated_at
+    if datetime.utcnow() - updated_at > cache_ttl(cache_entry.category):
+        return None
+
+    # The entry must have been current right before this change: exactly one bump of `changed`
+    current = cache_deps.versions(db, user_id)
+    try:
+        stored = json.loads(cache_entry.input_versions) if cache_entry.input_versions else {}
+    except ValueError:
+        return None
+    recs = cache_codec.decode(cache_entry.payload, cache_entry.schema_version, cache_entry.data)
+    if recs is None:
+        return None
+    if cache_deps.changed(cache_entry.category, stored, current) != [changed] or \
+            current.get(changed, 0) != stored.get(changed, 0) + 1:
+        return None
+
+    now_active = _is_active(item.status, item.current_episode, item.total_episodes)
+    group, index = None, None
+    for rec in recs:
+        if rec.get("type") != "watch_now":
+            continue
+        for i, entry in enumerate(rec.get("items", [])):
+            if isinstance(entry, dict) and entry.get("dbId") == item.id:
+                group, index = rec, i
+                break
+        if group:
+            break
+
+    if group is None:
+        # Not shown before; nothing to do if it wasn't (and still isn't) a Watch Now candidate
+        if was_active or now_active:
+            services = _covering_services(db, user_id, country, item)
+            if services is None or len(services) > 1:
+                return None # Unknown availability, or spread across groups by load: only a recompute knows
+            if services:
+                group = next((rec for rec in recs if rec.get("type") == "watch_now" and rec.get("service_name") in services), None)
+                if group is None:
+                    return None # Its subscription would leave "Cancel Unused"
+                items = group["items"]
+                size = group.get("score", 0) - 100 # Group size before the top-5 cut
+                if (was_active and size <= len(items)) or any(e.get("title") == item.title for e in items):
+                    return None # Cache doesn't match the shown/cut split, or a same-title entry hides it
+                if now_active:
+                    new_entry = _watch_now_entry(item)
+                    if len(items) < 5 or _entry_score(new_entry) > _entry_score(items[-1]):
+                        items.append(new_entry)
+                        items.sort(key=_entry_score, reverse=True)
+                        del items[5:]
+                group["score"] = 100 + size + int(now_active) - int(was_active)
+            # No subscription covers it: it can't appear either way
+    else:
+        if not now_active:
+            return None # Leaves its group (and maybe frees a subscription for "Cancel Unused")
+        items = group["items"]
+        new_entry = _watch_now_entry(item)
+        truncated = group.get("score", 0) - 100 > len(items) # score = 100 + group size before the top-5 cut
+        if truncated and _entry_score(new_entry) < _entry_score(items[index]):
+            return None
+        items[index] = new_entry
+        items.sort(key=_entry_score, reverse=True)
+
+    # Conditional on the stamp we read, so a concurrent recompute's write is never clobbered
+    patched = db.query(models.RecommendationCache).filter(
+        models.RecommendationCache.id == cache_entry.id,
+        models.RecommendationCache.input_versions == cache_entry.input_versions,
+    ).update({
+        "payload": cache_codec.encode(recs),
+        "schema_version": cache_codec.SCHEMA_VERSION,
+        "data": None,
+        "input_versions": json.dumps(cache_deps.stamp(cache_entry.category, current)),
+        "updated_at": cache_entry.updated_at, # Keep the original age: trending sections still expire on time
+    }, synchronize_session=False)
+    db.commit()
+    return recs if patched else None
+
+def calculate_dashboard_recommendations(db: Session, user_id: int, country: str, ctx=None):
+    # 0. Get User Context (country is now passed in; ctx must be loaded with seasons)
+    ctx = ctx or user_context.load(db, user_id, seasons=True)
+    if ctx is None:
+        return [] # User no longer exists (stale job / refresh)
+
+    # 1. Get User's Watchlist
+    watchlist_query = ctx.watchlist
+    exclude_ids = {item.tmdb_id for item in watchlist_query}
+    # Season/episode totals and structure come from the shared titles catalog, kept fresh by the
+    # daily catalog job. Shows that have never been fetched are filled once here (per title, batched).
+    tv_seasons.refresh(db, [
+        item.catalog for item in watchlist_query
+        if item.media_type == "tv" and item.catalog is not None and not item.catalog.seasons_refreshed_at
+    ])
+
+    # Filter watchlist for active content (plan_to_watch, watching, paused, and in-progress watched)
+    raw_watchlist = [item for item in watchlist_query if _is_active(item.status, item.current_episode, item.total_episodes)]
+    watchlist = sorted(raw_watchlist, key=lambda item: _priority_score(
+        item.status, item.current_episode, item.total_episodes, item.user_rating, item.vote_average, item.id
+    ), reverse=True)
+    
+    # 2. Get User's Active OTT Subscriptions
+    subscriptions = ctx.ott_subscriptions(country)
     
     # Allow proceeding even without explicit subscriptions to show "Global Trending"
     if not watchlist and not subscriptions:
         pass
 
-    # Helper to get logo
-    def get_service_logo(name, user_country):
-        service = db.query(models.Service).filter(
-            models.Service.name == name,
-            ((models.Service.country == user_country) | (models.Service.country == "US"))
-        ).order_by(models.Service.country == user_country).first()
-        return service.logo_url if service else None
-    
     recommendations = []
 
     # A. "Watch Now" (Requires Subscriptions + Watchlist)
@@ -262,117 +583,27 @@ def calculate_dashboard_recommendations(db: Session, user_id: int, country: str)
     for sub in subscriptions:
         service_watch_list[sub.service_name] = []
 
-    # Map for Provider IDs
-    PROVIDER_IDS_MAP = {
-        "netflix": "8",
-        "hulu": "15", 
-        "amazon prime video": "9",
-        "disney plus": "337",
-        "max": "384|312",
-        "peacock": "386",
-        "apple tv plus": "350",
-        "apple tv+": "350", # Exact match
-        "paramount plus": "83|531",
-        "crunchyroll": "283",
-        "hotstar": "122",
-        "disney+ hotstar": "122",
-        "jiocinema": "220",
-        "jiohotstar": "122|220"
-    }
+    # Subscriptions compiled against the region's provider index (see provider_index.py)
+    matcher = provider_index.matcher_for(db, subscriptions, country)
+
+
+    # Providers for the whole watchlist from the shared availability table (one query,
+    # TMDB only for titles nobody has checked recently)
+    providers_by_title = availability.region_providers(db, [(i.media_type, i.tmdb_id) for i in watchlist], region=country)
 
     # Process Watchlist for "Watch Now"
     for item in watchlist:
         if item.title in seen_items: continue
         
-        providers = tmdb_client.get_watch_providers(item.media_type, item.tmdb_id, region=country)
+        providers = providers_by_title.get((item.media_type, item.tmdb_id), {})
         if "flatrate" in providers:
-            potential_services = []
-            for provider in providers["flatrate"]:
-                p_name = provider["provider_name"]
-                p_id = str(provider["provider_id"])
-                
-                for sub in subscriptions:
-                    is_match = False
-                    s_name_key = sub.service_name.lower()
-                    mapped_ids = []
-                    
-                    if s_name_key in PROVIDER_IDS_MAP:
-                        mapped_ids = PROVIDER_IDS_MAP[s_name_key].split("|")
-                    else:
-                        for k, v in PROVIDER_IDS_MAP.items():
-                             if k in s_name_key or s_name_key in k:
-                                 mapped_ids = v.split("|")
-                                 break
-                    
-                    if p_id in mapped_ids: is_match = True
-                    elif sub.service_name.lower() in p_name.lower() or p_name.lower() in sub.service_name.lower(): is_match = True
-                        
-                    if is_match: potential_services.append(sub)
+            potential_services = matcher.covering(providers["flatrate"])
             
             if potential_services:
                 target_sub = min(potential_services, key=lambda s: len(service_watch_list[s.service_name]))
                 useful_subscriptions.add(target_sub.id)
                 
-                # Precise TV season-specific progress & absolute counts calculations
-                current_season_episodes = 0
-                absolute_progress = 0
-                progress_pct = 0
-                if item.media_type == "tv":
-                    try:
-                        details = tmdb_client.get_details("tv", item.tmdb_id)
-                        if details and "seasons" in details:
-                            curr_s_num = item.current_season or 1
-                            for s in details["seasons"]:
-                                s_num = s.get("season_number")
-                                ep_count = s.get("episode_count") or 0
-                                
-                                # Skip specials/Season 0 from regular progress counts
-                                if s_num == 0:
-                                    continue
-                                    
-                                if s_num < curr_s_num:
-                                    absolute_progress += ep_count
-                                elif s_num == curr_s_num:
-                                    current_season_episodes = ep_count
-                                    absolute_progress += item.current_episode or 0
-                            
-                            total_eps = item.total_episodes or 0
-                            if total_eps > 0:
-                                progress_pct = min(100, round((absolute_progress / total_eps) * 100))
-                            elif current_season_episodes > 0:
-                                progress_pct = min(100, round((item.current_episode / current_season_episodes) * 100))
-                    except Exception as e:
-                        print(f"[RECS_PROGRESS] TV metrics failed for {item.title}: {e}")
-
-                # Local seasons cache extraction
-                seasons_info = []
-                if item.media_type == "tv" and details and "seasons" in details:
-                    seasons_info = [
-                        {"season_number": s.get("season_number"), "episode_count": s.get("episode_count") or 0}
-                        for s in details.get("seasons", [])
-                        if s.get("season_number", 0) > 0 # Exclude specials
-                    ]
-
-                service_watch_list[target_sub.service_name].append({
-                    "id": item.tmdb_id, # Frontend MediaItem expects id to be TMDB ID
-                    "dbId": item.id,     # Database ID for actions
-                    "title": item.title,
-                    "media_type": item.media_type,
-                    "poster_path": item.poster_path,
-                    "vote_average": item.vote_average,
-                    "status": item.status,
-                    "user_rating": item.user_rating,
-                    "current_season": item.current_season,
-                    "current_episode": item.current_episode,
-                    "total_seasons": item.total_seasons,
-                    "total_episodes": item.total_episodes,
-                    "notes": item.notes,
-                    # Precise TV fields
-                    "current_season_episodes": current_season_episodes,
-                    "absolute_episode_progress": absolute_progress,
-                    "progress_pct": progress_pct,
-                    "seasons": seasons_info
-                })
+                service_watch_list[target_sub.service_name].append(_watch_now_entry(item))
                 seen_items.add(item.title)
 
     for service_name, items in service_watch_list.items():
@@ -380,7 +611,7 @@ def calculate_dashboard_recommendations(db: Session, user_id: int, country: str)
             recommendations.append({
                 "type": "watch_now",
                 "service_name": service_name,
-                "logo_url": get_service_logo(service_name, country),
+                "logo_url": ctx.logo(service_name),
                 "items": items[:5],
                 "reason": f"Included in your {service_name} subscription",
                 "cost": 0, "savings": 0, "score": 100 + len(items)
@@ -392,7 +623,7 @@ def calculate_dashboard_recommendations(db: Session, user_id: int, country: str)
             recommendations.append({
                 "type": "cancel",
                 "service_name": sub.service_name,
-                "logo_url": get_service_logo(sub.service_name, country),
+                "logo_url": ctx.logo(sub.service_name),
                 "items": [],
                 "reason": "No watchlist items found",
                 "cost": 0, "savings": sub.cost, "score": 50 + sub.cost,
@@ -400,25 +631,16 @@ def calculate_dashboard_recommendations(db: Session, user_id: int, country: str)
             })
 
     # C. "Trending" (Provider Specific OR Global)
-    valid_provider_ids = set()
-    for sub in subscriptions:
-        key = sub.service_name.lower()
-        if key in PROVIDER_IDS_MAP: valid_provider_ids.add(PROVIDER_IDS_MAP[key])
-        else:
-            for k, v in PROVIDER_IDS_MAP.items():
-                if k in key or key in k: valid_provider_ids.add(v)
-    
-    provider_string = "|".join(valid_provider_ids) if valid_provider_ids else None
+    provider_string = matcher.provider_string()
     
     with open("debug_recs.log", "a") as f:
         f.write(f"Provider String: {provider_string}\n")
 
     try:
-        # Layer 1: This week's actual trending content (TMDB /trending/week)
-        data_movies = tmdb_client.get_trending("movie", "week")
-        data_tv = tmdb_client.get_trending("tv", "week")
-        trending_movies = [{**x, "media_type": "movie"} for x in data_movies.get("results", [])[:20]]
-        trending_tv    = [{**x, "media_type": "tv"}    for x in data_tv.get("results",    [])[:20]]
+        # Layer 1: This week's actual trending content (shared regional pool, providers attached)
+        trending = candidate_pools.get_many("trending_week", ["movie", "tv"], region=country)
+        trending_movies = trending["movie"][:20]
+        trending_tv    = trending["tv"][:20]
 
         # Interleave movies and TV for variety
         combined_candidates = []
@@ -430,7 +652,7 @@ def calculate_dashboard_recommendations(db: Session, user_id: int, country: str)
             f.write(f"Trending week candidates: {len(combined_candidates)}\n")
 
         def _match_and_append(candidates, seen_titles, count):
-            """Try to match each candidate against user subscriptions and append if matched."""
+            """Try to match each pool entry against user subscriptions and append if matched (in memory)."""
             for item in candidates:
                 if count >= 15: break
                 tmdb_id = item.get("id")
@@ -438,25 +660,14 @@ def calculate_dashboard_recommendations(db: Session, user_id: int, country: str)
                 if tmdb_id in exclude_ids: continue
                 if title in seen_titles: continue
 
-                providers = tmdb_client.get_watch_providers(item.get("media_type"), tmdb_id, region=country)
+                providers = item.get("providers") or {}
                 matched_sub = None
 
-                shuffled_subs = list(subscriptions)
-                import random
-                random.shuffle(shuffled_subs)
-
                 if "flatrate" in providers:
-                    flatrate_ids = [str(p["provider_id"]) for p in providers["flatrate"]]
-                    for sub in shuffled_subs:
-                        s_name = sub.service_name.lower().replace(" ", "")
-                        matched_ids_list = []
-                        for k, v in PROVIDER_IDS_MAP.items():
-                            if k.replace(" ", "") in s_name:
-                                matched_ids_list = v.split("|")
-                                break
-                        if any(pid in flatrate_ids for pid in matched_ids_list):
-                            matched_sub = sub.service_name
-                            break
+                    # Any of the user's covering subscriptions, picked at random for variety
+                    covering = matcher.covering(providers["flatrate"])
+                    if covering:
+                        matched_sub = random.choice(covering).service_name
 
                 if not matched_sub and not provider_string:
                     matched_sub = "Available Globally"
@@ -468,7 +679,7 @@ def calculate_dashboard_recommendations(db: Session, user_id: int, country: str)
                     recommendations.append({
                         "type": "global_trending" if is_global else "trending",
                         "service_name": matched_sub,
-                        "logo_url": get_service_logo(matched_sub.replace("Available on ", "") if "Available on " in matched_sub else matched_sub, country),
+                        "logo_url": ctx.logo(matched_sub.replace("Available on ", "") if "Available on " in matched_sub else matched_sub),
                         "items": [title],
                         "reason": "Trending This Week" if not is_global else "Trending Worldwide",
                         "cost": 0, "savings": 0,
@@ -495,16 +706,9 @@ def calculate_dashboard_recommendations(db: Session, user_id: int, country: str)
         # supplement with provider-filtered discover (popular content on their services)
         if count < 8 and provider_string:
             print(f"[TRENDING] Pass 2: only {count} from trending/week — supplementing with provider-filtered discover")
-            fallback_movies = tmdb_client.discover_media(
-                "movie", sort_by="popularity.desc", min_vote_count=300,
-                with_watch_providers=provider_string, watch_region=country
-            )
-            fallback_tv = tmdb_client.discover_media(
-                "tv", sort_by="popularity.desc", min_vote_count=300,
-                with_watch_providers=provider_string, watch_region=country
-            )
-            fb_movies = [{**x, "media_type": "movie"} for x in fallback_movies.get("results", [])[:15]]
-            fb_tv     = [{**x, "media_type": "tv"}    for x in fallback_tv.get("results",    [])[:15]]
+            fallback = candidate_pools.get_many("popular", ["movie", "tv"], region=country, provider_set=provider_string)
+            fb_movies = fallback["movie"][:15]
+            fb_tv     = fallback["tv"][:15]
             fallback_combined = []
             for i in range(max(len(fb_movies), len(fb_tv))):
                 if i < len(fb_movies): fallback_combined.append(fb_movies[i])
@@ -520,338 +724,51 @@ def calculate_dashboard_recommendations(db: Session, user_id: int, country: str)
     recommendations.sort(key=lambda x: x["score"], reverse=True)
     return recommendations
 
-def get_similar_content(db: Session, user_id: int, force_refresh: bool = False):
+def get_similar_content(db: Session, user_id: int, force_refresh: bool = False, cache_status: dict = None):
     """
     Slow recommendations: Similar content based on watched history.
-    Tries cache first, then calculates if missing.
+    Tries cache first (stale-while-revalidate, see get_cached_or_stale), then calculates if
+    missing. Calculation is bounded by SIMILAR_DEADLINE_SECONDS; sources still running at the
+    deadline finish in the background and re-cache the full result.
+    cache_status, if given, gets "stale" and "version" (see get_dashboard_recommendations).
     """
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = db.get(models.User, user_id)
     country = user.country if user and user.country else "US"
     
+    cache_key = f"similar_{country}"
     if not force_refresh:
-        cached = get_cached_data(db, user_id, f"similar_{country}")
+        cached, stale, version = get_cached_or_stale(db, user_id, cache_key)
         if cached is not None:
+            if cache_status is not None:
+                cache_status.update(stale=stale, version=version)
             return cached
 
-    # Calculate
-    recs = calculate_similar_content(db, user_id, country)
-    
-    if recs:
-        set_cached_data(db, user_id, f"similar_{country}", recs)
-        
+    return _single_flight(
+        user_id, cache_key,
+        lambda status: _compute_similar(db, user_id, country, deadline=settings.SIMILAR_DEADLINE_SECONDS, cache_status=status),
+        stale=None if force_refresh else (lambda: _cached_payload(db, user_id, cache_key)),
+        cache_status=cache_status,
+    )
+
+def _compute_similar(db: Session, user_id: int, country: str, deadline: float = None, versions: dict = None, ctx=None, cache_status: dict = None):
+    if versions is None:
+        versions = cache_deps.versions(db, user_id)
+    saved = {} # id(recs) -> stored entry version
+
+    def save(recs):
+        # Own session: the full result is saved from a pipeline thread after this request returns
+        cache_db = SessionLocal()
+        try:
+            saved[id(recs)] = set_cached_data(cache_db, user_id, f"similar_{country}", recs, versions)
+        finally:
+            cache_db.close()
+
+    # Calculate (save() caches the returned result, then the full one if the deadline cut it short)
+    recs = similar_pipeline.run(db, user_id, country, deadline=deadline, on_complete=save, ctx=ctx)
+    if cache_status is not None and id(recs) in saved:
+        cache_status["version"] = saved[id(recs)]
     return recs
 
 def calculate_similar_content(db: Session, user_id: int, country: str):
-    # 0. Get User Context (Passed in)
-    # user = db.query(models.User).filter(models.User.id == user_id).first()
-    # country = user.country if user and user.country else "US"
-
-    def get_service_logo(name, user_country):
-        service = db.query(models.Service).filter(
-            models.Service.name == name,
-            ((models.Service.country == user_country) | (models.Service.country == "US"))
-        ).order_by(models.Service.country == user_country).first()
-        return service.logo_url if service else None
-
-    watchlist = db.query(models.WatchlistItem).filter(models.WatchlistItem.user_id == user_id).all()
-    subscriptions = db.query(models.Subscription).filter(
-        models.Subscription.user_id == user_id,
-        models.Subscription.is_active == True,
-        models.Subscription.category == 'OTT',
-        models.Subscription.country == country
-    ).all()
-    
-    if not subscriptions:
-        pass # Allow fallbacks
-
-    recommendations = []
-    recommended_ids = set()
-    
-    # --- Strategy A: Interest Discovery (Top Genres) ---
-    interests = db.query(models.UserInterest).filter(models.UserInterest.user_id == user_id).order_by(models.UserInterest.score.desc()).limit(2).all()
-    
-    # FALLBACK: If no explicit interests, derive from Watchlist or Default
-    if not interests:
-        from collections import Counter
-        genre_counter = Counter()
-        for w in watchlist:
-            if w.genre_ids:
-                try:
-                    g_ids = json.loads(w.genre_ids)
-                    if isinstance(g_ids, list):
-                        genre_counter.update(g_ids)
-                except: pass
-        
-        if genre_counter:
-            top_genes = genre_counter.most_common(2) # [(id, count), ...]
-            class MockInterest:
-                def __init__(self, gid): self.genre_id = gid
-            interests = [MockInterest(g[0]) for g in top_genes]
-        else:
-            class MockInterest:
-                def __init__(self, gid): self.genre_id = gid
-            interests = [MockInterest(28), MockInterest(35)]
-    
-    # Map subscription IDs
-    PROVIDER_IDS_MAP = {
-        "netflix": "8",
-        "hulu": "15", 
-        "amazon prime video": "9",
-        "disney plus": "337",
-        "max": "384|312",
-        "peacock": "386",
-        "apple tv plus": "350",
-        "apple tv+": "350", # Exact match
-        "paramount plus": "83|531",
-        "crunchyroll": "283",
-        "hotstar": "122",
-        "disney+ hotstar": "122",
-        "jiocinema": "220",
-        "jiohotstar": "122|220"
-    }
-    
-    valid_provider_ids = set()
-    for sub in subscriptions:
-        key = sub.service_name.lower()
-        if key in PROVIDER_IDS_MAP:
-            valid_provider_ids.add(PROVIDER_IDS_MAP[key])
-        else:
-            for k, v in PROVIDER_IDS_MAP.items():
-                if k in key or key in k: valid_provider_ids.add(v)
-                    
-    provider_string = "|".join(valid_provider_ids) if valid_provider_ids else None
-    
-    available_recs = []
-    explore_recs = []
-    
-    for interest in interests:
-        # 1. Available Content Query
-        data_avail = tmdb_client.discover_media(
-            "movie", 
-            with_genres=str(interest.genre_id), 
-            sort_by="vote_average.desc", 
-            min_vote_count=200, 
-            min_vote_average=6.0,
-            with_watch_providers=provider_string,
-            watch_region=country
-        )
-        
-        items = data_avail.get("results", [])[:20]
-        random.shuffle(items)
-        
-        count = 0
-        for item in items:
-            if count >= 15: break 
-            tmdb_id = item.get("id")
-            if tmdb_id in recommended_ids: continue
-            if any(w.tmdb_id == tmdb_id for w in watchlist): continue
-            
-            providers = tmdb_client.get_watch_providers("movie", tmdb_id, region=country)
-            matched_sub = None
-            if "flatrate" in providers:
-                for p in providers["flatrate"]:
-                    for sub in subscriptions:
-                        if sub.service_name.lower() in p["provider_name"].lower():
-                            matched_sub = sub.service_name
-                            break
-                    if matched_sub: break
-            
-            if matched_sub:
-                available_recs.append({
-                    "type": "discovery",
-                    "service_name": matched_sub,
-                    "logo_url": get_service_logo(matched_sub, country),
-                    "items": [item.get("title")],
-                    "reason": "Included in your subscription",
-                    "score": 90 + item.get("vote_average", 0),
-                    "tmdb_id": tmdb_id,
-                    "media_type": "movie",
-                    "poster_path": item.get("poster_path"),
-                    "vote_average": item.get("vote_average"),
-                    "overview": item.get("overview"),
-                    "original_language": item.get("original_language"),
-                    "genre_ids": item.get("genre_ids", [])
-                })
-                recommended_ids.add(tmdb_id)
-                count += 1
-        
-        # Explore Content (Not on subs)
-        data_explore = tmdb_client.discover_media(
-            "movie",
-            with_genres=str(interest.genre_id),
-            sort_by="vote_average.desc",
-            min_vote_count=500,
-            min_vote_average=7.0,
-            watch_region=country
-        )
-        items_explore = data_explore.get("results", [])[:15]
-        
-        for item in items_explore:
-            tmdb_id = item.get("id")
-            if tmdb_id in recommended_ids: continue
-            if any(w.tmdb_id == tmdb_id for w in watchlist): continue
-            
-            providers = tmdb_client.get_watch_providers("movie", tmdb_id, region=country)
-            external_service = None
-            on_existing = False
-            
-            if "flatrate" in providers:
-                for p in providers["flatrate"]:
-                    p_name = p["provider_name"]
-                    for sub in subscriptions:
-                        if sub.service_name.lower() in p_name.lower():
-                            on_existing = True
-                            break
-                    if on_existing: break
-                    
-                    p_name_lower = p_name.lower()
-                    if any(s in p_name_lower for s in ["netflix", "hulu", "amazon", "disney", "max", "apple", "peacock", "paramount"]):
-                         external_service = p_name
-                         break
-            
-            if not on_existing and external_service:
-                explore_recs.append({
-                    "type": "discovery_explore",
-                    "service_name": external_service,
-                    "logo_url": get_service_logo(external_service, country),
-                    "items": [item.get("title")],
-                    "reason": f"Available on {external_service}",
-                    "score": 88 + item.get("vote_average", 0),
-                    "tmdb_id": tmdb_id,
-                    "media_type": "movie",
-                    "poster_path": item.get("poster_path"),
-                    "vote_average": item.get("vote_average"),
-                    "overview": item.get("overview"),
-                    "original_language": item.get("original_language"),
-                    "genre_ids": item.get("genre_ids", [])
-                })
-
-    # --- Strategy B: Similar Content ---
-    seeds = []
-    for w in watchlist:
-        weight = (w.user_rating * 2) if w.user_rating else (5 if w.status == "watched" else 3)
-        seeds.append((w, weight))
-    seeds.sort(key=lambda x: x[1], reverse=True)
-    top_seeds = [s[0] for s in seeds[:10]]
-    random.shuffle(top_seeds)
-    
-    similar_recs = []
-    for seed in top_seeds:
-        if len(similar_recs) >= 15: break
-        
-        sim_data = tmdb_client.get_similar(seed.media_type, seed.tmdb_id)
-        candidates = [c for c in sim_data.get("results", []) if c.get("vote_average", 0) >= 6.0]
-        random.shuffle(candidates)
-        
-        for sim in candidates:
-            sim_id = sim.get("id")
-            if sim_id in recommended_ids: continue
-            if any(w.tmdb_id == sim_id for w in watchlist): continue
-             
-            providers = tmdb_client.get_watch_providers(seed.media_type, sim_id, region=country)
-            matched_sub = None
-            if "flatrate" in providers:
-                for p in providers["flatrate"]:
-                    for sub in subscriptions:
-                        if sub.service_name.lower() in p["provider_name"].lower():
-                            matched_sub = sub.service_name
-                            break
-                    if matched_sub: break
-            
-            if matched_sub:
-                similar_recs.append({
-                    "type": "similar",
-                    "service_name": matched_sub,
-                    "logo_url": get_service_logo(matched_sub, country),
-                    "items": [sim.get("title") or sim.get("name")],
-                    "reason": f"Because you liked {seed.title}",
-                    "score": 75 + sim.get("vote_average", 0),
-                    "tmdb_id": sim_id,
-                    "media_type": seed.media_type,
-                    "poster_path": sim.get("poster_path"),
-                    "vote_average": sim.get("vote_average"),
-                    "overview": sim.get("overview"),
-                    "original_language": sim.get("original_language"),
-                    "genre_ids": sim.get("genre_ids", [])
-                })
-                recommended_ids.add(sim_id)
-                break 
-
-    # --- Clustering Explore Recs ---
-    service_counts = {}
-    for r in explore_recs:
-        s = r["service_name"]
-        service_counts[s] = service_counts.get(s, 0) + 1
-        
-    best_external_service = None
-    if service_counts:
-        best_external_service = max(service_counts, key=service_counts.get)
-    
-    final_explore = []
-    if best_external_service:
-        final_explore = [r for r in explore_recs if r["service_name"] == best_external_service][:2]
-        for r in final_explore:
-            recommended_ids.add(r["tmdb_id"])
-
-    # Combine
-    unique_candidates = []
-    seen = set()
-    current_pool = available_recs + similar_recs + final_explore
-    random.shuffle(current_pool)
-    
-    for c in current_pool:
-        if c["tmdb_id"] not in seen:
-            unique_candidates.append(c)
-            seen.add(c["tmdb_id"])
-
-    # --- Strategy C: Trending Fallback (Fill up to 25 items) ---
-    if len(unique_candidates) < 35:
-        print(f"[RECS] Low results ({len(unique_candidates)}), fetching global trending fallback...")
-        try:
-             # Fetch Trending (Global or Provider)
-             trending_data = tmdb_client.discover_media("movie", sort_by="popularity.desc", watch_region=country, with_watch_providers=provider_string)
-             trending_items = trending_data.get("results", [])[:30]
-             
-             for item in trending_items:
-                 if len(unique_candidates) >= 35: break
-                 
-                 tmdb_id = item.get("id")
-                 if tmdb_id in seen: continue
-                 if any(w.tmdb_id == tmdb_id for w in watchlist): continue
-                 
-                 providers = tmdb_client.get_watch_providers("movie", tmdb_id, region=country)
-                 matched_sub = None
-                 if "flatrate" in providers:
-                     for p in providers["flatrate"]:
-                         p_name = p["provider_name"]
-                         for sub in subscriptions:
-                             if sub.service_name.lower() in p_name.lower():
-                                 matched_sub = sub.service_name
-                                 break
-                         if matched_sub: break
-                 
-                 if not matched_sub and not provider_string:
-                     matched_sub = "Available Globally"
-                     if "flatrate" in providers and len(providers["flatrate"]) > 0:
-                         matched_sub = f"Available on {providers['flatrate'][0]['provider_name']}"
-
-                 if matched_sub:
-                     unique_candidates.append({
-                        "type": "trending",
-                        "service_name": matched_sub,
-                        "logo_url": get_service_logo(matched_sub.replace("Available on ", ""), country) if matched_sub != "Available Globally" else None,
-                        "items": [item.get("title")],
-                        "reason": "Top Trending on your services" if provider_string else "Trending Worldwide",
-                        "score": 85 + (item.get("popularity", 0) / 500),
-                        "tmdb_id": tmdb_id,
-                        "media_type": "movie",
-                        "poster_path": item.get("poster_path"),
-                        "vote_average": item.get("vote_average"),
-                        "overview": item.get("overview")
-                     })
-                     seen.add(tmdb_id)
-        except Exception as e:
-            print(f"[RECS] Error fetching trending fallback: {e}")
-
-    random.shuffle(unique_candidates)
-    return unique_candidates[:25]
+    """Full similar-content calculation (no deadline), see similar_pipeline.py."""
+    return similar_pipeline.run(db, user_id, country)
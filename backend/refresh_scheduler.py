@@ -0,0 +1,39 @@
+"""
+Debounced, deduplicated recommendation refreshes.
+
+Mutations (watchlist add/delete, subscription CRUD, availability checks, login,
+profile changes) call schedule() instead of running a full recompute each.
+Refreshes are durable jobs (job_queue.py) keyed per (user, category):
+
+  - Requests within DEBOUNCE collapse into the one queued job, which runs
+    DEBOUNCE after the last request (but never later than MAX_DELAY after the
+    first), so adding 10 titles in a row costs one refresh.
+  - While a user's refresh is running, new requests reuse it; a forced request
+    queues exactly one follow-up, because the running job may already have read
+    the state the mutation just changed.
+  - How many refreshes run at once is bounded by the workers (worker.py).
+"""
+from config import settings
+import job_queue
+
+CATEGORIES = ("dashboard", "similar")
+
+DEBOUNCE = settings.REFRESH_DEBOUNCE_SECONDS
+MAX_DELAY = settings.REFRESH_MAX_DELAY_SECONDS
+
+
+def _merge(old: dict, new: dict) -> dict:
+    return {**new, "force": bool(old.get("force") or new.get("force"))}
+
+
+def schedule(user_id: int, force: bool = True, category: str = None):
+    """Queue a refresh for a user (both categories by default). Returns immediately."""
+    for cat in ([category] if category else CATEGORIES):
+        key = f"refresh:{user_id}:{cat}"
+        if not force and job_queue.active(key):
+            continue  # A queued or running refresh already covers a non-forced one
+        job_queue.enqueue(
+            "refresh_recommendations", {"user_id": user_id, "category": cat, "force": force},
+            priority=job_queue.HIGH, dedupe_key=key,
+            delay=DEBOUNCE, max_delay=MAX_DELAY, merge=_merge,
+        )
@@ -0,0 +1,76 @@
+from fastapi import APIRouter, HTTPException, status, Header, Request
+import logging
+
+import job_queue
+from config import settings
+from limiter import limiter
+
+logger = logging.getLogger("jobs_router")
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["Jobs"]
+)
+
+
+def verify_cron_key(x_cron_security_key: str, job: str):
+    if not x_cron_security_key or x_cron_security_key != settings.CRON_SECURITY_KEY:
+        logger.warning(f"Unauthorized attempt to access {job} cron endpoint")
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid or missing Cron Security Key"
+        )
+
+
+@router.post("/sync-providers")
+@limiter.limit("10/minute")
+async def sync_providers(
+    request: Request,
+    offline: bool = False,
+    x_cron_security_key: str = Header(None)
+):
+    """
+    Daily cron endpoint: refresh watch providers for tracked titles that TMDB's
+    changes feed reports as changed (see provider_sync.py). Queued as a durable job.
+    """
+    verify_cron_key(x_cron_security_key, "sync-providers")
+    job_queue.enqueue("sync_providers", {"offline": offline}, priority=job_queue.LOW, dedupe_key="sync_providers")
+    return {"status": "accepted"}
+
+
+@router.post("/refresh-titles")
+@limiter.limit("10/minute")
+async def refresh_titles(
+    request: Request,
+    x_cron_security_key: str = Header(None)
+):
+    """
+    Daily cron endpoint: refresh shared catalog metadata (ratings, posters, TV episode
+    totals) for watchlisted titles that are missing it or older than a week, and the
+    season structure of shows that are due (new episode aired, or structure too old).
+    """
+    verify_cron_key(x_cron_security_key, "refresh-titles")
+    job_queue.enqueue("refresh_titles", priority=job_queue.LOW, dedupe_key="refresh_titles")
+    return {"status": "accepted"}
+
+
+@router.post("/refresh-pools")
+@limiter.limit("10/minute")
+async def refresh_pools(
+    request: Request,
+    x_cron_security_key: str = Header(None)
+):
+    """
+    Daily cron endpoint: rebuild the shared trending/discover candidate pools (with
+    providers) that were used in the last week and drop unused ones (see candidate_pools.py).
+    """
+    verify_cron_key(x_cron_security_key, "refresh-pools")
+    job_queue.enqueue("refresh_pools", priority=job_queue.LOW, dedupe_key="refresh_pools")
+    return {"status": "accepted"}
+
+
+@router.get("/stats")
+async def job_stats(x_cron_security_key: str = Header(None)):
+    """Durable job queue: counts per status and how many queued jobs are due."""
+    verify_cron_key(x_cron_security_key, "stats")
+    return job_queue.stats()
@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Header, BackgroundTasks, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Request
 from sqlalchemy.orm import Session
 from datetime import date, timedelta
+import asyncio
 import json
 import logging
 
 import models
 import schemas
 import email_client
+import job_queue
 from database import get_db
 from config import settings
 from limiter import limiter
@@ -22,7 +24,6 @@ router = APIRouter(
 @limiter.limit("10/minute")
 async def check_renewals(
     request: Request,
-    background_tasks: BackgroundTasks,
     x_cron_security_key: str = Header(None),
     db: Session = Depends(get_db)
 ):
@@ -30,6 +31,7 @@ async def check_renewals(
     Daily cron endpoint to check for subscriptions renewing in 1 day or 7 days,
     aggregating warnings into a single daily email digest per user.
     Only sends if user has explicitly opted-in (enable_email_renewals is True).
+    Digests are queued as durable jobs (one per user per day) and sent by the worker.
     """
     # Verify Cron Security Key
     if not x_cron_security_key or x_cron_security_key != settings.CRON_SECURITY_KEY:
@@ -61,59 +63,15 @@ async def check_renewals(
 
     emails_queued = 0
 
-    # Build and send consolidated daily email digest for each eligible, opted-in user
     for owner in eligible_owners:
         # Verify user preferences (must be explicitly enabled, default False)
-        preferences = {}
-        if owner.preferences:
-            try:
-                preferences = json.loads(owner.preferences)
-            except Exception as e:
-                logger.error(f"Error decoding preferences for user {owner.id}: {e}")
-
-        # Check opt-in toggle (email renewals)
-        enable_email_renewals = preferences.get("enable_email_renewals", False)
-        if not enable_email_renewals:
+        if not _renewals_enabled(owner):
             continue
 
-        # Fetch ALL active subscriptions for this user renewing in the next 7 days (today through today+7)
-        # This provides a helpful overview of the coming week's expenses alongside the urgent alerts
-        seven_days_limit = today + timedelta(days=7)
-        user_subs = db.query(models.Subscription).filter(
-            models.Subscription.user_id == owner.id,
-            models.Subscription.is_active == True,
-            models.Subscription.next_billing_date >= today,
-            models.Subscription.next_billing_date <= seven_days_limit
-        ).order_by(models.Subscription.next_billing_date.asc()).all()
-
-        urgent_subs = []
-        upcoming_subs = []
-
-        for sub in user_subs:
-            days_remaining = (sub.next_billing_date - today).days
-            if days_remaining <= 1:
-                urgent_subs.append(sub)
-            else:
-                upcoming_subs.append(sub)
-
-        if not urgent_subs and not upcoming_subs:
-            continue
-
-        # Choose subject line based on urgency
-        if urgent_subs:
-            subject = "⚠️ URGENT: Subscription Renewal Due Tomorrow - BingeSensei"
-        else:
-            subject = "📅 Upcoming Subscription Renewals - BingeSensei"
-
-        # Build premium HTML template with glassmorphism/dark theme matching BingeSensei
-        html_content = build_renewal_email_html(owner, urgent_subs, upcoming_subs)
-
-        # Send via background task to avoid blocking response
-        background_tasks.add_task(
-            email_client.send_email,
-            subject=subject,
-            recipients=[owner.email],
-            body=html_content
+        # One digest per user per day, even if the cron fires twice
+        job_queue.enqueue(
+            "renewal_digest", {"user_id": owner.id, "date": today.isoformat()},
+            priority=job_queue.NORMAL, dedupe_key=f"renewal_digest:{owner.id}:{today.isoformat()}", once=True
         )
         emails_queued += 1
 
@@ -124,6 +82,67 @@ async def check_renewals(
     }
 
 
+def _renewals_enabled(owner) -> bool:
+    preferences = {}
+    if owner.preferences:
+        try:
+            preferences = json.loads(owner.preferences)
+        except Exception as e:
+            logger.error(f"Error decoding preferences for user {owner.id}: {e}")
+
+    # Check opt-in toggle (email renewals)
+    return preferences.get("enable_email_renewals", False)
+
+
+def send_renewal_digest(db: Session, user_id: int, today: date) -> bool:
+    """
+    Build and send one user's consolidated renewal digest (renewal_digest job handler).
+    Returns False when there is nothing to send (opted out since, or nothing renewing).
+    """
+    owner = db.query(models.User).filter(models.User.id == user_id).first()
+    if not owner or not _renewals_enabled(owner):
+        return False
+
+    # Fetch ALL active subscriptions for this user renewing in the next 7 days (today through today+7)
+    # This provides a helpful overview of the coming week's expenses alongside the urgent alerts
+    seven_days_limit = today + timedelta(days=7)
+    user_subs = db.query(models.Subscription).filter(
+        models.Subscription.user_id == owner.id,
+        models.Subscription.is_active == True,
+        models.Subscription.next_billing_date >= today,
+        models.Subscription.next_billing_date <= seven_days_limit
+    ).order_by(models.Subscription.next_billing_date.asc()).all()
+
+    urgent_subs = []
+    upcoming_subs = []
+
+    for sub in user_subs:
+        days_remaining = (sub.next_billing_date - today).days
+        if days_remaining <= 1:
+            urgent_subs.append(sub)
+        else:
+            upcoming_subs.append(sub)
+
+    if not urgent_subs and not upcoming_subs:
+        return False
+
+    # Choose subject line based on urgency
+    if urgent_subs:
+        subject = "⚠️ URGENT: Subscription Renewal Due Tomorrow - BingeSensei"
+    else:
+        subject = "📅 Upcoming Subscription Renewals - BingeSensei"
+
+    # Build premium HTML template with glassmorphism/dark theme matching BingeSensei
+    html_content = build_renewal_email_html(owner, urgent_subs, upcoming_subs)
+
+    asyncio.run(email_client.send_email(
+        subject=subject,
+        recipients=[owner.email],
+        body=html_content
+    ))
+    return True
+
+
 def build_renewal_email_html(user, urgent_subs, upcoming_subs):
     """
     Builds a beautifully designed, premium dark-themed HTML email layout.
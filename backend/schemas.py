@@ -79,6 +79,10 @@ class WatchlistItem(WatchlistItemBase):
     class Config:
         from_attributes = True
 
+class WatchlistItemPatched(WatchlistItem):
+    # Cached dashboard with this change applied in place (None: refetch /recommendations/dashboard)
+    dashboard: Optional[List[dict]] = None
+
 class PlanBase(BaseModel):
     name: str
     cost: float
@@ -1,5 +1,5 @@
 """
-Backfill script: Fetches original_language from TMDB for all watchlist items.
+Backfill script: Fetches original_language from TMDB for all titles in the shared catalog.
 This enables anime detection (original_language == 'ja' + Animation genre).
 Run once after adding the original_language column.
 """
@@ -17,8 +17,8 @@ import tmdb_client
 def backfill_original_language():
     db = SessionLocal()
     try:
-        items = db.query(models.WatchlistItem).filter(
-            models.WatchlistItem.original_language == None
+        items = db.query(models.Title).filter(
+            models.Title.original_language == None
         ).all()
         
         print(f"Found {len(items)} items without original_language")
@@ -50,4 +50,6 @@ def backfill_original_language():
         db.close()
 
 if __name__ == "__main__":
-    backfill_original_language()
+    # Backfills must never starve interactive TMDB traffic
+    with tmdb_client.priority(tmdb_client.BACKGROUND):
+        backfill_original_language()
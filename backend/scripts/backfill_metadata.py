@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """Backfill metadata (Genres, Overview, Rating, Poster) for existing watchlist items.
 
-This script scans the WatchlistItem table and checks for missing critical metadata:
+This script scans the WatchlistItem table and checks for missing critical metadata
+(read through the shared titles catalog):
 - genre_ids (must be valid JSON list)
 - overview (synopsis)
 - vote_average (rating)
@@ -9,7 +10,7 @@ This script scans the WatchlistItem table and checks for missing critical metada
 - title (canonical)
 
 If any field is missing or malformed, it fetches the full details from TMDB and
-updates the record.
+updates the title's catalog entry.
 
 Run with the project's virtual environment activated:
      python backend/scripts/backfill_metadata.py
@@ -28,6 +29,8 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 import models
 import tmdb_client
+import title_catalog
+import coverage_model  # noqa: F401 - registers its Session listeners
 
 # Database Connection (Supports Neon/Postgres via Env Var)
 # Default to absolute path of backend/sql_app.db to avoid CWD issues
@@ -98,19 +101,11 @@ def backfill():
             # Fetch details from TMDB
             try:
                 # 1. Fetch Basic Details (Metadata)
+                # Metadata is written to the shared titles catalog, once per title
                 details = tmdb_client.get_details(item.media_type, item.tmdb_id)
                 if details:
-                    if not item.title: item.title = details.get('title') or details.get('name')
-                    if not item.overview: item.overview = details.get('overview') or ""
-                    if not item.poster_path: item.poster_path = details.get('poster_path')
-                    if item.vote_average is None or item.vote_average == 0:
-                        item.vote_average = details.get('vote_average')
-                    
-                    # Genres
-                    if "genres" in missing_fields or not is_valid_genre_json(item.genre_ids):
-                        genre_objs = details.get("genres", [])
-                        genre_ids = [g.get("id") for g in genre_objs if isinstance(g.get("id"), int)]
-                        item.genre_ids = json.dumps(genre_ids) if genre_ids else None
+                    entry = title_catalog.get_or_create(db, item.media_type, item.tmdb_id)
+                    title_catalog.apply_details(entry, details)
                 
                 # 2. Fetch Providers (Service Badge)
                 # We need the user's country to get accurate providers
@@ -150,4 +145,6 @@ def backfill():
         db.close()
 
 if __name__ == "__main__":
-    backfill()
+    # Backfills must never starve interactive TMDB traffic
+    with tmdb_client.priority(tmdb_client.BACKGROUND):
+        backfill()
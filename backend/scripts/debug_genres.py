@@ -1,6 +1,6 @@
 from sqlalchemy.orm import Session
 from database import SessionLocal
-from models import WatchlistItem
+from models import WatchlistItem, Title
 import sys
 import os
 
@@ -8,7 +8,7 @@ import os
 sys.path.append(os.getcwd())
 
 db: Session = SessionLocal()
-item = db.query(WatchlistItem).filter(WatchlistItem.title.ilike("%Haikyuu%")).first()
+item = db.query(WatchlistItem).join(WatchlistItem.catalog).filter(Title.title.ilike("%Haikyuu%")).first()
 
 if item:
     print(f"Title: {item.title}")
@@ -7,7 +7,7 @@ sys.path.append(backend_dir)
 
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from models import WatchlistItem
+from models import WatchlistItem, Title
 
 # Direct setup avoiding relative import issues
 SQLALCHEMY_DATABASE_URL = "sqlite:///sql_app.db"
@@ -15,7 +15,7 @@ engine = create_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 db = SessionLocal()
-item = db.query(WatchlistItem).filter(WatchlistItem.title.ilike("%Haikyuu%")).first()
+item = db.query(WatchlistItem).join(WatchlistItem.catalog).filter(Title.title.ilike("%Haikyuu%")).first()
 
 if item:
     print(f"Title: {item.title}")
@@ -8,6 +8,7 @@ from datetime import datetime
 from sqlalchemy.orm import Session
 from database import SessionLocal
 import models
+import title_catalog
 
 def restore_user_data(backup_file: str):
     db = SessionLocal()
@@ -70,16 +71,13 @@ def restore_user_data(backup_file: str):
                 print(f"⚠️  User {item_data['user_email']} not found, skipping watchlist item...")
                 continue
             
+            # Title metadata goes to the shared catalog; the watchlist row keeps per-user fields only
+            title_catalog.get_or_create(db, item_data["media_type"], item_data["tmdb_id"], seed=item_data)
             watchlist_item = models.WatchlistItem(
                 user_id=user_id,
                 tmdb_id=item_data["tmdb_id"],
-                title=item_data["title"],
                 media_type=item_data["media_type"],
-                poster_path=item_data.get("poster_path"),
-                vote_average=item_data.get("vote_average"),
-                overview=item_data.get("overview"),
                 user_rating=item_data.get("user_rating"),
-                genre_ids=item_data.get("genre_ids"),
                 status=item_data["status"]
             )
             db.add(watchlist_item)
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""Run the incremental watch-provider sync (see provider_sync.py) by hand.
+
+Reads TMDB's /movie/changes and /tv/changes since the last run and refreshes
+providers only for changed titles that are in a watchlist or a cached
+recommendation. Pass --offline to replay the last saved changes snapshot
+instead of calling TMDB.
+
+Run with the project's virtual environment activated:
+     python backend/scripts/sync_provider_changes.py [--offline]
+"""
+
+import sys
+from pathlib import Path
+
+# Ensure the project root is on PYTHONPATH
+project_root = Path(__file__).resolve().parents[1]
+sys.path.append(str(project_root))
+
+import models
+import provider_sync
+import coverage_model  # noqa: F401 - registers its Session listeners
+from database import SessionLocal, engine
+
+if __name__ == "__main__":
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        summary = provider_sync.sync_provider_changes(db, offline="--offline" in sys.argv)
+        print(summary)
+    finally:
+        db.close()
@@ -0,0 +1,167 @@
+"""
+Process-wide snapshot of the Service / Plan catalog.
+
+The seeded catalog is a few dozen services with their plans and rarely
+changes, yet logos and plans were looked up with one query per subscription
+or recommendation. get(db) returns an immutable snapshot of both tables with
+O(1) lookups by (name, country), by normalized name ("Disney+ Hotstar" ==
+"disney plus hotstar", see provider_index.normalize) and for the cheapest
+plan per service and region.
+
+The snapshot is version-invalidated:
+  - a commit that wrote services/plans through the ORM in this process (admin
+    views, scripts using crud/models) drops it at once, along with the
+    provider indexes built from service names;
+  - other processes compare a cheap fingerprint of both tables at most every
+    CHECK_INTERVAL seconds and reload when it moved, and rebuild after
+    MAX_AGE regardless (edits that keep counts, ids and costs unchanged).
+
+Snapshot rows are plain SimpleNamespaces (id, name, logo_url, country,
+category, plans), safe to share across threads and sessions. Catalog.version
+is a digest of the loaded rows, equal across processes with the same catalog
+(coverage_model.py stores it with each coverage model).
+"""
+import hashlib
+import threading
+import time
+from types import SimpleNamespace
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+import models
+import provider_index
+
+CHECK_INTERVAL = 60    # Seconds between fingerprint checks
+MAX_AGE = 6 * 3600     # Rebuild at least this often
+
+_snapshot = None       # (Catalog, fingerprint, built_at, checked_at)
+_lock = threading.Lock()
+
+
+def _monthly(plan) -> float:
+    return plan.cost / 12 if plan.billing_cycle and plan.billing_cycle.lower() == "yearly" else plan.cost
+
+
+class Catalog:
+    def __init__(self, services: list, version):
+        self.version = version
+        self._by_key = {}      # (name, country) -> service
+        self._by_norm = {}     # (normalized name, country) -> service
+        self._by_name = {}     # name -> services, any region
+        self._by_country = {}  # country -> services
+        self._by_id = {}
+        for s in services:
+            self._by_key.setdefault((s.name, s.country), s)
+            self._by_norm.setdefault((provider_index.normalize(s.name), s.country), s)
+            self._by_name.setdefault(s.name, []).append(s)
+            self._by_country.setdefault(s.country, []).append(s)
+            self._by_id[s.id] = s
+        self._cheapest = {}    # (service id, country) -> cheapest monthly-equivalent plan there
+
+    def services(self, country: str = "US") -> list:
+        return self._by_country.get(country, [])
+
+    def service(self, name: str, country: str = "US", any_region: bool = False):
+        """
+        The service called name in country, else its US entry (exact name first, then normalized).
+        any_region: fall back to the service in any other region too.
+        """
+        for region in (country, "US"):
+            found = self._by_key.get((name, region))
+            if found:
+                return found
+        norm = provider_index.normalize(name)
+        for region in (country, "US"):
+            found = self._by_norm.get((norm, region))
+            if found:
+                return found
+        if any_region and self._by_name.get(name):
+            return self._by_name[name][0]
+        return None
+
+    def logo(self, name: str, country: str = "US"):
+        found = self.service(name, country)
+        return found.logo_url if found else None
+
+    def plans(self, service_id: int, country: str = "US") -> list:
+        found = self._by_id.get(service_id)
+        return [p for p in found.plans if p.country == country] if found else []
+
+    def cheapest_plan(self, service, country: str = "US"):
+        """Cheapest monthly-equivalent plan of a service in country, else across all its plans."""
+        key = (service.id, country)
+        if key not in self._cheapest:
+            plans = [p for p in service.plans if p.country == country] or service.plans
+            self._cheapest[key] = min(plans, key=_monthly) if plans else None
+        return self._cheapest[key]
+
+
+def _fingerprint(db) -> tuple:
+    return (
+        tuple(db.query(func.count(models.Service.id), func.max(models.Service.id)).one()),
+        tuple(db.query(func.count(models.Plan.id), func.max(models.Plan.id), func.sum(models.Plan.cost)).one()),
+    )
+
+
+def _load(db) -> Catalog:
+    plans = {}
+    for p in db.query(models.Plan).all():
+        plans.setdefault(p.service_id, []).append(SimpleNamespace(
+            id=p.id, service_id=p.service_id, name=p.name, cost=p.cost,
+            currency=p.currency, billing_cycle=p.billing_cycle, country=p.country,
+        ))
+    services = [
+        SimpleNamespace(
+            id=s.id, name=s.name, base_cost=s.base_cost, logo_url=s.logo_url,
+            country=s.country, category=s.category, plans=plans.get(s.id, []),
+        )
+        for s in db.query(models.Service).order_by(models.Service.id).all()
+    ]
+    print(f"[CATALOG] Loaded {len(services)} services, {sum(len(v) for v in plans.values())} plans")
+    version = hashlib.sha1(repr([vars(s) for s in services]).encode("utf-8")).hexdigest()[:16]
+    return Catalog(services, version)
+
+
+def get(db) -> Catalog:
+    """The current catalog snapshot (reloaded if the tables changed)."""
+    global _snapshot
+    now = time.time()
+    entry = _snapshot
+    if entry and now - entry[3] < CHECK_INTERVAL and now - entry[2] < MAX_AGE:
+        return entry[0]
+    with _lock:
+        entry = _snapshot
+        if entry and now - entry[3] < CHECK_INTERVAL and now - entry[2] < MAX_AGE:
+            return entry[0]
+        fingerprint = _fingerprint(db)
+        if entry and entry[1] == fingerprint and now - entry[2] < MAX_AGE:
+            _snapshot = (entry[0], fingerprint, entry[2], now)
+            return entry[0]
+        catalog = _load(db)
+        _snapshot = (catalog, fingerprint, now, now)
+        return catalog
+
+
+def invalidate():
+    """Drop the snapshot (and the provider indexes built from service names)."""
+    global _snapshot
+    with _lock:
+        _snapshot = None
+    provider_index.invalidate()
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_catalog_writes(session, flush_context):
+    if any(isinstance(obj, (models.Service, models.Plan)) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info["catalog_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    # After the commit, so a concurrent reload can't read the pre-commit rows
+    if session.info.pop("catalog_changed", False):
+        invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_catalog_writes(session):
+    session.info.pop("catalog_changed", None)
@@ -0,0 +1,374 @@
+"""
+Staged candidate pipeline for "You Might Like" (similar content).
+
+    generate -> filter -> enrich -> rank
+
+Sources are independent and run concurrently: a top-rated pool per interest
+for content on the user's services, an acclaimed pool per interest for explore
+content, one /similar lookup per seed title, and the provider-filtered popular
+pool. Each source task generates its candidates and filters them (watchlist,
+rating floor, per-source cap). Pool entries (candidate_pools.py) arrive with
+providers attached; /similar candidates are enriched in one batch.
+
+Ranking is a pure function over whatever sources have finished, so the request
+can stop waiting once the finished sources already rank TARGET results or the
+deadline passes. Every ranking is handed to on_complete (which caches it):
+first the one the request returns, then - if sources were still running at the
+deadline - the full one once they finish in the background.
+
+Everything a source or the ranking needs from the database is read up front
+(PipelineInputs, from the request's UserContext), so worker threads never touch
+the request's Session.
+"""
+import contextvars
+import json
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import candidate_pools
+import provider_index
+import tmdb_client
+import user_context
+
+TARGET = 25            # Results returned per request
+FILL_TO = 35           # Trending tops the pool up to this many before the final shuffle
+MAX_WORKERS = 8        # Source tasks in flight per request (TMDB concurrency is bounded by the client)
+SIMILAR_SEEDS = 10     # Top-weighted watchlist titles used as /similar seeds
+SIMILAR_PER_SEED = 10  # Candidates per seed checked for providers
+TRENDING_KEY = ("trending", None)  # Fallback filler source, not personalized
+
+EXPLORE_SERVICES = ["netflix", "hulu", "amazon", "disney", "max", "apple", "peacock", "paramount"]
+
+
+class PipelineInputs:
+    """Plain snapshot of the user's context (no ORM objects cross into worker threads)."""
+
+    def __init__(self, db, ctx: user_context.UserContext, country: str):
+        self.country = country
+        watchlist = ctx.watchlist
+        self.watchlist_ids = {w.tmdb_id for w in watchlist}
+
+        subscriptions = ctx.ott_subscriptions(country)
+        self.matcher = provider_index.matcher_for(
+            db, [SimpleNamespace(service_name=s.service_name) for s in subscriptions], country
+        )
+        self.provider_string = self.matcher.provider_string()
+
+        # Service logos from the catalog snapshot (plain rows, safe in worker threads)
+        self.catalog = ctx.catalog
+
+        self.genre_ids = [i.genre_id for i in ctx.interests[:2]] or _watchlist_genres(watchlist) or [28, 35]
+
+        seeds = []
+        for w in watchlist:
+            weight = (w.user_rating * 2) if w.user_rating else (5 if w.status == "watched" else 3)
+            seeds.append(((w.media_type, w.tmdb_id, w.title), weight))
+        seeds.sort(key=lambda x: x[1], reverse=True)
+        self.seeds = [s[0] for s in seeds[:SIMILAR_SEEDS]]
+        random.shuffle(self.seeds)
+
+    def logo(self, name):
+        return self.catalog.logo(name, self.country)
+
+
+def _watchlist_genres(watchlist) -> list:
+    """Top 2 genres across the watchlist (fallback when the user has no explicit interests)."""
+    genre_counter = Counter()
+    for w in watchlist:
+        if w.genre_ids:
+            try:
+                g_ids = json.loads(w.genre_ids)
+                if isinstance(g_ids, list):
+                    genre_counter.update(g_ids)
+            except: pass
+    return [g for g, _ in genre_counter.most_common(2)]
+
+
+# --- Generate / filter / enrich (one task per source) ---
+
+def _enrich(inputs, candidates, media_type):
+    """[(item, providers)] for filtered candidates, providers fetched in one concurrent batch."""
+    if not candidates:
+        return []
+    providers = tmdb_client.get_watch_providers_many(
+        [(media_type, c.get("id")) for c in candidates], region=inputs.country
+    )
+    return [(c, providers.get((media_type, int(c.get("id"))), {})) for c in candidates]
+
+
+def _unseen(inputs, items):
+    return [i for i in items if i.get("id") and i.get("id") not in inputs.watchlist_ids]
+
+
+def _pooled(inputs, entries):
+    """Pool entries already carry the region's providers - no enrichment needed."""
+    return [(item, item.get("providers") or {}) for item in _unseen(inputs, entries)]
+
+
+def _source_available(inputs, genre_id):
+    items = candidate_pools.get("top_rated", "movie", inputs.country, inputs.provider_string, genre_id)[:20]
+    random.shuffle(items)
+    return _pooled(inputs, items)
+
+
+def _source_explore(inputs, genre_id):
+    return _pooled(inputs, candidate_pools.get("acclaimed", "movie", inputs.country, genre=genre_id)[:15])
+
+
+def _source_similar(inputs, seed):
+    media_type, tmdb_id, _ = seed
+    data = tmdb_client.get_similar(media_type, tmdb_id)
+    candidates = [c for c in _unseen(inputs, data.get("results", [])) if c.get("vote_average", 0) >= 6.0]
+    random.shuffle(candidates)
+    return _enrich(inputs, candidates[:SIMILAR_PER_SEED], media_type)
+
+
+def _source_trending(inputs):
+    return _pooled(inputs, candidate_pools.get("popular", "movie", inputs.country, inputs.provider_string)[:30])
+
+
+def _sources(inputs) -> list:
+    """(key, fn) for every source, in ranking order."""
+    sources = [(("available", g), lambda g=g: _source_available(inputs, g)) for g in inputs.genre_ids]
+    sources += [(("explore", g), lambda g=g: _source_explore(inputs, g)) for g in inputs.genre_ids]
+    sources += [(("similar", s[1]), lambda s=s: _source_similar(inputs, s)) for s in inputs.seeds]
+    sources.append((TRENDING_KEY, lambda: _source_trending(inputs)))
+    return sources
+
+
+# --- Rank ---
+
+def _matched_sub(inputs, providers):
+    if "flatrate" not in providers:
+        return None
+    covering = inputs.matcher.first(providers["flatrate"])
+    return covering.service_name if covering else None
+
+
+def _card(item, **fields):
+    card = {
+        "items": [item.get("title") or item.get("name")],
+        "tmdb_id": item.get("id"),
+        "poster_path": item.get("poster_path"),
+        "vote_average": item.get("vote_average"),
+        "overview": item.get("overview"),
+        "original_language": item.get("original_language"),
+        "genre_ids": item.get("genre_ids", []),
+    }
+    card.update(fields)
+    return card
+
+
+def rank(inputs, results: dict) -> list:
+    """
+    Turn finished sources ({source_key: [(item, providers)]}) into up to TARGET cards.
+    Sources that haven't finished are simply missing; the rules are the same either way.
+    """
+    recommended_ids = set()
+
+    # Content on the user's services, up to 15 per interest
+    available_recs = []
+    for genre_id in inputs.genre_ids:
+        count = 0
+        for item, providers in results.get(("available", genre_id), []):
+            if count >= 15: break
+            tmdb_id = item.get("id")
+            if tmdb_id in recommended_ids: continue
+            matched_sub = _matched_sub(inputs, providers)
+            if matched_sub:
+                available_recs.append(_card(
+                    item, type="discovery", service_name=matched_sub, logo_url=inputs.logo(matched_sub),
+                    reason="Included in your subscription", score=90 + item.get("vote_average", 0),
+                    media_type="movie",
+                ))
+                recommended_ids.add(tmdb_id)
+                count += 1
+
+    # Explore content (highly rated, on a major service the user doesn't have)
+    explore_recs = []
+    for genre_id in inputs.genre_ids:
+        for item, providers in results.get(("explore", genre_id), []):
+            if item.get("id") in recommended_ids: continue
+            external_service = None
+            on_existing = False
+            for p in providers.get("flatrate", []):
+                if inputs.matcher.subs_for(p):
+                    on_existing = True
+                    break
+                if any(s in p["provider_name"].lower() for s in EXPLORE_SERVICES):
+                    external_service = p["provider_name"]
+                    break
+            if not on_existing and external_service:
+                explore_recs.append(_card(
+                    item, type="discovery_explore", service_name=external_service,
+                    logo_url=inputs.logo(external_service), reason=f"Available on {external_service}",
+                    score=88 + item.get("vote_average", 0), media_type="movie",
+                ))
+
+    # Similar content: first covered candidate per seed, up to 15
+    similar_recs = []
+    for seed in inputs.seeds:
+        if len(similar_recs) >= 15: break
+        media_type, seed_id, seed_title = seed
+        for sim, providers in results.get(("similar", seed_id), []):
+            sim_id = sim.get("id")
+            if sim_id in recommended_ids: continue
+            matched_sub = _matched_sub(inputs, providers)
+            if matched_sub:
+                similar_recs.append(_card(
+                    sim, type="similar", service_name=matched_sub, logo_url=inputs.logo(matched_sub),
+                    reason=f"Because you liked {seed_title}", score=75 + sim.get("vote_average", 0),
+                    media_type=media_type,
+                ))
+                recommended_ids.add(sim_id)
+                break
+
+    # Explore recs are clustered onto the single service that carries most of them
+    service_counts = Counter(r["service_name"] for r in explore_recs)
+    final_explore = []
+    if service_counts:
+        best_external_service = service_counts.most_common(1)[0][0]
+        final_explore = [r for r in explore_recs if r["service_name"] == best_external_service][:2]
+
+    unique_candidates = []
+    seen = set()
+    current_pool = available_recs + similar_recs + final_explore
+    random.shuffle(current_pool)
+    for c in current_pool:
+        if c["tmdb_id"] not in seen:
+            unique_candidates.append(c)
+            seen.add(c["tmdb_id"])
+
+    # Trending fallback fills the pool
+    for item, providers in results.get(TRENDING_KEY, []):
+        if len(unique_candidates) >= FILL_TO: break
+        tmdb_id = item.get("id")
+        if tmdb_id in seen: continue
+        matched_sub = _matched_sub(inputs, providers)
+        if not matched_sub and not inputs.provider_string:
+            matched_sub = "Available Globally"
+            if providers.get("flatrate"):
+                matched_sub = f"Available on {providers['flatrate'][0]['provider_name']}"
+        if matched_sub:
+            card = _card(
+                item, type="trending", service_name=matched_sub,
+                logo_url=inputs.logo(matched_sub.replace("Available on ", "")) if matched_sub != "Available Globally" else None,
+                reason="Top Trending on your services" if inputs.provider_string else "Trending Worldwide",
+                score=85 + (item.get("popularity", 0) / 500), media_type="movie",
+            )
+            del card["original_language"], card["genre_ids"]
+            unique_candidates.append(card)
+            seen.add(tmdb_id)
+
+    random.shuffle(unique_candidates)
+    return unique_candidates[:TARGET]
+
+
+# --- Run ---
+
+class _Run:
+    def __init__(self, inputs, sources, on_complete):
+        self.inputs = inputs
+        self.on_complete = on_complete
+        self.results = {}
+        self.pending = len(sources)
+        self.stopped = False   # enough good results - remaining sources are dropped
+        self.detached = False  # request returned at the deadline - finish in the background
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.published = threading.Event()  # request's ranking handed to on_complete
+        if not sources:
+            self.ready.set()
+
+    def source_done(self, key, rows):
+        with self.lock:
+            if self.stopped:
+                return
+            self.results[key] = rows
+            self.pending -= 1
+            # Ranking is in-memory and cheap; once the finished personalized sources already rank
+            # TARGET deep, stop. Trending filler doesn't count, or it alone could end the run.
+            personalized = {k: v for k, v in self.results.items() if k != TRENDING_KEY}
+            if self.pending and not self.detached and len(rank(self.inputs, personalized)) >= TARGET:
+                self.stopped = True
+            finished = self.pending == 0 or self.stopped
+            complete_in_background = finished and self.detached
+            if finished:
+                self.ready.set()
+        if complete_in_background:
+            self._complete()
+
+    def detach(self) -> bool:
+        """Called by the request at its deadline. False if the run finished in the meantime."""
+        with self.lock:
+            if self.ready.is_set():
+                return False
+            self.detached = True
+            return True
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.results)
+
+    def _complete(self):
+        started = time.time()
+        # The full ranking must land after the partial one the request publishes
+        self.published.wait(timeout=30)
+        try:
+            recs = rank(self.inputs, self.snapshot())
+            if self.on_complete and recs:
+                self.on_complete(recs)
+            print(f"[SIMILAR] Background completion: {len(recs)} results cached ({time.time() - started:.2f}s)")
+        except Exception as e:
+            print(f"[SIMILAR] Background completion failed: {e}")
+
+
+def _run_source(run, key, fn):
+    if run.stopped:
+        return
+    try:
+        rows = fn()
+    except Exception as e:
+        print(f"[SIMILAR] Source {key} failed: {e}")
+        rows = []
+    run.source_done(key, rows)
+
+
+def run(db, user_id: int, country: str, deadline: float = None, on_complete=None, ctx=None) -> list:
+    """
+    Similar-content recommendations for a user (ctx: their UserContext, loaded if not given).
+    deadline: seconds to wait for sources (None = wait for all). On timeout the ranking of
+    whatever finished is returned. on_complete(recs) receives the returned ranking and,
+    after a deadline hit, the full one once the remaining sources finish.
+    """
+    started = time.time()
+    ctx = ctx or user_context.load(db, user_id)
+    if ctx is None:
+        return [] # User no longer exists (stale job / refresh)
+    inputs = PipelineInputs(db, ctx, country)
+    sources = _sources(inputs)
+    current = _Run(inputs, sources, on_complete)
+
+    pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="similar")
+    for key, fn in sources:
+        # Each task runs in a copy of this context so TMDB priority lanes carry over
+        pool.submit(contextvars.copy_context().run, _run_source, current, key, fn)
+    pool.shutdown(wait=False)
+
+    current.ready.wait(timeout=deadline)
+    if current.detach():
+        print(f"[SIMILAR] Deadline {deadline}s hit with {current.pending}/{len(sources)} sources pending; finishing in background")
+    elif current.stopped:
+        print(f"[SIMILAR] Early stop: {TARGET} results with {current.pending}/{len(sources)} sources pending")
+
+    recs = rank(inputs, current.snapshot())
+    print(f"[SIMILAR] {len(recs)} results in {time.time() - started:.2f}s")
+    try:
+        if on_complete and recs:
+            on_complete(recs)
+    finally:
+        current.published.set()
+    return recs
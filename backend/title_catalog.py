@@ -0,0 +1,134 @@
+"""
+Shared title catalog.
+
+Title metadata (name, poster, overview, rating, genres, language, season and
+episode totals) lives once per (media_type, tmdb_id) in the `titles` table.
+Watchlist rows only keep per-user state and read metadata through
+WatchlistItem.catalog, so enrichment runs once per title instead of once per
+user that saved it.
+"""
+import json
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import models
+import tmdb_client
+import tv_seasons
+
+# Metadata fields owned by the catalog (the rest of a watchlist payload is per-user)
+CATALOG_FIELDS = (
+    "title", "poster_path", "overview", "vote_average", "genre_ids",
+    "original_language", "total_seasons", "total_episodes",
+)
+
+# Re-fetch details after this long so ratings, posters and TV episode totals stay current
+REFRESH_AFTER = timedelta(days=7)
+
+
+def _now():
+    return datetime.utcnow()
+
+
+def _naive(dt):
+    return dt.replace(tzinfo=None) if dt and dt.tzinfo else dt
+
+
+def _fill(entry: models.Title, data: dict):
+    """Copy non-empty values from data onto entry where the entry has none."""
+    for field in CATALOG_FIELDS:
+        value = data.get(field)
+        if field == "genre_ids" and isinstance(value, list):
+            value = json.dumps(value) if value else None
+        if value not in (None, "", 0) and not getattr(entry, field):
+            setattr(entry, field, value)
+
+
+def get(db: Session, media_type: str, tmdb_id: int):
+    return db.query(models.Title).filter(
+        models.Title.media_type == media_type,
+        models.Title.tmdb_id == tmdb_id,
+    ).first()
+
+
+def get_or_create(db: Session, media_type: str, tmdb_id: int, seed: dict = None) -> models.Title:
+    """
+    Catalog row for a title, created if missing. seed (e.g. the client's search result)
+    only fills fields the catalog doesn't have yet. Commits.
+    """
+    entry = get(db, media_type, tmdb_id)
+    if not entry:
+        entry = models.Title(media_type=media_type, tmdb_id=tmdb_id)
+        db.add(entry)
+        if seed:
+            _fill(entry, seed)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another request created it first
+            db.rollback()
+            entry = get(db, media_type, tmdb_id)
+    elif seed:
+        _fill(entry, seed)
+        db.commit()
+    return entry
+
+
+def needs_refresh(entry: models.Title) -> bool:
+    if not entry.refreshed_at or _naive(entry.refreshed_at) < _now() - REFRESH_AFTER:
+        return True
+    if not entry.genre_ids or not entry.overview or not entry.poster_path:
+        return True
+    return entry.media_type == "tv" and not entry.total_episodes
+
+
+def apply_details(entry: models.Title, details: dict):
+    """Overwrite catalog metadata with a TMDB details payload."""
+    entry.title = details.get("title") or details.get("name") or entry.title
+    entry.overview = details.get("overview") or entry.overview or ""
+    entry.poster_path = details.get("poster_path") or entry.poster_path
+    if details.get("vote_average") is not None:
+        entry.vote_average = details.get("vote_average")
+    genre_ids = [g["id"] for g in details.get("genres", []) if isinstance(g.get("id"), int)]
+    if genre_ids:
+        entry.genre_ids = json.dumps(genre_ids)
+    if details.get("original_language"):
+        entry.original_language = details["original_language"]
+    if entry.media_type == "tv":
+        entry.total_seasons = details.get("number_of_seasons", 0) or entry.total_seasons
+        entry.total_episodes = details.get("number_of_episodes", 0) or entry.total_episodes
+        tv_seasons.store(entry, details)
+    entry.refreshed_at = _now()
+
+
+def enrich(db: Session, entries, force: bool = False) -> int:
+    """
+    Refresh catalog rows from TMDB details (fetched concurrently, tmdb_cache first).
+    Only rows that need it unless force. Commits. Returns the number of rows updated.
+    """
+    pending = [e for e in entries if force or needs_refresh(e)]
+    if not pending:
+        return 0
+    details = tmdb_client.get_details_many([(e.media_type, e.tmdb_id) for e in pending])
+    updated = 0
+    for entry in pending:
+        data = details.get((entry.media_type, int(entry.tmdb_id)))
+        if data:
+            apply_details(entry, data)
+            updated += 1
+    db.commit()
+    return updated
+
+
+def stale_entries(db: Session, limit: int = 500) -> list:
+    """Catalog rows referenced by a watchlist that need a details refresh (oldest first)."""
+    cutoff = _now() - REFRESH_AFTER
+    return db.query(models.Title).filter(
+        ((models.Title.refreshed_at == None) | (models.Title.refreshed_at < cutoff)),
+        models.Title.id.in_(
+            db.query(models.Title.id).join(
+                models.WatchlistItem,
+                (models.WatchlistItem.media_type == models.Title.media_type) &
+                (models.WatchlistItem.tmdb_id == models.Title.tmdb_id)
+            )
+        )
+    ).order_by(models.Title.refreshed_at.asc().nullsfirst()).limit(limit).all()
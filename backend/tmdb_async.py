@@ -0,0 +1,351 @@
+"""
+Asyncio TMDB transport.
+
+A single pooled httpx.AsyncClient (HTTP/2 when the `h2` package is installed)
+runs on a dedicated event-loop thread shared by the whole process. Concurrency
+towards TMDB is capped by a semaphore (TMDB_MAX_CONCURRENCY), and batch helpers
+fan requests out concurrently instead of one after another.
+
+Synchronous code (FastAPI sync endpoints, background tasks, scripts) reaches
+this loop through run_sync(); the public functions in tmdb_client.py are thin
+wrappers over it. Because every thread funnels into the same loop, identical
+requests that are in flight at the same time are coalesced into one upstream
+call (single-flight) and all callers share its result. Every attempt also
+waits for a slot from the rate governor (see tmdb_governor.py) in the caller's
+priority lane.
+"""
+import asyncio
+import contextvars
+import threading
+import httpx
+from config import settings
+import tmdb_cache
+import tmdb_governor
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+TMDB_BASE_URL = "https://api.themoviedb.org/3"
+HEADERS = {
+    "User-Agent": "SubscriptionManager/1.0",
+    "Accept": "application/json"
+}
+
+# Retry transport errors and 5xx responses with exponential backoff (0.5s, 1s, 2s)
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = {500, 502, 503, 504}
+
+# get_title_bundle parts -> cache endpoint type / append_to_response name
+BUNDLE_PARTS = ("details", "providers", "similar", "recommendations")
+BUNDLE_ENDPOINTS = {"details": "details", "providers": "providers", "similar": "similar", "recommendations": "recommendations"}
+BUNDLE_APPEND = {"providers": "watch/providers", "similar": "similar", "recommendations": "recommendations"}
+
+_loop = None
+_loop_lock = threading.Lock()
+
+# Priority lane of the current caller; set via tmdb_client.priority()
+current_lane = contextvars.ContextVar("tmdb_lane", default=tmdb_governor.INTERACTIVE)
+
+
+def _get_loop():
+    """Start (once) the background event loop that owns the HTTP client."""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="tmdb-async-loop", daemon=True)
+                thread.start()
+                _loop = loop
+    return _loop
+
+
+def run_sync(coro, timeout: float = None):
+    """Run a coroutine on the shared TMDB loop and block until it finishes."""
+    loop = _get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_sync() called from the TMDB loop itself; await the coroutine instead")
+
+    # Carry the caller's priority lane over to the loop thread
+    lane = current_lane.get()
+
+    async def _in_lane():
+        current_lane.set(lane)
+        return await coro
+
+    return asyncio.run_coroutine_threadsafe(_in_lane(), loop).result(timeout)
+
+
+class AsyncTMDBClient:
+    """Pooled async TMDB client. Must only be used from the shared loop (see run_sync)."""
+
+    def __init__(self, max_concurrency: int = None):
+        self.max_concurrency = max_concurrency or settings.TMDB_MAX_CONCURRENCY
+        self._http = None
+        self._semaphore = None
+        self._inflight = {}  # key -> asyncio.Task (single-flight)
+        self.coalesced_count = 0
+        self.governor = tmdb_governor.RateGovernor(settings.TMDB_RATE_PER_SECOND, settings.TMDB_RATE_BURST)
+
+    def _ensure_client(self):
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=TMDB_BASE_URL,
+                headers=HEADERS,
+                http2=HTTP2_AVAILABLE,
+                verify=settings.TMDB_VERIFY_SSL,
+                timeout=10,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._http
+
+    async def get_json(self, path: str, params: dict = None):
+        """GET a TMDB path. Returns the parsed JSON, or None on any failure."""
+        client = self._ensure_client()
+        query = {"api_key": settings.TMDB_API_KEY}
+        if params:
+            query.update(params)
+
+        for attempt in range(MAX_RETRIES + 1):
+            await self.governor.acquire(current_lane.get())
+            try:
+                async with self._semaphore:
+                    response = await client.get(path, params=query)
+                if response.status_code == 200:
+                    return response.json()
+                if response.status_code == 429:
+                    # Throttled: pause the whole governor for Retry-After, then try again
+                    retry_after = tmdb_governor.parse_retry_after(response.headers.get("Retry-After"))
+                    self.governor.penalize(retry_after)
+                    print(f"TMDB 429 for {path}. Backing off {retry_after:.1f}s")
+                    last_error = "HTTP 429"
+                    continue
+                if response.status_code not in RETRY_STATUSES:
+                    print(f"TMDB Error {response.status_code} for {path}: {response.text[:200]}")
+                    return None
+                last_error = f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                last_error = str(e) or e.__class__.__name__
+            except Exception as e:
+                print(f"TMDB Exception for {path}: {e}")
+                return None
+
+            if attempt < MAX_RETRIES:
+                await asyncio.sleep(BACKOFF_FACTOR * (2 ** attempt))
+
+        print(f"TMDB request failed for {path} after {MAX_RETRIES + 1} attempts: {last_error}")
+        return None
+
+    async def _single_flight(self, key: str, factory):
+        """
+        Run factory() once per key at a time. Concurrent callers with the same key
+        await the task that is already running instead of starting their own.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced_count += 1
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(factory())
+        self._inflight[key] = task
+        task.add_done_callback(lambda _t: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def inflight_count(self) -> int:
+        return len(self._inflight)
+
+    async def stats(self) -> dict:
+        return {
+            **self.governor.stats(),
+            "inflight": self.inflight_count(),
+            "coalesced": self.coalesced_count,
+        }
+
+    async def fetch(self, endpoint: str, key: str, path: str, params: dict = None, extract=None):
+        """
+        Cached GET: serve from tmdb_cache, otherwise fetch, optionally extract(), and store.
+        Failures return None and are never cached. Concurrent calls for the same key share one load.
+        """
+        return await self._single_flight(key, lambda: self._load(endpoint, key, path, params, extract))
+
+    async def _load(self, endpoint: str, key: str, path: str, params: dict = None, extract=None):
+        cached = await asyncio.to_thread(tmdb_cache.load, key)
+        if cached is not tmdb_cache.MISS:
+            return cached
+        data = await self.get_json(path, params)
+        if data is not None and extract:
+            data = extract(data)
+        if data is not None:
+            await asyncio.to_thread(tmdb_cache.store, key, endpoint, data)
+        return data
+
+    # --- Endpoint helpers ---
+
+    async def search(self, query: str):
+        """Uncached /search/multi, but identical concurrent queries are still coalesced."""
+        params = {"query": query, "include_adult": False}
+        return await self._single_flight(f"search:{query}", lambda: self.get_json("/search/multi", params))
+
+    async def watch_providers(self, media_type: str, tmdb_id: int):
+        """All-region provider map for a title ({"US": {...}, "IN": {...}}), or None."""
+        return await self.fetch(
+            "providers", tmdb_cache.make_key("providers", media_type, tmdb_id),
+            f"/{media_type}/{tmdb_id}/watch/providers",
+            extract=lambda d: d.get("results", {}),
+        )
+
+    async def details(self, media_type: str, tmdb_id: int):
+        return await self.fetch(
+            "details", tmdb_cache.make_key("details", media_type, tmdb_id),
+            f"/{media_type}/{tmdb_id}",
+        )
+
+    async def similar(self, media_type: str, tmdb_id: int):
+        return await self.fetch(
+            "similar", tmdb_cache.make_key("similar", media_type, tmdb_id),
+            f"/{media_type}/{tmdb_id}/similar", params={"page": 1},
+        )
+
+    async def trending(self, media_type: str, time_window: str = "week"):
+        return await self.fetch(
+            "trending", tmdb_cache.make_key("trending", media_type, time_window),
+            f"/trending/{media_type}/{time_window}", params={"language": "en-US"},
+        )
+
+    async def discover(self, media_type: str, params: dict):
+        return await self.fetch(
+            "discover", tmdb_cache.make_params_key("discover", media_type, params),
+            f"/discover/{media_type}", params=params,
+        )
+
+    async def provider_list(self, media_type: str, region: str):
+        """TMDB's watch-provider catalogue for a region ([{provider_id, provider_name, ...}])."""
+        return await self.fetch(
+            "provider_list", tmdb_cache.make_key("provider_list", media_type, region),
+            f"/watch/providers/{media_type}", params={"watch_region": region},
+            extract=lambda d: d.get("results", []),
+        )
+
+    async def title_bundle(self, media_type: str, tmdb_id: int, parts=BUNDLE_PARTS) -> dict:
+        """
+        Details, watch providers (all regions), similar and recommendations for one title.
+        Parts already in tmdb_cache are served from there; the rest come from a single
+        /{media_type}/{id}?append_to_response=... request whose pieces are written back
+        into the per-part cache entries (so later get_details/get_watch_providers calls hit).
+        Missing parts come back as None.
+        """
+        parts = [p for p in parts if p in BUNDLE_PARTS]
+        keys = {p: tmdb_cache.make_key(BUNDLE_ENDPOINTS[p], media_type, tmdb_id) for p in BUNDLE_PARTS}
+        loaded = await asyncio.gather(*(asyncio.to_thread(tmdb_cache.load, keys[p]) for p in parts))
+        bundle = {p: (None if v is tmdb_cache.MISS else v) for p, v in zip(parts, loaded)}
+        missing = [p for p in parts if bundle[p] is None]
+        if not missing:
+            return bundle
+
+        append = [BUNDLE_APPEND[p] for p in missing if p != "details"]
+        bundle_key = f"bundle:{media_type}:{tmdb_id}:{','.join(sorted(append))}"
+        params = {"append_to_response": ",".join(append)} if append else None
+        data = await self._single_flight(bundle_key, lambda: self.get_json(f"/{media_type}/{tmdb_id}", params))
+        if data is None:
+            return bundle
+
+        # Split the combined payload back into its per-part shapes
+        data = dict(data)
+        fetched = {
+            "providers": (data.pop("watch/providers", None) or {}).get("results", {}) if "watch/providers" in append else None,
+            "similar": data.pop("similar", None),
+            "recommendations": data.pop("recommendations", None),
+        }
+        fetched["details"] = data  # base response is always the full details payload
+
+        for part, value in fetched.items():
+            if value is None:
+                continue
+            await asyncio.to_thread(tmdb_cache.store, keys[part], BUNDLE_ENDPOINTS[part], value)
+            if part in parts:
+                bundle[part] = value
+        return bundle
+
+    async def changes(self, media_type: str, start_date: str, end_date: str, page: int = 1):
+        """One page of /{media_type}/changes (ids of titles edited in the window). Never cached."""
+        params = {"start_date": start_date, "end_date": end_date, "page": page}
+        return await self.get_json(f"/{media_type}/changes", params)
+
+    # --- Fan-out helpers ---
+
+    async def changed_ids(self, media_type: str, start_date: str, end_date: str, max_pages: int = 100) -> set:
+        """All ids from the changes feed for the window; pages after the first are fetched concurrently."""
+        first = await self.changes(media_type, start_date, end_date, 1)
+        if first is None:
+            return None
+        pages = [first]
+        total_pages = min(int(first.get("total_pages") or 1), max_pages)
+        if total_pages > 1:
+            rest = await asyncio.gather(*(
+                self.changes(media_type, start_date, end_date, page) for page in range(2, total_pages + 1)
+            ))
+            if any(r is None for r in rest):
+                return None  # a partial feed would silently skip changed titles
+            pages.extend(rest)
+        return {r["id"] for page in pages for r in page.get("results", []) if r.get("id") is not None}
+
+    async def watch_providers_many(self, items, region: str = "US") -> dict:
+        """Providers for many (media_type, tmdb_id) pairs in one region, fetched concurrently."""
+        keys = list(dict.fromkeys((m, int(i)) for m, i in items))
+        results = await asyncio.gather(*(self.watch_providers(m, i) for m, i in keys))
+        return {k: (r or {}).get(region, {}) for k, r in zip(keys, results)}
+
+    async def watch_providers_all_many(self, items) -> dict:
+        """All-region provider maps for many (media_type, tmdb_id) pairs; failed lookups map to None."""
+        keys = list(dict.fromkeys((m, int(i)) for m, i in items))
+        results = await asyncio.gather(*(self.watch_providers(m, i) for m, i in keys))
+        return dict(zip(keys, results))
+
+    async def provider_list_all(self, region: str) -> list:
+        """Movie and TV provider catalogues for a region, merged by provider_id."""
+        movie, tv = await asyncio.gather(self.provider_list("movie", region), self.provider_list("tv", region))
+        merged = {}
+        for p in (movie or []) + (tv or []):
+            merged.setdefault(p.get("provider_id"), p)
+        return [p for pid, p in merged.items() if pid is not None]
+
+    async def details_many(self, items) -> dict:
+        """Details for many (media_type, tmdb_id) pairs, fetched concurrently."""
+        keys = list(dict.fromkeys((m, int(i)) for m, i in items))
+        results = await asyncio.gather(*(self.details(m, i) for m, i in keys))
+        return {k: (r or {}) for k, r in zip(keys, results)}
+
+    async def similar_many(self, items) -> dict:
+        """Similar titles for many (media_type, tmdb_id) pairs, fetched concurrently."""
+        keys = list(dict.fromkeys((m, int(i)) for m, i in items))
+        results = await asyncio.gather(*(self.similar(m, i) for m, i in keys))
+        return {k: (r if r is not None else {"results": []}) for k, r in zip(keys, results)}
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+
+# Process-wide client (lives on the shared loop)
+client = AsyncTMDBClient()
+
+
+def set_rate_share(rate_per_second: float):
+    """Pace this process at rate_per_second (its share of TMDB_RATE_PER_SECOND). Call at process start."""
+    rate = max(1.0, rate_per_second)
+    client.governor.set_rate(rate, max(1, min(settings.TMDB_RATE_BURST, int(rate))))
+    print(f"[TMDB] Pacing this process at {rate:g} requests/s")
@@ -0,0 +1,192 @@
+"""
+Persistent TMDB response cache.
+
+Entries live in the `tmdb_cache` table, so every worker shares them and they
+survive restarts. Each endpoint type has its own TTL, failed lookups are never
+stored, and the table is kept bounded by evicting the least recently used rows.
+"""
+import json
+import hashlib
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal
+from config import settings
+import models
+
+# How long a payload stays fresh, per endpoint type (hours)
+ENDPOINT_TTL_HOURS = {
+    "providers": 24,
+    "details": 72,
+    "similar": 72,
+    "recommendations": 72,
+    "trending": 6,
+    "discover": 12,
+    "provider_list": 168,
+}
+DEFAULT_TTL_HOURS = 24
+
+# Only bump last_accessed_at when it is older than this, so hot keys don't write on every read
+ACCESS_TOUCH_INTERVAL = timedelta(minutes=15)
+
+# Run an eviction sweep every N writes (per process)
+EVICT_EVERY_N_WRITES = 500
+
+MISS = object()
+_writes_since_evict = 0
+
+
+def make_key(endpoint: str, *parts) -> str:
+    """Build a cache key like 'providers:movie:550'."""
+    return ":".join([endpoint] + [str(p) for p in parts])
+
+
+def make_params_key(endpoint: str, path: str, params: dict) -> str:
+    """Build a stable key for parameterised endpoints (e.g. discover) by hashing the query."""
+    clean = {k: v for k, v in params.items() if k != "api_key" and v is not None}
+    digest = hashlib.sha1(json.dumps(clean, sort_keys=True, default=str).encode()).hexdigest()
+    return make_key(endpoint, path, digest)
+
+
+def _now():
+    return datetime.utcnow()
+
+
+def _naive(dt):
+    return dt.replace(tzinfo=None) if dt and dt.tzinfo else dt
+
+
+def load(key: str):
+    """Return the cached payload for key, or MISS if absent/expired."""
+    if not settings.TMDB_CACHE_ENABLED:
+        return MISS
+    db = SessionLocal()
+    try:
+        entry = db.query(models.TmdbCacheEntry).filter(models.TmdbCacheEntry.key == key).first()
+        if not entry or not entry.expires_at:
+            return MISS
+        now = _now()
+        if _naive(entry.expires_at) <= now:
+            return MISS
+        last_access = _naive(entry.last_accessed_at)
+        if not last_access or now - last_access > ACCESS_TOUCH_INTERVAL:
+            entry.last_accessed_at = now
+            db.commit()
+        return json.loads(entry.data)
+    except Exception as e:
+        print(f"[TMDB_CACHE] Read failed for {key}: {e}")
+        return MISS
+    finally:
+        db.close()
+
+
+def store(key: str, endpoint: str, data):
+    """Upsert a payload with the TTL for its endpoint type."""
+    global _writes_since_evict
+    if not settings.TMDB_CACHE_ENABLED:
+        return
+    now = _now()
+    ttl = timedelta(hours=ENDPOINT_TTL_HOURS.get(endpoint, DEFAULT_TTL_HOURS))
+    json_data = json.dumps(data)
+    db = SessionLocal()
+    try:
+        entry = db.query(models.TmdbCacheEntry).filter(models.TmdbCacheEntry.key == key).first()
+        if not entry:
+            entry = models.TmdbCacheEntry(key=key, endpoint=endpoint)
+            db.add(entry)
+        entry.data = json_data
+        entry.fetched_at = now
+        entry.expires_at = now + ttl
+        entry.last_accessed_at = now
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker inserted the same key first - overwrite theirs
+            db.rollback()
+            db.query(models.TmdbCacheEntry).filter(models.TmdbCacheEntry.key == key).update({
+                "data": json_data, "fetched_at": now, "expires_at": now + ttl, "last_accessed_at": now
+            })
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"[TMDB_CACHE] Write failed for {key}: {e}")
+    finally:
+        db.close()
+
+    _writes_since_evict += 1
+    if _writes_since_evict >= EVICT_EVERY_N_WRITES:
+        _writes_since_evict = 0
+        evict()
+
+
+def evict(max_entries: int = None):
+    """Delete expired rows, then trim the least recently used rows down to max_entries."""
+    max_entries = max_entries or settings.TMDB_CACHE_MAX_ENTRIES
+    db = SessionLocal()
+    try:
+        expired = db.query(models.TmdbCacheEntry).filter(
+            models.TmdbCacheEntry.expires_at <= _now()
+        ).delete(synchronize_session=False)
+
+        total = db.query(models.TmdbCacheEntry).count()
+        trimmed = 0
+        if total > max_entries:
+            oldest = db.query(models.TmdbCacheEntry.key).order_by(
+                models.TmdbCacheEntry.last_accessed_at.asc()
+            ).limit(total - max_entries).all()
+            oldest_keys = [row[0] for row in oldest]
+            for i in range(0, len(oldest_keys), 500):
+                trimmed += db.query(models.TmdbCacheEntry).filter(
+                    models.TmdbCacheEntry.key.in_(oldest_keys[i:i + 500])
+                ).delete(synchronize_session=False)
+        db.commit()
+        if expired or trimmed:
+            print(f"[TMDB_CACHE] Evicted {expired} expired + {trimmed} LRU entries")
+    except Exception as e:
+        db.rollback()
+        print(f"[TMDB_CACHE] Eviction failed: {e}")
+    finally:
+        db.close()
+
+
+def invalidate(key: str):
+    """Drop a single entry (e.g. after an upstream change)."""
+    invalidate_many([key])
+
+
+def invalidate_many(keys) -> int:
+    """Drop many entries at once. Returns the number of rows removed."""
+    keys = list(keys)
+    removed = 0
+    db = SessionLocal()
+    try:
+        for i in range(0, len(keys), 500):
+            removed += db.query(models.TmdbCacheEntry).filter(
+                models.TmdbCacheEntry.key.in_(keys[i:i + 500])
+            ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    return removed
+
+
+def extend(keys, endpoint: str) -> int:
+    """
+    Re-arm the TTL of existing entries without refetching them, for payloads known
+    to be unchanged upstream (see provider_sync.py). Returns the number of rows touched.
+    """
+    keys = list(keys)
+    expires_at = _now() + timedelta(hours=ENDPOINT_TTL_HOURS.get(endpoint, DEFAULT_TTL_HOURS))
+    touched = 0
+    db = SessionLocal()
+    try:
+        for i in range(0, len(keys), 500):
+            touched += db.query(models.TmdbCacheEntry).filter(
+                models.TmdbCacheEntry.key.in_(keys[i:i + 500])
+            ).update({"expires_at": expires_at}, synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"[TMDB_CACHE] Extend failed for {endpoint}: {e}")
+    finally:
+        db.close()
+    return touched
@@ -1,86 +1,125 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from config import settings
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util import Retry
-import urllib3
+import tmdb_async
+import tmdb_governor
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+# All HTTP goes through the pooled async client (see tmdb_async.py).
+# These sync functions are thin wrappers so existing callers keep working.
+TMDB_BASE_URL = tmdb_async.TMDB_BASE_URL
+
+# Priority lanes for the rate governor
+INTERACTIVE = tmdb_governor.INTERACTIVE
+BACKGROUND = tmdb_governor.BACKGROUND
+
+
+@contextmanager
+def priority(lane: str):
+    """
+    Run the enclosed TMDB calls in the given lane, e.g.
+        with tmdb_client.priority(tmdb_client.BACKGROUND): ...
+    Calls default to INTERACTIVE.
+    """
+    token = tmdb_async.current_lane.set(lane)
+    try:
+        yield
+    finally:
+        tmdb_async.current_lane.reset(token)
+
+def run_parallel(*calls) -> list:
+    """
+    Run independent zero-argument TMDB calls concurrently (e.g. movie + TV trending)
+    and return their results in order. Callers keep their priority lane.
+    """
+    if len(calls) < 2:
+        return [c() for c in calls]
+    with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, c) for c in calls]
+        return [f.result() for f in futures]
+
+def get_client_stats() -> dict:
+    """Governor queue depth per lane, tokens, throttling and single-flight counters."""
+    try:
+        return tmdb_async.run_sync(tmdb_async.client.stats(), timeout=2)
+    except Exception as e:
+        return {"error": str(e)}
 
-# Global Robust Session
-session = requests.Session()
-retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504])
-session.mount('https://', HTTPAdapter(max_retries=retries))
 
-TMDB_BASE_URL = "https://api.themoviedb.org/3"
 
 def search_multi(query: str):
     if not settings.TMDB_API_KEY or settings.TMDB_API_KEY == "YOUR_TMDB_API_KEY_HERE":
         return {"results": []}
-    
-    url = f"{TMDB_BASE_URL}/search/multi"
-    params = {
-        "api_key": settings.TMDB_API_KEY,
-        "query": query,
-        "include_adult": False
-    }
-    headers = {
-        "User-Agent": "SubscriptionManager/1.0",
-        "Accept": "application/json"
-    }
-    
-    
+
     try:
-        # Use global session
-        response = session.get(url, params=params, headers=headers, timeout=10, verify=False)
-        # response.raise_for_status() # Let's be lenient like raw script
-        
-        if response.status_code == 200:
-            data = response.json()
-            # Basic filtering for safety
-            results = data.get("results", [])
-            filtered = [
-                r for r in results 
-                if r.get("media_type") in ["movie", "tv"]
-            ]
-            return {"results": filtered}
-        else:
-            print(f"TMDB Error {response.status_code}: {response.text}")
+        data = tmdb_async.run_sync(tmdb_async.client.search(query))
+        if data is None:
             return {"results": []}
-                
+        # Basic filtering for safety
+        results = data.get("results", [])
+        filtered = [
+            r for r in results
+            if r.get("media_type") in ["movie", "tv"]
+        ]
+        return {"results": filtered}
     except Exception as e:
         print(f"TMDB Exception: {e}")
         return {"results": []}
 
-from functools import lru_cache
-
-@lru_cache(maxsize=128)
 def get_watch_providers(media_type: str, tmdb_id: int, region: str = "US"):
     """
     Fetch watch providers for a movie or TV show.
-    Defaults to US region.
+    Defaults to US region. The all-region payload is cached, so any region is served from one fetch.
     """
     if settings.TMDB_API_KEY == "YOUR_TMDB_API_KEY_HERE":
         return {}
 
-    url = f"{TMDB_BASE_URL}/{media_type}/{tmdb_id}/watch/providers"
-    params = {"api_key": settings.TMDB_API_KEY}
-    
-    headers = {
-        "User-Agent": "SubscriptionManager/1.0",
-        "Accept": "application/json"
-    }
-    
     try:
-        # Use global session
-        response = session.get(url, params=params, headers=headers, timeout=10, verify=False)
-        response.raise_for_status()
-        data = response.json()
-        # Return providers for the specified region or empty dict
-        return data.get("results", {}).get(region, {})
+        results = tmdb_async.run_sync(tmdb_async.client.watch_providers(media_type, tmdb_id))
+    except Exception as e:
+        print(f"Error fetching providers for {media_type}/{tmdb_id}: {e}")
+        return {}
+    # Return providers for the specified region or empty dict
+    return (results or {}).get(region, {})
+
+def get_watch_providers_many(items, region: str = "US") -> dict:
+    """
+    Fetch watch providers for many (media_type, tmdb_id) pairs concurrently.
+    Returns {(media_type, tmdb_id): providers_for_region}.
+    """
+    if settings.TMDB_API_KEY == "YOUR_TMDB_API_KEY_HERE":
+        return {(m, int(i)): {} for m, i in items}
+
+    try:
+        return tmdb_async.run_sync(tmdb_async.client.watch_providers_many(items, region))
+    except Exception as e:
+        print(f"Error fetching providers batch: {e}")
+        return {(m, int(i)): {} for m, i in items}
+
+def get_watch_providers_all_many(items) -> dict:
+    """
+    All-region provider maps ({"US": {...}, "IN": {...}}) for many (media_type, tmdb_id) pairs.
+    Titles whose lookup failed map to None so callers can tell "no providers" from "unknown".
+    """
+    if settings.TMDB_API_KEY == "YOUR_TMDB_API_KEY_HERE":
+        return {(m, int(i)): None for m, i in items}
+
+    try:
+        return tmdb_async.run_sync(tmdb_async.client.watch_providers_all_many(items))
     except Exception as e:
-         print(f"Error fetching providers for {media_type}/{tmdb_id}: {e}")
-            
-    return {}
+        print(f"Error fetching providers batch: {e}")
+        return {(m, int(i)): None for m, i in items}
+
+def get_provider_list(region: str = "US") -> list:
+    """All watch providers TMDB knows for a region (movie + TV), e.g. for building provider_index."""
+    if not settings.TMDB_API_KEY or settings.TMDB_API_KEY == "YOUR_TMDB_API_KEY_HERE":
+        return []
+
+    try:
+        return tmdb_async.run_sync(tmdb_async.client.provider_list_all(region))
+    except Exception as e:
+        print(f"Error fetching provider list for {region}: {e}")
+        return []
 
 def get_similar(media_type: str, tmdb_id: int):
     """
@@ -89,58 +128,92 @@ def get_similar(media_type: str, tmdb_id: int):
     if settings.TMDB_API_KEY == "YOUR_TMDB_API_KEY_HERE":
         return {"results": []}
 
-    url = f"{TMDB_BASE_URL}/{media_type}/{tmdb_id}/similar"
-    params = {"api_key": settings.TMDB_API_KEY, "page": 1}
-    
-    headers = {
-        "User-Agent": "SubscriptionManager/1.0",
-        "Accept": "application/json"
-    }
     try:
-        # Use global session
-        response = session.get(url, params=params, headers=headers, timeout=10, verify=False)
-        response.raise_for_status()
-        data = response.json()
-        return data
+        data = tmdb_async.run_sync(tmdb_async.client.similar(media_type, tmdb_id))
     except Exception as e:
         print(f"Error fetching similar content for {media_type}/{tmdb_id}: {e}")
-        return {"results": []}
+        data = None
+    return data if data is not None else {"results": []}
+
+def get_similar_many(items) -> dict:
+    """Fetch similar titles for many (media_type, tmdb_id) pairs concurrently."""
+    try:
+        return tmdb_async.run_sync(tmdb_async.client.similar_many(items))
+    except Exception as e:
+        print(f"Error fetching similar batch: {e}")
+        return {(m, int(i)): {"results": []} for m, i in items}
 
 def get_details(media_type: str, tmdb_id: int):
     """Fetch full details including genres."""
-    url = f"{TMDB_BASE_URL}/{media_type}/{tmdb_id}"
-    params = {"api_key": settings.TMDB_API_KEY}
-    headers = {
-        "User-Agent": "SubscriptionManager/1.0",
-        "Accept": "application/json"
-    }
     try:
-        # Use global session
-        response = session.get(url, params=params, headers=headers, timeout=10, verify=False)
-        if response.status_code == 200:
-            return response.json()
+        data = tmdb_async.run_sync(tmdb_async.client.details(media_type, tmdb_id))
     except Exception as e:
         print(f"Error fetching details: {e}")
-    return {}
+        data = None
+    return data if data is not None else {}
+
+def get_details_many(items) -> dict:
+    """Fetch full details for many (media_type, tmdb_id) pairs concurrently."""
+    try:
+        return tmdb_async.run_sync(tmdb_async.client.details_many(items))
+    except Exception as e:
+        print(f"Error fetching details batch: {e}")
+        return {(m, int(i)): {} for m, i in items}
+
+def get_title_bundle(media_type: str, tmdb_id: int, region: str = "US", parts=("details", "providers")) -> dict:
+    """
+    Fetch several parts for one title in a single round-trip (TMDB append_to_response).
+    parts: any of "details", "providers", "similar", "recommendations".
+    Returns {"details": {...}, "providers": {...region...}, "similar": {"results": [...]}, ...}
+    for the requested parts, with the same empty fallbacks as the single-part functions.
+    Each part also lands in its own cache entry, so later single-part calls are cache hits.
+    """
+    empty = {"details": {}, "providers": {}, "similar": {"results": []}, "recommendations": {"results": []}}
+    if settings.TMDB_API_KEY == "YOUR_TMDB_API_KEY_HERE":
+        return {p: empty[p] for p in parts if p in empty}
+
+    try:
+        bundle = tmdb_async.run_sync(tmdb_async.client.title_bundle(media_type, tmdb_id, parts))
+    except Exception as e:
+        print(f"Error fetching title bundle for {media_type}/{tmdb_id}: {e}")
+        bundle = {}
+
+    result = {}
+    for part in parts:
+        if part not in empty:
+            continue
+        value = bundle.get(part)
+        if part == "providers":
+            value = (value or {}).get(region, {})
+        result[part] = value if value is not None else empty[part]
+    return result
+
+def get_changed_ids(media_type: str, start_date: str, end_date: str):
+    """
+    Ids of titles TMDB reports as changed between start_date and end_date (YYYY-MM-DD,
+    at most 14 days apart). Returns None if the feed could not be read completely.
+    """
+    if not settings.TMDB_API_KEY or settings.TMDB_API_KEY == "YOUR_TMDB_API_KEY_HERE":
+        return None
+
+    try:
+        return tmdb_async.run_sync(tmdb_async.client.changed_ids(media_type, start_date, end_date))
+    except Exception as e:
+        print(f"Error fetching {media_type} changes: {e}")
+        return None
 
 def get_trending(media_type: str, time_window: str = "week"):
     """Fetch genuinely trending content from TMDB /trending endpoint."""
-    url = f"{TMDB_BASE_URL}/trending/{media_type}/{time_window}"
-    params = {"api_key": settings.TMDB_API_KEY, "language": "en-US"}
-    headers = {"User-Agent": "SubscriptionManager/1.0", "Accept": "application/json"}
     try:
-        response = session.get(url, params=params, headers=headers, timeout=10, verify=False)
-        if response.status_code == 200:
-            return response.json()
+        data = tmdb_async.run_sync(tmdb_async.client.trending(media_type, time_window))
     except Exception as e:
         print(f"Error fetching trending: {e}")
-    return {"results": []}
+        data = None
+    return data if data is not None else {"results": []}
 
 def discover_media(media_type: str, with_genres: str = None, sort_by: str = "popularity.desc", min_vote_count: int = 100, min_vote_average: float = 0, with_watch_providers: str = None, watch_region: str = "US", with_original_language: str = None, extra_params: dict = None):
     """Discover media with advanced filters."""
-    url = f"{TMDB_BASE_URL}/discover/{media_type}"
     params = {
-        "api_key": settings.TMDB_API_KEY,
         "sort_by": sort_by,
         "vote_count.gte": min_vote_count,
         "vote_average.gte": min_vote_average,
@@ -157,25 +230,11 @@ def discover_media(media_type: str, with_genres: str = None, sort_by: str = "pop
         params["watch_region"] = watch_region
     if extra_params:
         params.update(extra_params)
-        
-    headers = {
-        "User-Agent": "SubscriptionManager/1.0",
-        "Accept": "application/json"
-    }
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            # Use global session
-            response = session.get(url, params=params, headers=headers, timeout=10, verify=False)
-            if response.status_code == 200:
-                return response.json()
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:
-                import time
-                time.sleep(1)
-                continue
-            print(f"Error discovering media (Attempt {attempt+1}): {e}")
-        except Exception as e:
-            print(f"Error discovering media: {e}")
-            break
-    return {"results": []}
+
+    # Retries (5xx / network errors) are handled by the async transport
+    try:
+        data = tmdb_async.run_sync(tmdb_async.client.discover(media_type, params))
+    except Exception as e:
+        print(f"Error discovering media: {e}")
+        data = None
+    return data if data is not None else {"results": []}
@@ -0,0 +1,143 @@
+"""
+Client-side TMDB rate governor.
+
+A token bucket (TMDB_RATE_PER_SECOND, bursting to TMDB_RATE_BURST) shared by
+every request the process makes. Callers wait in one of two priority lanes:
+interactive work (search, details modal, AI pick enrichment) is always served
+before background work (recommendation refreshes, backfill scripts), so mass
+refreshes can't starve the user-facing path. A 429 with Retry-After pauses the
+whole bucket until TMDB says we may continue.
+
+Lanes only arbitrate within one process. When jobs run in dedicated worker
+processes (worker.py), each process paces at its own share of the rate instead
+(tmdb_async.set_rate_share), and the API no longer outranks their requests.
+
+Lives on the shared TMDB event loop (see tmdb_async.py); not thread-safe on its own.
+"""
+import asyncio
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+LANES = (INTERACTIVE, BACKGROUND)  # highest priority first
+
+# Used when a 429 arrives without a usable Retry-After header
+DEFAULT_RETRY_AFTER = 2.0
+
+
+def parse_retry_after(value) -> float:
+    """Retry-After is either delta-seconds or an HTTP date. Returns seconds to wait."""
+    if not value:
+        return DEFAULT_RETRY_AFTER
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except Exception:
+        return DEFAULT_RETRY_AFTER
+
+
+class RateGovernor:
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate = float(rate_per_second)
+        self.burst = float(burst)
+        self._tokens = self.burst
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiters = {lane: deque() for lane in LANES}
+        self._timer = None
+        self.throttled_count = 0  # number of 429s seen
+
+    def set_rate(self, rate_per_second: float, burst: int):
+        """Change the pacing (at process start, before requests are in flight)."""
+        self.rate = float(rate_per_second)
+        self.burst = float(burst)
+        self._tokens = min(self._tokens, self.burst)
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._last_refill = now
+
+    def _has_waiters(self) -> bool:
+        return any(self._waiters[lane] for lane in LANES)
+
+    async def acquire(self, lane: str = INTERACTIVE):
+        """Wait for a request slot. Interactive waiters are always served before background ones."""
+        if lane not in self._waiters:
+            lane = INTERACTIVE
+        now = time.monotonic()
+        self._refill(now)
+        if not self._has_waiters() and now >= self._blocked_until and self._tokens >= 1:
+            self._tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[lane].append(future)
+        self._schedule(0)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future in self._waiters[lane]:
+                self._waiters[lane].remove(future)
+            elif future.done() and not future.cancelled():
+                self._tokens = min(self.burst, self._tokens + 1)  # granted but unused
+            raise
+
+    def _schedule(self, delay: float):
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _dispatch(self):
+        self._timer = None
+        now = time.monotonic()
+        self._refill(now)
+
+        if now < self._blocked_until:
+            if self._has_waiters():
+                self._schedule(self._blocked_until - now)
+            return
+
+        for lane in LANES:
+            queue = self._waiters[lane]
+            while queue and self._tokens >= 1:
+                future = queue.popleft()
+                if future.done():  # cancelled while waiting
+                    continue
+                future.set_result(None)
+                self._tokens -= 1
+            if queue:
+                break  # out of tokens - lower lanes keep waiting
+
+        if self._has_waiters():
+            self._schedule(max(0.0, (1 - self._tokens) / self.rate))
+
+    def penalize(self, retry_after: float):
+        """TMDB returned 429: stop granting slots for retry_after seconds."""
+        self.throttled_count += 1
+        self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+        # Empty the bucket and don't refill until the pause ends, so we don't burst right after it
+        self._tokens = 0.0
+        self._last_refill = self._blocked_until
+
+    def queue_depth(self) -> dict:
+        return {lane: sum(1 for f in self._waiters[lane] if not f.done()) for lane in LANES}
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        self._refill(now)
+        return {
+            "queue_depth": self.queue_depth(),
+            "tokens": round(self._tokens, 2),
+            "throttled_for_s": round(max(0.0, self._blocked_until - now), 2),
+            "throttled_count": self.throttled_count,
+        }
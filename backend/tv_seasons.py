@@ -0,0 +1,123 @@
+"""
+Persisted TV season structure.
+
+Per show (a `titles` row): ordered seasons with their episode counts in
+`tv_seasons`, plus last/next air dates. Progress math (absolute episode
+progress, percentage, per-season counts) reads this locally, so recomputing
+a dashboard makes no TMDB details calls. The daily catalog job refreshes
+shows that are due: never fetched, a scheduled episode has aired, or the
+structure is older than the refresh window for airing / ended shows.
+"""
+from datetime import datetime, date, timedelta
+from sqlalchemy.orm import Session
+import models
+import tmdb_client
+
+# How long a structure stays current
+REFRESH_AFTER_AIRING = timedelta(days=3)   # in production: new episodes may be announced
+REFRESH_AFTER_ENDED = timedelta(days=30)
+
+
+def _now():
+    return datetime.utcnow()
+
+
+def _naive(dt):
+    return dt.replace(tzinfo=None) if dt and dt.tzinfo else dt
+
+
+def store(entry: models.Title, details: dict):
+    """Replace a show's season structure with the one in a TMDB /tv/{id} payload (no commit)."""
+    if "seasons" not in details:
+        return
+    by_number = {s.season_number: s for s in entry.seasons}
+    seasons = []
+    for s in details.get("seasons") or []:
+        number = s.get("season_number")
+        if number is None:
+            continue
+        season = by_number.get(number) or models.TvSeason(season_number=number)
+        season.episode_count = s.get("episode_count") or 0
+        season.air_date = s.get("air_date")
+        seasons.append(season)
+    entry.seasons = sorted(seasons, key=lambda s: s.season_number)
+    entry.in_production = details.get("in_production")
+    entry.last_air_date = details.get("last_air_date")
+    entry.next_episode_air_date = (details.get("next_episode_to_air") or {}).get("air_date")
+    entry.seasons_refreshed_at = _now()
+
+
+def needs_refresh(entry: models.Title, today: date = None) -> bool:
+    if not entry.seasons_refreshed_at:
+        return True
+    today = today or date.today()
+    if entry.next_episode_air_date and entry.next_episode_air_date <= today.isoformat():
+        return True  # a scheduled episode has aired since the last fetch
+    window = REFRESH_AFTER_AIRING if entry.in_production else REFRESH_AFTER_ENDED
+    return _naive(entry.seasons_refreshed_at) < _now() - window
+
+
+def refresh(db: Session, entries) -> int:
+    """Fetch details for the given shows (concurrently) and store their season structure. Commits."""
+    entries = [e for e in entries if e is not None and e.media_type == "tv"]
+    if not entries:
+        return 0
+    details = tmdb_client.get_details_many([("tv", e.tmdb_id) for e in entries])
+    updated = 0
+    for entry in entries:
+        data = details.get(("tv", int(entry.tmdb_id)))
+        if not data:
+            continue
+        store(entry, data)
+        entry.total_seasons = data.get("number_of_seasons", 0) or entry.total_seasons
+        entry.total_episodes = data.get("number_of_episodes", 0) or entry.total_episodes
+        updated += 1
+    db.commit()
+    return updated
+
+
+def due_entries(db: Session, limit: int = 500) -> list:
+    """Watchlisted shows whose season structure should be refreshed."""
+    shows = db.query(models.Title).filter(
+        models.Title.media_type == "tv",
+        models.Title.id.in_(
+            db.query(models.Title.id).join(
+                models.WatchlistItem,
+                (models.WatchlistItem.media_type == models.Title.media_type) &
+                (models.WatchlistItem.tmdb_id == models.Title.tmdb_id)
+            )
+        )
+    ).all()
+    today = date.today()
+    return [s for s in shows if needs_refresh(s, today)][:limit]
+
+
+def progress(seasons, current_season: int, current_episode: int, total_episodes: int) -> dict:
+    """
+    Episode progress from a stored season structure (specials excluded):
+    current_season_episodes, absolute_episode_progress, progress_pct and the seasons list.
+    """
+    current_season_episodes = 0
+    absolute_progress = 0
+    progress_pct = 0
+    curr_s_num = current_season or 1
+    regular = [s for s in seasons if s.season_number and s.season_number > 0]
+    for s in regular:
+        if s.season_number < curr_s_num:
+            absolute_progress += s.episode_count or 0
+        elif s.season_number == curr_s_num:
+            current_season_episodes = s.episode_count or 0
+            absolute_progress += current_episode or 0
+
+    if regular:
+        if total_episodes and total_episodes > 0:
+            progress_pct = min(100, round((absolute_progress / total_episodes) * 100))
+        elif current_season_episodes > 0:
+            progress_pct = min(100, round(((current_episode or 0) / current_season_episodes) * 100))
+
+    return {
+        "current_season_episodes": current_season_episodes,
+        "absolute_episode_progress": absolute_progress,
+        "progress_pct": progress_pct,
+        "seasons": [{"season_number": s.season_number, "episode_count": s.episode_count or 0} for s in regular],
+    }
@@ -0,0 +1,75 @@
+"""
+One user's data, loaded once per request or job.
+
+Dashboard and similar-content calculations, the coverage breakdown and AI
+insights all read the same state: the user, their watchlist (with catalog
+titles), subscriptions, interests, preferences and the region's services.
+load() fetches it with eager loading in a handful of queries (user, watchlist
+joined to titles, subscriptions, interests; seasons only when asked for) and
+the UserContext is passed down instead of each helper querying again.
+Services and plans come from the shared catalog snapshot (service_catalog.py).
+
+The context is a snapshot: take cache_deps.versions() before loading it, so
+an edit made after the load still invalidates whatever is computed from it.
+Loading one turns off expire_on_commit for the rest of the session (a request
+or job), so commits made while computing (cache writes, season fills) don't
+expire the loaded rows and reload them one by one.
+"""
+import json
+from sqlalchemy.orm import selectinload
+import models
+import service_catalog
+
+
+class UserContext:
+
+    def __init__(self, db, user: models.User):
+        self._db = db
+        self.user = user
+        self.user_id = user.id
+        self.country = user.country or "US"
+        self.watchlist = sorted(user.watchlist, key=lambda item: item.id)
+        self.subscriptions = list(user.subscriptions)
+        self.interests = sorted(user.interests, key=lambda i: i.score or 0, reverse=True)
+        self.preferences = {}
+        if user.preferences:
+            try:
+                self.preferences = json.loads(user.preferences)
+            except ValueError:
+                pass
+        self._catalog = None
+
+    def ott_subscriptions(self, country: str = None, any_region: bool = False) -> list:
+        """Active OTT subscriptions in country (default: the user's), or in every region."""
+        country = country or self.country
+        return [
+            s for s in self.subscriptions
+            if s.is_active and s.category == "OTT" and (any_region or s.country == country)
+        ]
+
+    @property
+    def catalog(self) -> service_catalog.Catalog:
+        if self._catalog is None:
+            self._catalog = service_catalog.get(self._db)
+        return self._catalog
+
+    def service(self, name: str, any_region: bool = False):
+        """Catalog entry for a service in the user's region, else the US one (see Catalog.service)."""
+        return self.catalog.service(name, self.country, any_region=any_region)
+
+    def logo(self, name: str):
+        return self.catalog.logo(name, self.country)
+
+
+def load(db, user_id: int, seasons: bool = False):
+    """UserContext for user_id, or None if the user doesn't exist. seasons: also load TV season rows."""
+    watchlist = selectinload(models.User.watchlist)
+    if seasons:
+        watchlist = watchlist.selectinload(models.WatchlistItem.catalog).selectinload(models.Title.seasons)
+    db.expire_on_commit = False
+    user = db.query(models.User).options(
+        watchlist,
+        selectinload(models.User.subscriptions),
+        selectinload(models.User.interests),
+    ).filter(models.User.id == user_id).first()
+    return UserContext(db, user) if user else None
@@ -0,0 +1,154 @@
+"""
+Background job worker.
+
+    python worker.py                  # WORKER_PROCESSES processes (default 1)
+    python worker.py --processes 4
+    python worker.py --once           # drain due jobs, then exit (cron / debugging)
+
+Each process claims jobs from the `jobs` table (job_queue.py) one at a time,
+extending its lease while a job runs, so API latency and background throughput
+scale independently. Stopping a worker (SIGTERM/SIGINT) lets the current job
+finish; a killed worker's job is picked up again once its lease expires.
+
+With JOB_WORKER_IN_PROCESS (default on), the API also runs WORKER_CONCURRENCY
+worker threads itself, so single-process deploys keep working without this
+entry point. Turn it off when running dedicated workers (the Procfile does).
+Dedicated workers share WORKER_TMDB_RATE_PER_SECOND of the TMDB budget and the
+API paces at the rest: the governor's priority lanes only arbitrate within a
+process.
+"""
+import argparse
+import multiprocessing
+import signal
+import threading
+import time
+import traceback
+from config import settings
+import job_queue
+import job_handlers  # noqa: F401 - registers handlers
+import coverage_model  # noqa: F401 - registers its Session listeners
+
+POLL_INTERVAL = 2.0 # Seconds between polls when idle
+PURGE_EVERY = 3600  # Seconds between housekeeping runs (old finished jobs, expired recommendation cache rows)
+
+
+def _heartbeat(job_id, owner, done: threading.Event):
+    interval = job_queue.LEASE.total_seconds() / 3
+    while not done.wait(interval):
+        try:
+            job_queue.extend(job_id, owner)
+        except Exception as e:
+            print(f"[WORKER] Lease extension failed for job {job_id}: {e}")
+
+
+def run_one(owner: str) -> bool:
+    """Claim and run one due job. Returns False when nothing was due."""
+    claimed = job_queue.claim(owner)
+    if not claimed:
+        return False
+    job_id, kind, payload, attempts, max_attempts = claimed
+    fn = job_queue.HANDLERS.get(kind)
+    if attempts > max_attempts:
+        # Its worker died mid-run too often
+        job_queue.finish(job_id, owner, "lease expired too many times", attempts, max_attempts)
+        return True
+    if not fn:
+        job_queue.finish(job_id, owner, f"no handler for {kind}", max_attempts, max_attempts)
+        return True
+
+    done = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job_id, owner, done), daemon=True).start()
+    started = time.time()
+    error = None
+    try:
+        fn(payload)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+    finally:
+        done.set()
+    job_queue.finish(job_id, owner, error, attempts, max_attempts)
+    status = "done" if error is None else f"failed (attempt {attempts}/{max_attempts}): {error}"
+    print(f"[WORKER] Job {job_id} {kind} {status} in {time.time() - started:.2f}s")
+    return True
+
+
+def _housekeeping():
+    job_queue.purge()
+    import recommendations
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        swept = recommendations.sweep_cache(db)
+        if swept:
+            print(f"[WORKER] Swept {swept} expired recommendation cache rows")
+    finally:
+        db.close()
+
+
+def run_loop(stop: threading.Event, once: bool = False):
+    owner = job_queue.worker_id()
+    last_purge = 0
+    print(f"[WORKER] {owner} started")
+    while not stop.is_set():
+        try:
+            if time.time() - last_purge > PURGE_EVERY:
+                last_purge = time.time()
+                _housekeeping()
+            if run_one(owner):
+                continue
+        except Exception as e:
+            print(f"[WORKER] {owner} error: {e}")
+        if once:
+            break
+        job_queue.wakeup.wait(POLL_INTERVAL)
+        job_queue.wakeup.clear()
+    print(f"[WORKER] {owner} stopped")
+
+
+def start_in_process(threads: int = 1) -> threading.Event:
+    """Run worker threads inside the API process. Returns the event that stops them."""
+    stop = threading.Event()
+    for i in range(threads):
+        threading.Thread(target=run_loop, args=(stop,), name=f"job-worker-{i}", daemon=True).start()
+    return stop
+
+
+def _process_main(once: bool, processes: int = 1):
+    from database import engine
+    import tmdb_async
+    # Forked processes must not reuse the parent's pooled connections
+    engine.dispose(close=False)
+    # Governor lanes don't reach across processes: stay within the workers' share of the TMDB budget
+    tmdb_async.set_rate_share(settings.WORKER_TMDB_RATE_PER_SECOND / processes)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    run_loop(stop, once=once)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background job workers")
+    parser.add_argument("--processes", type=int, default=settings.WORKER_PROCESSES)
+    parser.add_argument("--once", action="store_true", help="Drain due jobs, then exit")
+    args = parser.parse_args()
+
+    # Same schema bootstrap as the API, so a worker can start first
+    import models
+    import migration
+    from database import engine
+    models.Base.metadata.create_all(bind=engine)
+    migration.run_migration()
+
+    if args.processes <= 1:
+        _process_main(args.once)
+        return
+    procs = [multiprocessing.Process(target=_process_main, args=(args.once, args.processes), name=f"worker-{i}") for i in range(args.processes)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
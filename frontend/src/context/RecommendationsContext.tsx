@@ -36,9 +36,10 @@ export function RecommendationsProvider({ children }: { children: ReactNode }) {
     const fetchDashboardData = async () => {
         setLoadingDashboard(true);
         try {
-            // Add timestamp for cache-busting and silent auth to prevent accidental logouts
+            // Silent auth to prevent accidental logouts. Responses carry ETags, so the browser
+            // revalidates (304) instead of re-downloading unchanged recommendations
             // @ts-ignore
-            const response = await api.get(`/recommendations/dashboard?t=${Date.now()}`, { _silentAuth: true });
+            const response = await api.get('/recommendations/dashboard', { _silentAuth: true });
             setDashboardRecs(response.data);
 
             // If dashboard is empty, the background refresh may not have finished yet.
@@ -47,7 +48,7 @@ export function RecommendationsProvider({ children }: { children: ReactNode }) {
                 setTimeout(async () => {
                     try {
                         // @ts-ignore
-                        const retry = await api.get(`/recommendations/dashboard?t=${Date.now()}`, { _silentAuth: true });
+                        const retry = await api.get('/recommendations/dashboard', { _silentAuth: true });
                         if (retry.data.length > 0) {
                             setDashboardRecs(retry.data);
                         }
@@ -64,9 +65,9 @@ export function RecommendationsProvider({ children }: { children: ReactNode }) {
     const fetchSimilarData = async (force: boolean = false) => {
         setLoadingSimilar(true);
         try {
-            // Add timestamp for cache-busting and silent auth
+            // Silent auth; revalidated via ETag like the dashboard
             // @ts-ignore
-            const response = await api.get(`/recommendations/similar?t=${Date.now()}&force_refresh=${force}`, { _silentAuth: true });
+            const response = await api.get(`/recommendations/similar?force_refresh=${force}`, { _silentAuth: true });
             setSimilarRecs(response.data);
         } catch (error) {
             console.error('Failed to fetch similar recommendations', error);